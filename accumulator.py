@@ -0,0 +1,199 @@
+"""Combined color histograms of image sequences, such as video frames or photo sets, for sliding windows of images"""
+import logging
+import numpy as np
+from histogram import ColorHistogram, merge_counts
+from instrumentation import Instrumentation
+from main import AnalyseImage
+
+logger = logging.getLogger(__name__)
+
+# the first position of a color is the sequence number of the first image it was seen in and its index in that image
+_SEQUENCE_SHIFT = 32
+
+
+class HistogramAccumulator:
+    """
+    Accumulates the color histograms of a sequence of images into running totals, which images can be added to and
+    removed from. The combined histogram is ordered as if the histograms of the images held were merged in the order
+    they were added, and the refined colors and suggestions are only calculated when an analysis of it needs them
+    """
+
+    def __init__(self, use_cache=None, cache_directory='./imageinterpreter_cache', cache_size_limit=None,
+                 sample_rate=1, tile_pixels=None, window=None, instrumentation=None):
+        """
+        Constructor for histogram accumulator
+        :param use_cache: tells the program whether to read and write the histogram of each image in the cache,
+        default: None caches images from files and not images in memory
+        :param cache_directory: the folder used to store cached data
+        :param cache_size_limit: the maximum size of the cache in bytes before least recently used files are removed
+        :param sample_rate: the fraction of the pixels of each image counted, see AnalyseImage
+        :param tile_pixels: the number of pixels of each image decoded at a time, see AnalyseImage
+        :param window: the number of most recent images held, older images being removed as images are added,
+        default: None holds every image until it is removed
+        :param instrumentation: an Instrumentation object recording the parsing of each image and the analyses,
+        default: a new Instrumentation object
+        """
+        if window is not None and window < 1:
+            raise ValueError('The window must hold at least 1 image: {}'.format(window))
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+
+        """Private attributes"""
+        self.__image_options = {'use_cache': use_cache, 'cache_directory': cache_directory,
+                                'cache_size_limit': cache_size_limit, 'sample_rate': sample_rate,
+                                'tile_pixels': tile_pixels}
+        self.__window = window
+
+        # key: (sequence number, ColorHistogram) of each image held, in the order they were added
+        self.__images = {}
+        self.__next_sequence = 0
+
+        # running totals sorted by color key, with the first position of each color
+        self.__bands = None
+        self.__keys = None
+        self.__positions = None
+        self.__counts = None
+        self.__histogram = None
+
+    def __len__(self):
+        return len(self.__images)
+
+    def __contains__(self, key):
+        return key in self.__images
+
+    def keys(self):
+        """Returns the keys of the images held, in the order they were added"""
+        return list(self.__images)
+
+    def add(self, source, key=None):
+        """
+        Counts the colors of an image and adds them to the totals, reading the histogram from the cache when the image
+        was counted before
+        :param source: an image file name in the ./source directory or an image in memory, see AnalyseImage
+        :param key: the name the image is removed with, default: the file name, or the sequence number of the image
+        for images in memory
+        :return: the key
+        """
+        if key is None:
+            key = source if isinstance(source, str) else self.__next_sequence
+        name = str(key)
+        with self.instrumentation.measure('add_image', 'stage', image=name):
+            analysis = AnalyseImage(source, instrumentation=self.instrumentation, name=name, **self.__image_options)
+            return self.add_histogram(analysis.get_color_histogram(), key)
+
+    def add_histogram(self, histogram, key=None):
+        """
+        Adds the colors of a histogram to the totals
+        :param histogram: a ColorHistogram, as returned by AnalyseImage.get_color_histogram
+        :param key: the name the histogram is removed with, default: its sequence number
+        :return: the key
+        """
+        if key is None:
+            key = self.__next_sequence
+        if key in self.__images:
+            raise ValueError('An image is already held with the key: {}'.format(key))
+        if self.__bands is not None and histogram.bands != self.__bands:
+            raise ValueError('The histogram has {} bands, the images held have {}'.format(histogram.bands,
+                                                                                       self.__bands))
+
+        sequence = self.__next_sequence
+        self.__next_sequence += 1
+        positions = (sequence << _SEQUENCE_SHIFT) | np.arange(len(histogram), dtype=np.int64)
+        if self.__keys is None:
+            order = np.argsort(histogram.packed, kind='stable')
+            self.__bands = histogram.bands
+            self.__keys, self.__positions, self.__counts = histogram.packed[order], positions[order], \
+                histogram.counts[order]
+        else:
+            self.__keys, self.__positions, self.__counts = merge_counts(
+                self.__keys, self.__positions, self.__counts, histogram.packed, positions, histogram.counts)
+        self.__images[key] = (sequence, histogram)
+        self.__histogram = None
+        logger.info('Added {}: {} colors, {} colors in {} images'.format(key, len(histogram), len(self.__keys),
+                                                                       len(self.__images)))
+
+        if self.__window is not None:
+            while len(self.__images) > self.__window:
+                self.remove(next(iter(self.__images)))
+        return key
+
+    def remove(self, key):
+        """
+        Subtracts the colors of an image from the totals
+        :param key: the key returned when the image was added
+        :return: the ColorHistogram of the image
+        """
+        if key not in self.__images:
+            raise KeyError(key)
+        sequence, histogram = self.__images.pop(key)
+        self.__histogram = None
+
+        # the removed colors are given the last position, so every color keeps its position in the images left
+        last = np.full(len(histogram), np.iinfo(np.int64).max)
+        keys, positions, counts = merge_counts(self.__keys, self.__positions, self.__counts, histogram.packed, last,
+                                               -histogram.counts)
+        kept = counts > 0
+        keys, positions, counts = keys[kept], positions[kept], counts[kept]
+
+        # colors first seen in the removed image move to where they are first seen in the later images
+        moved = np.flatnonzero((positions >> _SEQUENCE_SHIFT) == sequence)
+        for image_sequence, image in self.__images.values():
+            if len(moved) == 0:
+                break
+            if image_sequence < sequence:
+                continue
+            found, indices = _find_colors(image.packed, keys[moved])
+            positions[moved[found]] = (image_sequence << _SEQUENCE_SHIFT) | indices[found]
+            moved = moved[~found]
+
+        self.__keys, self.__positions, self.__counts = keys, positions, counts
+        if not self.__images:
+            self.__bands = self.__keys = self.__positions = self.__counts = None
+        logger.info('Removed {}: {} colors in {} images'.format(key, len(keys), len(self.__images)))
+        return histogram
+
+    def get_histogram(self, key):
+        """
+        Returns the histogram of one image held
+        :param key: the key returned when the image was added
+        :return: a ColorHistogram of the colors of the image
+        """
+        if key not in self.__images:
+            raise KeyError(key)
+        return self.__images[key][1]
+
+    @property
+    def histogram(self):
+        """A ColorHistogram of the total frequency of each color in the images held, ordered by first appearance"""
+        if self.__histogram is None:
+            if self.__keys is None:
+                return ColorHistogram(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64), 3)
+            order = np.argsort(self.__positions)
+            self.__histogram = ColorHistogram(self.__keys[order], self.__counts[order], self.__bands)
+        return self.__histogram
+
+    def analyse(self, key=None, **options):
+        """
+        Creates an analysis of the colors of the images held, whose stages are calculated when its graphics need them
+        :param key: the key of one image to analyse, default: None analyses the colors of every image held
+        :param options: the options of AnalyseImage, such as target_height, quantize or results_directory
+        :return: an AnalyseImage object
+        """
+        histogram = self.histogram if key is None else self.get_histogram(key)
+        options.setdefault('instrumentation', self.instrumentation)
+        options.setdefault('name', 'combined' if key is None else str(key))
+        return AnalyseImage(histogram, **options)
+
+
+def _find_colors(packed, colors):
+    """
+    Finds colors in the packed colors of a histogram
+    :param packed: an array of unique packed colors
+    :param colors: an array of packed colors to find
+    :return: a tuple of a boolean array of whether each color was found and an array of its index in packed
+    """
+    if len(packed) == 0:
+        return np.zeros(len(colors), dtype=bool), np.zeros(len(colors), dtype=np.int64)
+    order = np.argsort(packed, kind='stable')
+    sorted_packed = packed[order]
+    indices = np.minimum(np.searchsorted(sorted_packed, colors), len(packed) - 1)
+    return sorted_packed[indices] == colors, order[indices]
@@ -0,0 +1,167 @@
+# Runs the analysis and basic selection of graphics for many images in a pool of processes
+import os
+import glob
+import logging
+import argparse
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from main import AnalyseImage
+from rendering import OUTPUT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+
+def find_images(path='./source'):
+    """
+    Finds the image files for a batch
+    :param path: a directory, whose files with an image extension supported by Pillow are used, or a glob pattern
+    :return: a sorted list of file paths
+    """
+    if os.path.isdir(path):
+        extensions = Image.registered_extensions()
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if os.path.splitext(name)[1].lower() in extensions)
+    return sorted(glob.glob(path))
+
+
+def process_image(filepath, analysis_options=None, selection_options=None):
+    """
+    Analyses one image and creates its basic selection of graphics in the ./Results/<stem>/ directory
+    :param filepath: the path of the image file
+    :param analysis_options: a dictionary of keyword arguments for AnalyseImage
+    :param selection_options: a dictionary of keyword arguments for create_basic_selection
+    :return: None if the image was processed, otherwise the formatted traceback of the error
+    """
+    try:
+        analysed_image = AnalyseImage(os.path.abspath(filepath), **(analysis_options or {}))
+        analysed_image.create_basic_selection(**(selection_options or {}))
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def run_batch(path='./source', workers=None, max_pending=None, tasks_per_worker=1, analysis_options=None,
+              selection_options=None):
+    """
+    Processes every image for a path in a pool of processes, reporting failures without stopping the batch
+    :param path: a directory or glob pattern of images, see find_images
+    :param workers: the number of worker processes, default: the number of CPUs
+    :param max_pending: the maximum number of images queued at once, default: twice the number of workers
+    :param tasks_per_worker: the number of images a worker process handles before it is replaced, which releases
+    the memory used for large images, None to keep workers for the whole batch
+    :param analysis_options: a dictionary of keyword arguments for AnalyseImage
+    :param selection_options: a dictionary of keyword arguments for create_basic_selection
+    :return: a dictionary of file path: None for processed images or the traceback of the error
+    """
+    filepaths = find_images(path)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    results = {}
+
+    logger.info('Processing {} images with {} workers'.format(len(filepaths), workers))
+    queue = deque(filepaths)
+    # images in flight when a worker process died, which are run again one at a time to find the image it died on
+    retry = deque()
+    # future: (file path, whether it was the only image in flight)
+    pending = {}
+    executor = ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=tasks_per_worker)
+    try:
+        while queue or retry or pending:
+            broken = False
+            try:
+                if retry:
+                    if not pending:
+                        pending[executor.submit(process_image, retry[0], analysis_options, selection_options)] = \
+                            (retry[0], True)
+                        retry.popleft()
+                else:
+                    # only a limited number of images are queued so the batch size does not affect memory
+                    while queue and len(pending) < max_pending:
+                        pending[executor.submit(process_image, queue[0], analysis_options, selection_options)] = \
+                            (queue[0], False)
+                        queue.popleft()
+            except BrokenProcessPool:
+                broken = True
+
+            done, _ = wait(pending, return_when=ALL_COMPLETED if broken else FIRST_COMPLETED)
+            broken = _collect_results(done, pending, results, retry) or broken
+            if broken:
+                # every image still in flight fails with the pool, so they are collected before it is replaced
+                _collect_results(wait(pending)[0], pending, results, retry)
+                executor.shutdown(wait=True)
+                executor = ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=tasks_per_worker)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    failures = [filepath for filepath, error in results.items() if error is not None]
+    logger.info('Batch complete: {} processed, {} failed'.format(len(results) - len(failures), len(failures)))
+    for filepath in failures:
+        logger.info('Failed: {}'.format(filepath))
+
+    return results
+
+
+def _collect_results(done, pending, results, retry):
+    """
+    Records the results of finished images, queueing the images in flight when a worker process died to be retried
+    :param done: the finished futures
+    :param pending: a dictionary of future: (file path, whether it was the only image in flight), which the finished
+    futures are removed from
+    :param results: a dictionary of file path: None or the traceback of the error, which the results are added to
+    :param retry: a deque of file paths to run again, one at a time
+    :return: whether a worker process died
+    """
+    broken = False
+    for future in done:
+        filepath, alone = pending.pop(future)
+        try:
+            results[filepath] = future.result()
+        except BrokenProcessPool:
+            # the worker process itself failed, for example by running out of memory, and took the pool with it
+            broken = True
+            if not alone:
+                logger.warning('A worker process failed, retrying: {}'.format(filepath))
+                retry.append(filepath)
+                continue
+            results[filepath] = traceback.format_exc()
+        except Exception:
+            results[filepath] = traceback.format_exc()
+
+        if results[filepath] is None:
+            logger.info('Finished: {}'.format(filepath))
+        else:
+            logger.error('Failed: {}\n{}'.format(filepath, results[filepath]))
+    return broken
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Create the basic selection of graphics for a batch of images')
+    parser.add_argument('path', nargs='?', default='./source', help='a directory or glob pattern of images')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes')
+    parser.add_argument('--max-pending', type=int, default=None, help='the maximum number of images queued at once')
+    parser.add_argument('--tasks-per-worker', type=int, default=1,
+                        help='the number of images a worker handles before it is replaced, 0 to never replace')
+    parser.add_argument('--no-cache', action='store_true', help='calculate all data without the cache')
+    parser.add_argument('--tile-pixels', type=int, default=None,
+                        help='the number of pixels decoded at a time, bounding the memory used for very large images')
+    parser.add_argument('--format', default='png', choices=OUTPUT_FORMATS,
+                        help='the format graphics are saved in, frequency bars too tall for WebP are saved as PNG')
+    parser.add_argument('--compress-level', type=int, default=6,
+                        help='0-9, lower saves graphics quicker and larger')
+    parser.add_argument('--palette', action='store_true',
+                        help='save graphics with at most 256 colors as palette images')
+    arguments = parser.parse_args()
+
+    batch_results = run_batch(arguments.path, workers=arguments.workers, max_pending=arguments.max_pending,
+                              tasks_per_worker=arguments.tasks_per_worker or None,
+                              analysis_options={'use_cache': not arguments.no_cache,
+                                                'tile_pixels': arguments.tile_pixels},
+                              selection_options={'output_format': arguments.format,
+                                                 'compress_level': arguments.compress_level,
+                                                 'palette': arguments.palette})
+    if any(error is not None for error in batch_results.values()):
+        raise SystemExit(1)
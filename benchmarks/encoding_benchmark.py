@@ -0,0 +1,121 @@
+"""
+Benchmarks the encode time and file size of each output format, compression level and palette option on frequency
+bars and grid graphics, writing the results as JSON so the trade-off can be chosen for each job
+Run from the project root with: python -m benchmarks.encoding_benchmark [--levels 1 6] [--output file]
+"""
+import io
+import sys
+import math
+import json
+import time
+import argparse
+import statistics
+from PIL import Image
+from histogram import parse_pixels
+from refinement import refine_color_data, get_bar_heights
+from ordering import get_hls_ranks
+from rendering import render_frequency_bars, render_grid, encode_image, OUTPUT_FORMATS, \
+    WEBP_MAX_SIZE
+from benchmarks.pipeline_benchmark import create_image, get_environment, IMAGE_KINDS
+
+
+def create_graphics(image, target_height=60000, bar_width=2000, grid=50, swatch_width=80, grid_spacing=10):
+    """
+    Renders the graphics of an image as the analysis does
+    :param image: a PIL Image object
+    :return: a dictionary of graphic name: RGB Image object and a dictionary of graphic name: the graphic rendered as
+    a palette image, for graphics the analysis renders again when saving palette images
+    """
+    specific_value = math.ceil((image.width * image.height) / target_height)
+    reduced_colors, multiplier = refine_color_data(parse_pixels(image), specific_value, target_height)
+    ordered_colors = reduced_colors.order_by_ranks(get_hls_ranks(reduced_colors))
+
+    heights = get_bar_heights(ordered_colors.counts, specific_value * multiplier)
+    bar_colors = ordered_colors.channels()[:, :3]
+    bars = render_frequency_bars(bar_colors, heights, bar_width, target_height)
+    palette_bars = render_frequency_bars(bar_colors, heights, bar_width, target_height, palette=True)
+
+    grid = min(grid, math.floor(math.sqrt(len(ordered_colors))))
+    length = grid * swatch_width + (grid + 1) * grid_spacing
+    colors = ordered_colors[:grid * grid].colors()
+    grid_graphic = render_grid(colors, grid, swatch_width, grid_spacing, length,
+                               text_color=lambda color: (0, 0, 0) if sum(color) > 384 else (255, 255, 255))
+    return {'frequency_bars': bars, 'grid': grid_graphic}, {'frequency_bars': palette_bars}
+
+
+def is_lossless(image, data):
+    """Returns whether encoded data decodes to exactly the pixels of an RGB image"""
+    # the graphics are larger than Pillow's decompression bomb limit
+    max_image_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        with Image.open(io.BytesIO(data)) as decoded:
+            return decoded.convert('RGB').tobytes() == image.tobytes()
+    finally:
+        Image.MAX_IMAGE_PIXELS = max_image_pixels
+
+
+def benchmark_graphic(image, output_format, compress_level, palette, repeat, encoded_image=None):
+    """
+    Encodes a graphic several times with one set of options
+    :param encoded_image: the image encoded in place of the graphic, such as the graphic rendered as a palette image
+    :return: a dictionary of the encode times, the encoded size and whether the pixels were kept exactly
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = encode_image(encoded_image or image, output_format, compress_level, palette)
+        seconds.append(time.perf_counter() - start)
+    return {'best': min(seconds), 'median': statistics.median(seconds), 'runs': seconds, 'bytes': len(data),
+            'lossless': is_lossless(image, data)}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark encoding graphics in each output format')
+    parser.add_argument('--kinds', nargs='+', default=['gradient', 'noise', 'greyscale'], choices=IMAGE_KINDS)
+    parser.add_argument('--size', default='1000x1000', help='the synthetic image size as WIDTHxHEIGHT')
+    parser.add_argument('--colors', type=int, default=4096, help='the palette size of noise and greyscale images')
+    parser.add_argument('--formats', nargs='+', default=list(OUTPUT_FORMATS), choices=OUTPUT_FORMATS)
+    parser.add_argument('--levels', nargs='+', type=int, default=[1, 6, 9], help='compression levels 0-9')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of times each graphic is encoded')
+    parser.add_argument('--target-height', type=int, default=60000, help='the frequency bars height')
+    parser.add_argument('--seed', type=int, default=0, help='the seed for the synthetic images')
+    parser.add_argument('--output', default='encoding_benchmark.json', help='the JSON file written, - for stdout')
+    arguments = parser.parse_args(arguments)
+
+    width, height = (int(value) for value in arguments.size.lower().split('x'))
+    results = []
+    for kind in arguments.kinds:
+        image = create_image(kind, width, height, colors=arguments.colors, seed=arguments.seed)
+        graphics, palette_graphics = create_graphics(image, target_height=arguments.target_height)
+        for graphic_name, graphic in graphics.items():
+            colors = len(graphic.getcolors(1 << 24))
+            palette_possible = colors <= 256
+
+            for output_format in arguments.formats:
+                if OUTPUT_FORMATS[output_format][0] == 'WEBP' and max(graphic.size) > WEBP_MAX_SIZE:
+                    print('{:<10} {:<15} {:<14} skipped, larger than {} pixels'.format(
+                        kind, graphic_name, output_format, WEBP_MAX_SIZE), file=sys.stderr)
+                    continue
+                for compress_level in arguments.levels:
+                    palette_options = (False, True) if palette_possible and output_format == 'png' else (False,)
+                    for palette in palette_options:
+                        result = benchmark_graphic(graphic, output_format, compress_level, palette, arguments.repeat,
+                                                   palette_graphics.get(graphic_name) if palette else None)
+                        results.append({'image': kind, 'graphic': graphic_name, 'width': graphic.width,
+                                        'height': graphic.height, 'colors': colors, 'format': output_format,
+                                        'compress_level': compress_level, 'palette': palette, **result})
+                        print('{:<10} {:<15} {:<14} level {} palette {:<5} best {:.4f}s {:>10} bytes{}'.format(
+                            kind, graphic_name, output_format, compress_level, palette, result['best'],
+                            result['bytes'], '' if result['lossless'] else ' (lossy)'), file=sys.stderr)
+
+    report = json.dumps({'environment': get_environment(), 'parameters': vars(arguments), 'results': results},
+                        indent=2)
+    if arguments.output == '-':
+        print(report)
+    else:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(report)
+
+
+if __name__ == '__main__':
+    main()
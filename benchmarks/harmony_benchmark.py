@@ -0,0 +1,77 @@
+"""
+Benchmarks the batch harmony engine in suggestions.get_suggestion_weightings against calling colorharmonies per
+colour
+Requires colorharmonies to be installed for the reference implementation
+Run from the project root with: python -m benchmarks.harmony_benchmark [unique colors]
+"""
+import sys
+import time
+import numpy as np
+from colorharmonies import (Color, complementaryColor, triadicColor, splitComplementaryColor, tetradicColor,
+                            analogousColor, monochromaticColor)
+from suggestions import get_suggestion_weightings, select_top_suggestions
+from benchmarks.weighting_benchmark import get_ideas_dictionary, add_colour_to_dictionary, sort_dictionary_by_desc_value
+
+
+def generate_suggestions(data):
+    """The harmony engine in the form of the original generate_suggestions, taking and returning ordered dictionaries
+    of colour: weighting"""
+    suggestion_colours, weightings = get_suggestion_weightings(np.array([key[:3] for key in data], dtype=np.int64),
+                                                               list(data.values()))
+    order = select_top_suggestions(weightings, len(weightings))
+    return dict(zip(map(tuple, suggestion_colours[order].tolist()), weightings[order].tolist()))
+
+
+def generate_suggestions_loop(data):
+    """The original generate_suggestions implementation, kept as the reference for parity and timing"""
+    suggestion_results = dict()
+    for key in data:
+        current_colour = Color(key, "", "")
+
+        add_colour_to_dictionary(suggestion_results, tuple(complementaryColor(current_colour)), data[key])
+        for new_colour in triadicColor(current_colour):
+            add_colour_to_dictionary(suggestion_results, tuple(new_colour), data[key])
+        for new_colour in splitComplementaryColor(current_colour):
+            add_colour_to_dictionary(suggestion_results, tuple(new_colour), data[key])
+        for new_colour in tetradicColor(current_colour):
+            add_colour_to_dictionary(suggestion_results, tuple(new_colour), data[key])
+        for new_colour in analogousColor(current_colour):
+            add_colour_to_dictionary(suggestion_results, tuple(new_colour), data[key])
+        for new_colour in monochromaticColor(current_colour):
+            add_colour_to_dictionary(suggestion_results, tuple(new_colour), data[key])
+
+    return sort_dictionary_by_desc_value(suggestion_results)
+
+
+def create_color_data(unique_colors, seed=0):
+    """Creates a dictionary of random colors, including greys and extremes, with random frequencies"""
+    rng = np.random.default_rng(seed)
+    colors = [(0, 0, 0), (255, 255, 255), (128, 128, 128), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+    colors += [tuple(color) for color in rng.integers(0, 256, size=(unique_colors, 3)).tolist()]
+    colors += [(value, value, value) for value in rng.integers(0, 256, size=unique_colors // 20).tolist()]
+    return {color: value for color, value in zip(colors, rng.integers(1, 300, size=len(colors)).tolist())}
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(unique_colors=20000):
+    ideas = get_ideas_dictionary(create_color_data(unique_colors))
+
+    loop_suggestions, loop_time = time_function(generate_suggestions_loop, ideas)
+    engine_suggestions, engine_time = time_function(generate_suggestions, ideas)
+
+    if list(loop_suggestions.items()) != list(engine_suggestions.items()):
+        raise AssertionError('Batch harmony engine does not match colorharmonies')
+
+    print('{} ideas | {} suggestions'.format(len(ideas), len(engine_suggestions)))
+    print('colorharmonies loop: {:.3f}s'.format(loop_time))
+    print('batch harmony engine: {:.3f}s ({:.1f}x faster)'.format(engine_time, loop_time / engine_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,54 @@
+"""
+Benchmarks the vectorized histogram engine against the original per pixel loop
+Run from the project root with: python -m benchmarks.histogram_benchmark [width] [height]
+"""
+import sys
+import time
+import numpy as np
+from PIL import Image
+from histogram import parse_pixels
+
+
+def parse_pixels_loop(image):
+    """The original AnalyseImage.__parse_pixels implementation, kept as the reference for parity and timing"""
+    colors = {}
+    for x in range(image.width):
+        for y in range(image.height):
+            if image.getpixel((x, y)) in colors:
+                colors[image.getpixel((x, y))] += 1
+            else:
+                colors[image.getpixel((x, y))] = 1
+    return colors
+
+
+def create_noise_image(width, height, levels=64, seed=0):
+    """Creates an RGB image of random colors with each channel limited to the given number of levels"""
+    rng = np.random.default_rng(seed)
+    pixels = (rng.integers(0, levels, size=(height, width, 3)) * (256 // levels)).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(width=1000, height=1000):
+    image = create_noise_image(width, height)
+    image.load()
+
+    loop_colors, loop_time = time_function(parse_pixels_loop, image)
+    engine_colors, engine_time = time_function(parse_pixels, image)
+
+    if list(loop_colors.items()) != list(engine_colors.items()):
+        raise AssertionError('Histogram engine does not match the pixel loop')
+
+    print('{}x{} pixels | {} unique colors'.format(width, height, len(engine_colors)))
+    print('pixel loop: {:.3f}s'.format(loop_time))
+    print('histogram engine: {:.3f}s ({:.1f}x faster)'.format(engine_time, loop_time / engine_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
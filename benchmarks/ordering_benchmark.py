@@ -0,0 +1,48 @@
+"""
+Benchmarks ordering colors chromatically with shared ranks against sorting them with colorsys for each graphic
+Run from the project root with: python -m benchmarks.ordering_benchmark [unique colors] [ordered graphics]
+"""
+import sys
+import time
+import colorsys
+import numpy as np
+from ordering import get_hls_ranks, order_by_ranks
+
+
+def sort_colors_by_hsl(color_key_list):
+    """The original ordering, sorting 0-1 floats by colorsys.rgb_to_hls and converting them back to 0-255"""
+    color_float_list = [[elem[x] / 255.0 for x in range(3)] for elem in color_key_list]
+    color_float_list.sort(key=lambda rgb: colorsys.rgb_to_hls(*rgb))
+    return [tuple(int(colour_value * 255) for colour_value in elem) for elem in color_float_list]
+
+
+def order_colors_by_ranks(colors, graphics):
+    """Ranks the colors once and orders them for each graphic"""
+    ranks = get_hls_ranks(colors)
+    indices = list(range(len(colors)))
+    return [[colors[index] for index in order_by_ranks(indices, ranks)] for _ in range(graphics)]
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(unique_colors=100000, graphics=4):
+    colors = [tuple(color) for color in np.random.default_rng(0).integers(0, 256, (unique_colors, 3)).tolist()]
+
+    sorted_result, sorted_time = time_function(lambda: [sort_colors_by_hsl(colors) for _ in range(graphics)])
+    ranked_result, ranked_time = time_function(order_colors_by_ranks, colors, graphics)
+
+    if sorted_result != ranked_result:
+        raise AssertionError('Ordering by ranks does not match sorting with colorsys')
+
+    print('{} colors | {} ordered graphics'.format(len(colors), graphics))
+    print('colorsys sorts: {:.3f}s'.format(sorted_time))
+    print('shared ranks: {:.3f}s ({:.1f}x faster)'.format(ranked_time, sorted_time / ranked_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,166 @@
+"""
+Benchmarks every stage of the analysis pipeline on synthetic images of controlled size and color cardinality, writing
+the timings as JSON so runs can be compared offline
+Run from the project root with: python -m benchmarks.pipeline_benchmark [--sizes 500x500 2000x1500] [--output file]
+"""
+import sys
+import math
+import json
+import time
+import platform
+import argparse
+import statistics
+import numpy as np
+import PIL
+from PIL import Image
+from histogram import parse_pixels, parse_pixels_in_tiles
+from refinement import refine_color_data, get_bar_heights
+from suggestions import get_ideas, get_suggestion_weightings, select_top_suggestions
+from ordering import get_hls_ranks
+from rendering import render_frequency_bars, render_grid, get_label_tile
+
+IMAGE_KINDS = ('flat', 'gradient', 'noise', 'greyscale')
+
+
+def create_image(kind, width, height, colors=4096, seed=0):
+    """
+    Creates a synthetic RGB image
+    :param kind: 'flat' for one color, 'gradient' for red and green ramps across and down the image, 'noise' for pixels
+    chosen at random from a palette of random colors or 'greyscale' for noise from a palette of grey levels
+    :param width: the width of the image
+    :param height: the height of the image
+    :param colors: the size of the palette for noise and greyscale images
+    :param seed: the seed for the random palettes and pixels
+    :return: a PIL Image object
+    """
+    rng = np.random.default_rng(seed)
+    if kind == 'flat':
+        pixels = np.full((height, width, 3), (96, 128, 160), dtype=np.uint8)
+    elif kind == 'gradient':
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        pixels[:, :, 0] = (np.arange(width) * 256 // width)[None, :]
+        pixels[:, :, 1] = (np.arange(height) * 256 // height)[:, None]
+        pixels[:, :, 2] = 128
+    elif kind == 'noise':
+        palette = rng.integers(0, 256, size=(colors, 3), dtype=np.uint8)
+        pixels = palette[rng.integers(0, colors, size=(height, width))]
+    elif kind == 'greyscale':
+        levels = rng.choice(256, size=min(colors, 256), replace=False).astype(np.uint8)
+        pixels = np.repeat(levels[rng.integers(0, len(levels), size=(height, width))][:, :, None], 3, axis=2)
+    else:
+        raise ValueError('Unknown image kind: {}, use one of {}'.format(kind, IMAGE_KINDS))
+    return Image.fromarray(pixels, 'RGB')
+
+
+def run_pipeline(image, timings, target_height=60000, bar_width=2000, grid=50, swatch_width=80, grid_spacing=10,
+                 tile_pixels=1 << 20):
+    """
+    Runs each stage of the pipeline once, adding the seconds each took to timings
+    :param image: a PIL Image object
+    :param timings: a dictionary of stage name: list of seconds
+    :return: a dictionary of the number of unique, reduced and suggested colors
+    """
+    def timed(name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    specific_value = math.ceil((image.width * image.height) / target_height)
+    max_grid_size = min(math.floor(60000 / (swatch_width + grid_spacing)), grid)
+
+    colors = timed('parse_pixels', parse_pixels, image)
+    timed('parse_pixels_in_tiles', parse_pixels_in_tiles, image, tile_pixels)
+    reduced_colors, multiplier = timed('refine_color_data', refine_color_data, colors, specific_value, target_height)
+
+    extended_grid_size = min(math.floor(math.sqrt(len(colors))), math.floor(60000 / (200 + grid_spacing)))
+    ideas = timed('suggestions_get_ideas', get_ideas, colors)
+    suggestion_colours, weightings = timed('suggestions_get_weightings', get_suggestion_weightings, *ideas)
+    timed('suggestions_select_top', select_top_suggestions, weightings, extended_grid_size ** 2)
+
+    ranks = timed('hls_ranks', get_hls_ranks, reduced_colors)
+    ordered_colors = timed('hls_order', reduced_colors.order_by_ranks, ranks)
+
+    heights = get_bar_heights(ordered_colors.counts, specific_value * multiplier)
+    timed('render_frequency_bars', render_frequency_bars, ordered_colors.channels()[:, :3], heights, bar_width,
+          target_height)
+
+    grid_size = min(max_grid_size, math.floor(math.sqrt(len(reduced_colors))))
+    grid_colors = ordered_colors[:grid_size * grid_size].colors()
+    length = grid_size * swatch_width + (grid_size + 1) * grid_spacing
+    timed('render_grid', render_grid, grid_colors, grid_size, swatch_width, grid_spacing, length)
+    # label tiles are cached between grids, so each run renders them from the start
+    get_label_tile.cache_clear()
+    timed('render_grid_text', render_grid, grid_colors, grid_size, swatch_width, grid_spacing, length,
+          text_color=lambda color: (0, 0, 0) if sum(color) > 384 else (255, 255, 255))
+
+    return {'unique_colors': len(colors), 'reduced_colors': len(reduced_colors),
+            'suggestion_candidates': len(suggestion_colours), 'grid': grid_size}
+
+
+def compare_results(results, baseline_path):
+    """
+    Prints how the best time of each stage changed from an earlier run, for the images and stages in both runs
+    :param results: the results of this run
+    :param baseline_path: the JSON file written by an earlier run
+    """
+    with open(baseline_path) as infile:
+        baseline = {(result['image'], result['width'], result['height'], result['stage']): result['best']
+                    for result in json.load(infile)['results']}
+
+    for result in results:
+        key = (result['image'], result['width'], result['height'], result['stage'])
+        if key in baseline and result['best'] > 0:
+            print('{:<10} {:>11} {:<28} {:.4f}s -> {:.4f}s ({:.2f}x)'.format(
+                result['image'], '{}x{}'.format(result['width'], result['height']), result['stage'], baseline[key],
+                result['best'], baseline[key] / result['best']), file=sys.stderr)
+
+
+def get_environment():
+    """Describes the machine and library versions a run was made with"""
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pillow': PIL.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'machine': platform.machine()}
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on synthetic images')
+    parser.add_argument('--kinds', nargs='+', default=list(IMAGE_KINDS), choices=IMAGE_KINDS)
+    parser.add_argument('--sizes', nargs='+', default=['500x500', '2000x1500'], help='image sizes as WIDTHxHEIGHT')
+    parser.add_argument('--colors', type=int, default=4096, help='the palette size of noise and greyscale images')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of times each stage is run')
+    parser.add_argument('--target-height', type=int, default=60000, help='the frequency bars height')
+    parser.add_argument('--seed', type=int, default=0, help='the seed for the synthetic images')
+    parser.add_argument('--output', default='pipeline_benchmark.json', help='the JSON file written, - for stdout')
+    parser.add_argument('--baseline', default=None, help='a JSON file of an earlier run to compare each stage with')
+    arguments = parser.parse_args(arguments)
+
+    results = []
+    for kind in arguments.kinds:
+        for size in arguments.sizes:
+            width, height = (int(value) for value in size.lower().split('x'))
+            image = create_image(kind, width, height, colors=arguments.colors, seed=arguments.seed)
+
+            timings = {}
+            for _ in range(arguments.repeat):
+                counts = run_pipeline(image, timings, target_height=arguments.target_height)
+
+            for stage, seconds in timings.items():
+                results.append({'image': kind, 'width': width, 'height': height, **counts, 'stage': stage,
+                                'best': min(seconds), 'median': statistics.median(seconds), 'runs': seconds})
+                print('{:<10} {:>11} {:<28} best {:.4f}s median {:.4f}s'.format(
+                    kind, size, stage, min(seconds), statistics.median(seconds)), file=sys.stderr)
+
+    if arguments.baseline:
+        compare_results(results, arguments.baseline)
+
+    report = json.dumps({'environment': get_environment(), 'parameters': vars(arguments), 'results': results},
+                        indent=2)
+    if arguments.output == '-':
+        print(report)
+    else:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmarks the sorted frequency refinement engine against the original multiplier loop, and the refinement index
+answering several target heights against refining the color data again for each height
+Run from the project root with: python -m benchmarks.refinement_benchmark [unique colors] [target height]
+"""
+import sys
+import math
+import time
+import numpy as np
+from refinement import refine_color_data, RefinementIndex
+
+
+def refine_color_data_loop(colors, specific_value, target_height):
+    """The original AnalyseImage.__refine_color_data implementation, kept as the reference for parity and timing"""
+    multiplier = 1.002
+    graphic_height = 0
+    reduced_colours = {}
+
+    while graphic_height < target_height:
+        reduced_colours = {}
+        graphic_height = 0
+        multiplier -= 0.002
+        for key, value in list(colors.items()):
+            if colors[key] >= math.floor(specific_value * multiplier):
+                reduced_colours[key] = value
+                frequency = math.floor(value / (specific_value * multiplier))
+                if frequency == 0:
+                    frequency = 1
+                graphic_height += frequency
+
+    return reduced_colours, multiplier
+
+
+def create_color_data(unique_colors, seed=0):
+    """Creates a dictionary of random colors with a long tailed frequency distribution like a photograph"""
+    rng = np.random.default_rng(seed)
+    keys = rng.choice(2 ** 24, size=unique_colors, replace=False)
+    values = np.ceil(rng.pareto(1.2, size=unique_colors) * 4).astype(np.int64) + 1
+    return {(key >> 16, (key >> 8) & 0xFF, key & 0xFF): value for key, value in zip(keys.tolist(), values.tolist())}
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(unique_colors=100000, target_height=60000, heights=(600, 3000, 20000)):
+    colors = create_color_data(unique_colors)
+    specific_value = math.ceil(sum(colors.values()) / target_height)
+
+    loop_result, loop_time = time_function(refine_color_data_loop, colors, specific_value, target_height)
+    engine_result, engine_time = time_function(refine_color_data, colors, specific_value, target_height)
+
+    if loop_result[1] != engine_result[1] or list(loop_result[0].items()) != list(engine_result[0].items()):
+        raise AssertionError('Refinement engine does not match the multiplier loop')
+
+    print('{} unique colors | {} reduced colors | multiplier {}'.format(len(colors), len(engine_result[0]),
+                                                                       engine_result[1]))
+    print('multiplier loop: {:.3f}s'.format(loop_time))
+    print('refinement engine: {:.3f}s ({:.1f}x faster)'.format(engine_time, loop_time / engine_time))
+
+    index, index_time = time_function(RefinementIndex, colors)
+    print('refinement index: {:.3f}s to build'.format(index_time))
+    for height in heights:
+        specific_value = math.ceil(sum(colors.values()) / height)
+        engine_result, engine_time = time_function(refine_color_data, colors, specific_value, height)
+        index_result, query_time = time_function(index.refine, specific_value, height)
+        if index_result[1] != engine_result[1] or list(index_result[0].items()) != list(engine_result[0].items()):
+            raise AssertionError('Refinement index does not match the refinement engine at height {}'.format(height))
+        print('height {}: {} reduced colors | refinement engine {:.4f}s | index {:.4f}s ({:.1f}x faster)'.format(
+            height, len(index_result[0]), engine_time, query_time, engine_time / query_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,48 @@
+"""
+Benchmarks selecting the top suggestions by partition against sorting every suggestion into dictionaries
+Run from the project root with: python -m benchmarks.selection_benchmark [unique colors] [number requested]
+"""
+import sys
+import time
+from suggestions import suggestions_algorithm, convert_tuple_to_rgb_hex
+from benchmarks.weighting_benchmark import get_ideas_dictionary, sort_dictionary_by_desc_value
+from benchmarks.harmony_benchmark import generate_suggestions, create_color_data
+
+
+def present_suggestions(data, number_requested):
+    """The original presentation of suggestions, taking the first number_requested colours of an ordered dictionary
+    of colour: weighting and adding their html hex colours"""
+    colour_list = [item[0] for item in list(data.items())[:number_requested]]
+    return [elem + (convert_tuple_to_rgb_hex(elem),) for elem in colour_list]
+
+
+def suggestions_algorithm_sorted(colour_dict=None, number_requested=1000):
+    """The original suggestions handler, fully sorting the ideas and suggestions dictionaries before slicing"""
+    weighted_ideas = sort_dictionary_by_desc_value(get_ideas_dictionary(colour_dict))
+    generated_suggestions = sort_dictionary_by_desc_value(generate_suggestions(weighted_ideas))
+    return present_suggestions(generated_suggestions, number_requested)
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(unique_colors=50000, number_requested=2500):
+    colors = create_color_data(unique_colors)
+
+    sorted_result, sorted_time = time_function(suggestions_algorithm_sorted, colors, number_requested)
+    selected_result, selected_time = time_function(suggestions_algorithm, colors, number_requested)
+
+    if sorted_result != selected_result:
+        raise AssertionError('Top suggestion selection does not match sorting every suggestion')
+
+    print('{} unique colors | {} suggestions requested'.format(len(colors), number_requested))
+    print('full sorts: {:.3f}s'.format(sorted_time))
+    print('top selection: {:.3f}s ({:.1f}x faster)'.format(selected_time, sorted_time / selected_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
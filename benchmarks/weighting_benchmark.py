@@ -0,0 +1,75 @@
+"""
+Benchmarks the frequency weighting table in suggestions.get_ideas against adding each colour once per pixel
+Run from the project root with: python -m benchmarks.weighting_benchmark [unique colors]
+"""
+import sys
+import time
+import numpy as np
+from suggestions import get_ideas, update_weighting
+
+
+def add_colour_to_dictionary(dictionary, colour, initial_value=0.2):
+    """The original way a colour was added to a dictionary, or its weighting updated, once per pixel"""
+    if colour in dictionary:
+        dictionary[colour] = update_weighting(dictionary[colour])
+    else:
+        dictionary[colour] = initial_value
+    return dictionary
+
+
+def sort_dictionary_by_desc_value(dictionary):
+    """Sorts a dictionary in descending order of value, as the original suggestions did between stages"""
+    return {k: v for k, v in sorted(dictionary.items(), key=lambda item: item[1], reverse=True)}
+
+
+def get_ideas_dictionary(colour_dict):
+    """Returns the ideas from get_ideas as an ordered dictionary of colour tuple: weighting, as the original did"""
+    colours, weightings = get_ideas(colour_dict)
+    return dict(zip(map(tuple, colours.tolist()), weightings.tolist()))
+
+
+def get_ideas_loop(colour_dict):
+    """The original get_ideas implementation, kept as the reference for parity and timing"""
+    data = dict()
+
+    if len(colour_dict) == 0:
+        add_colour_to_dictionary(data, '#ffffff')
+    else:
+        for key, value in colour_dict:
+            for count in range(value):
+                add_colour_to_dictionary(data, key)
+
+    return sort_dictionary_by_desc_value(data)
+
+
+def create_color_data(unique_colors, seed=0):
+    """Creates a dictionary of colors with frequencies covering both the rising and converged weightings"""
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([np.arange(1, 400), rng.integers(1, 2000, size=max(unique_colors - 399, 0))])
+    return {(index >> 16, (index >> 8) & 0xFF, index & 0xFF): value
+            for index, value in enumerate(values[:unique_colors].tolist())}
+
+
+def time_function(function, *args):
+    """Returns the result of a function and the number of seconds it took"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(unique_colors=5000):
+    colors = create_color_data(unique_colors)
+
+    loop_ideas, loop_time = time_function(get_ideas_loop, colors.items())
+    engine_ideas, engine_time = time_function(get_ideas_dictionary, colors)
+
+    if list(loop_ideas.items()) != list(engine_ideas.items()):
+        raise AssertionError('Weighting table does not match adding each colour once per pixel')
+
+    print('{} unique colors | {} pixels'.format(len(colors), sum(colors.values())))
+    print('per pixel loop: {:.3f}s'.format(loop_time))
+    print('weighting table: {:.3f}s ({:.1f}x faster)'.format(engine_time, loop_time / engine_time))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
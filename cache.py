@@ -0,0 +1,255 @@
+import os
+import bz2
+import pickle
+import hashlib
+import tempfile
+import numpy as np
+from histogram import to_records, from_records, as_color_histogram
+
+# the number of writes after which the size of the cache is measured again, taking in entries written by other
+# processes, rather than added to from the entries written by this store
+RESCAN_WRITES = 64
+
+
+def _get_file_mode():
+    """Returns the mode new files are created with under the process umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# cache entries are readable as any other file the process creates, rather than only by their owner as temporary
+# files are, so a cache can be shared
+FILE_MODE = _get_file_mode()
+
+
+class CacheStore:
+    """Content addressed store for the data calculated by each stage of an analysis"""
+
+    def __init__(self, directory='./imageinterpreter_cache', size_limit=None):
+        """
+        Constructor for cache store
+        :param directory: the folder the cache files are kept in, with a sub-folder for each stage
+        :param size_limit: the maximum number of bytes kept in the cache before the least recently used files are
+        removed, None for no limit
+        """
+        self.directory = directory
+        self.size_limit = size_limit
+
+        # the total size of the cache files, measured when first needed and then added to by each write
+        self.__size = None
+        self.__writes = 0
+
+    def get_key(self, content_hash, type_string, version, **parameters):
+        """
+        Creates the key for a stage from everything that affects its result
+        :param content_hash: the hash of the source image file contents
+        :param type_string: the name of the stage
+        :param version: the algorithm version of the stage, increased whenever its results change
+        :param parameters: the values passed to the stage which change its result
+        :return: a hex string key
+        """
+        key = hashlib.sha256()
+        key.update('{}:{}:{}'.format(content_hash, type_string, version).encode())
+        for name, value in sorted(parameters.items()):
+            key.update(':{}={!r}'.format(name, value).encode())
+        return key.hexdigest()
+
+    def load(self, type_string, key):
+        """
+        Reads a cache entry, marking it as recently used
+        :param type_string: the name of the stage
+        :param key: the key created by get_key
+        :return: a tuple of whether the entry was found and its data
+        """
+        path = self.__get_path(type_string, key)
+        try:
+            with bz2.BZ2File(path, 'r') as infile:
+                data = pickle.load(infile)
+            os.utime(path)
+        except FileNotFoundError:
+            # missing or removed by another process while reading
+            return False, None
+        except (EOFError, OSError, pickle.UnpicklingError):
+            # a damaged entry is recalculated and replaced
+            return False, None
+        return True, data
+
+    def save(self, type_string, key, data):
+        """
+        Writes a cache entry atomically so that other processes never read a partial file
+        :param type_string: the name of the stage
+        :param key: the key created by get_key
+        :param data: the data to be pickled
+        """
+        def write(temp_file):
+            with bz2.BZ2File(temp_file, 'w') as outfile:
+                pickle.dump(data, outfile)
+
+        self.__write_atomically(self.__get_path(type_string, key), write)
+
+    def load_histogram(self, type_string, key):
+        """
+        Reads a color histogram entry from its memory mapped binary file, migrating a pickled entry if one is found
+        :param type_string: the name of the stage
+        :param key: the key created by get_key
+        :return: a tuple of whether the entry was found and the ColorHistogram, backed by the memory mapped file
+        """
+        path = self.__get_path(type_string, key, binary=True)
+        try:
+            records = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except FileNotFoundError:
+            found, data = self.load(type_string, key)
+            if not found:
+                return False, None
+            # entries pickled as dictionaries by earlier versions are converted
+            try:
+                data = as_color_histogram(data)
+            except (TypeError, ValueError):
+                return False, None
+            if to_records(data) is not None:
+                self.save_histogram(type_string, key, data)
+                try:
+                    os.remove(self.__get_path(type_string, key))
+                except FileNotFoundError:
+                    pass
+            return True, data
+        except (ValueError, OSError):
+            return False, None
+        return True, from_records(records)
+
+    def save_histogram(self, type_string, key, colors):
+        """
+        Writes a color histogram entry as packed uint32 colors and counts, which can be memory mapped when read
+        :param type_string: the name of the stage
+        :param key: the key created by get_key
+        :param colors: a ColorHistogram, pickled instead if its colors cannot be packed into uint32 keys
+        """
+        records = to_records(colors)
+        if records is None:
+            self.save(type_string, key, colors)
+            return
+
+        self.__write_atomically(self.__get_path(type_string, key, binary=True),
+                                lambda temp_file: np.save(temp_file, records))
+
+    def evict(self):
+        """Removes the least recently used files until the cache is within its size limit"""
+        entries = self.__list_entries()
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # files which are still open, such as memory mapped histograms on Windows, are left for a later eviction
+                continue
+            total_size -= size
+        self.__size = total_size
+
+    def __list_entries(self):
+        """
+        Lists the cache files
+        :return: a list of tuples of the modification time, size and path of each file
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def __write_atomically(self, path, write):
+        """
+        Writes to a temporary file and moves it into place, removing old entries if over the size limit
+        :param path: the final path of the cache file
+        :param write: a function taking the open temporary file to write the entry into
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                write(temp_file)
+            # temporary files are only readable by their owner
+            os.chmod(temp_path, FILE_MODE)
+            added = os.path.getsize(temp_path)
+            try:
+                added -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        if self.size_limit is not None:
+            # the whole cache is only walked when the running size is over the limit, or to take in other writers
+            self.__writes += 1
+            if self.__size is None or self.__writes % RESCAN_WRITES == 0:
+                self.__size = sum(entry[1] for entry in self.__list_entries())
+            else:
+                self.__size += added
+            if self.__size > self.size_limit:
+                self.evict()
+
+    def __get_path(self, type_string, key, binary=False):
+        """Returns the file path for a pickled or binary cache entry"""
+        return os.path.join(self.directory, type_string, '{}.{}'.format(key, 'npy' if binary else 'pkl.bz2'))
+
+
+def get_file_hash(path, chunk_size=1 << 20):
+    """
+    Hashes the contents of a file
+    :param path: the path of the file
+    :param chunk_size: the number of bytes read at a time
+    :return: a hex string sha256 digest
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_bytes_hash(data):
+    """
+    Hashes the encoded bytes of an image file held in memory
+    :param data: a bytes object
+    :return: a hex string sha256 digest
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_image_hash(image):
+    """
+    Hashes the mode, size and pixels of an image held in memory
+    :param image: a PIL Image object
+    :return: a hex string sha256 digest
+    """
+    image_hash = hashlib.sha256('{}:{}x{}:'.format(image.mode, image.width, image.height).encode())
+    image_hash.update(image.tobytes())
+    return image_hash.hexdigest()
+
+
+def get_histogram_hash(histogram):
+    """
+    Hashes the colors and frequencies of a color histogram
+    :param histogram: a ColorHistogram object
+    :return: a hex string sha256 digest
+    """
+    histogram_hash = hashlib.sha256('{}:{}:{}:'.format(histogram.bands, histogram.packed.dtype.str,
+                                                         len(histogram)).encode())
+    histogram_hash.update(np.ascontiguousarray(histogram.packed).tobytes())
+    histogram_hash.update(np.ascontiguousarray(histogram.counts, dtype=np.int64).tobytes())
+    return histogram_hash.hexdigest()
@@ -0,0 +1,88 @@
+"""Array versions of the colorsys conversions, using the same floating point operations in the same order so each
+element is identical to calling colorsys on it"""
+import colorsys
+import numpy as np
+
+
+def rgb_to_hls(r, g, b):
+    """
+    Converts arrays of rgb values 0-1 to hls
+    :return: a tuple of hue, lightness and saturation arrays 0-1
+    """
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    lightness = sumc / 2.0
+    grey = minc == maxc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        saturation = np.where(lightness <= 0.5, rangec / sumc, rangec / (2.0 - maxc - minc))
+        hue = _get_hue(r, g, b, maxc, rangec)
+
+    return np.where(grey, 0.0, hue), lightness, np.where(grey, 0.0, saturation)
+
+
+def hls_to_rgb(h, l, s):
+    """
+    Converts arrays of hls values 0-1 to rgb
+    :return: a tuple of red, green and blue arrays 0-1
+    """
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+    grey = s == 0.0
+
+    return tuple(np.where(grey, l, _get_channel(m1, m2, hue))
+                 for hue in (h + colorsys.ONE_THIRD, h, h - colorsys.ONE_THIRD))
+
+
+def rgb_to_hsv(r, g, b):
+    """
+    Converts arrays of rgb values 0-1 to hsv
+    :return: a tuple of hue, saturation and value arrays 0-1
+    """
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    grey = minc == maxc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        saturation = rangec / maxc
+        hue = _get_hue(r, g, b, maxc, rangec)
+
+    return np.where(grey, 0.0, hue), np.where(grey, 0.0, saturation), maxc
+
+
+def hsv_to_rgb(h, s, v):
+    """
+    Converts arrays of hsv values to rgb, allowing saturation and value outside 0-1 as colorsys does
+    :return: a tuple of red, green and blue arrays
+    """
+    sector = np.trunc(h * 6.0)
+    f = (h * 6.0) - sector
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    sector = np.mod(sector, 6).astype(np.int64)
+    grey = s == 0.0
+
+    # the channel taken for each of the six sectors of the hue circle
+    choices = ((v, q, p, p, t, v), (t, v, v, q, p, p), (p, p, t, v, v, q))
+    return tuple(np.where(grey, v, np.choose(sector, channel)) for channel in choices)
+
+
+def _get_hue(r, g, b, maxc, rangec):
+    """Calculates the hue shared by hls and hsv, with rangec already known to be non zero where it is used"""
+    rc = (maxc - r) / rangec
+    gc = (maxc - g) / rangec
+    bc = (maxc - b) / rangec
+    hue = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    return np.mod(hue / 6.0, 1.0)
+
+
+def _get_channel(m1, m2, hue):
+    """Calculates one rgb channel from the hls intermediate values"""
+    hue = np.mod(hue, 1.0)
+    return np.where(hue < colorsys.ONE_SIXTH, m1 + (m2 - m1) * hue * 6.0,
+                    np.where(hue < 0.5, m2,
+                             np.where(hue < colorsys.TWO_THIRD, m1 + (m2 - m1) * (colorsys.TWO_THIRD - hue) * 6.0, m1)))
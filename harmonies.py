@@ -0,0 +1,134 @@
+"""Batch versions of the Color Harmonies suggestions (https://github.com/baptistemanteau/colorharmonies), generating the
+harmonies for every colour at once with the same results and ordering as calling the library one colour at a time"""
+import numpy as np
+from colorspace import rgb_to_hls, hls_to_rgb, rgb_to_hsv, hsv_to_rgb
+
+# hue rotations in degrees in the order they are suggested: complementary, triadic, split complementary, tetradic and
+# analogous
+HUE_ROTATIONS = (180, 120, 240, 150, 210, 60, 180, 240, 30, -30)
+
+# saturation and value steps for monochromatic colours, each used once added and once subtracted
+MONOCHROMATIC_STEPS = tuple((x, y) for x in (0, 0.05, 0.10) for y in (0, 0.05, 0.10))
+
+# the number of harmony colours generated for each colour, and the number of colours whose harmonies are generated at
+# a time, which bounds the memory used by the harmony arrays
+HARMONIES_PER_COLOUR = len(HUE_ROTATIONS) + 2 * len(MONOCHROMATIC_STEPS)
+CHUNK_SIZE = 1 << 15
+
+
+def get_harmony_colours(colours):
+    """
+    Generates the harmony colours for an array of colours
+    :param colours: an (n, 3) integer array of rgb colours 0-255
+    :return: an (n, suggestions, 3) integer array of harmony colours and an (n, suggestions) bool array which is False
+    for repeated monochromatic colours, which colorharmonies leaves out
+    """
+    red, green, blue = [colours[:, channel] / 255 for channel in range(3)]
+
+    hue, lightness, saturation = rgb_to_hls(red, green, blue)
+    harmonies = [_get_hue_rotation(hue, lightness, saturation, degrees) for degrees in HUE_ROTATIONS]
+    harmonies += _get_monochromatic(red, green, blue)
+    harmonies = np.stack(harmonies, axis=1)
+
+    # monochromatic colours are only suggested once per source colour
+    included = np.ones(harmonies.shape[:2], dtype=bool)
+    first_monochromatic = len(HUE_ROTATIONS)
+    for index in range(first_monochromatic + 1, harmonies.shape[1]):
+        earlier = harmonies[:, first_monochromatic:index]
+        included[:, index] = ~(earlier == harmonies[:, index:index + 1]).all(axis=2).any(axis=1)
+
+    return harmonies, included
+
+
+def get_harmony_weightings(colours, weightings, update_weighting, chunk_size=CHUNK_SIZE):
+    """
+    Weights every harmony colour as if each suggestion was added to a dictionary in turn, with the first addition
+    taking the weighting of its source colour and later additions updating it. The harmonies are generated for a chunk
+    of colours at a time and counted into running totals, so the memory used depends on the chunk size and the number
+    of unique harmony colours rather than the number of colours
+    :param colours: an (n, 3) integer array of rgb colours 0-255 in the order they are suggested from
+    :param weightings: an array of the weighting of each colour
+    :param update_weighting: the function applied to a weighting when a colour is added again
+    :param chunk_size: the number of colours whose harmonies are generated at a time
+    :return: an (m, 3) integer array of unique harmony colours in order of first suggestion and an array of their
+    weightings
+    """
+    weightings = np.asarray(weightings, dtype=float)
+    keys = positions = counts = None
+    for start in range(0, len(colours), chunk_size):
+        harmonies, included = get_harmony_colours(colours[start:start + chunk_size])
+        # the position of each suggestion in the order every suggestion is made
+        chunk_positions = start * HARMONIES_PER_COLOUR + np.flatnonzero(included.reshape(-1))
+        chunk_keys, first_index, chunk_counts = np.unique(_pack_harmonies(harmonies[included]), return_index=True,
+                                                          return_counts=True)
+        if keys is None:
+            keys, positions, counts = chunk_keys, chunk_positions[first_index], chunk_counts
+            continue
+
+        # colours suggested by earlier chunks keep their first position, only their count grows
+        indices = np.searchsorted(keys, chunk_keys)
+        found = keys[np.minimum(indices, len(keys) - 1)] == chunk_keys
+        counts[indices[found]] += chunk_counts[found]
+        new = ~found
+        keys = np.insert(keys, indices[new], chunk_keys[new])
+        positions = np.insert(positions, indices[new], chunk_positions[first_index[new]])
+        counts = np.insert(counts, indices[new], chunk_counts[new])
+    if keys is None:
+        return np.empty((0, 3), dtype=np.int64), np.empty(0)
+
+    order = np.argsort(positions, kind='stable')
+    keys, counts = keys[order], counts[order]
+
+    # the first suggestion of a colour takes the weighting of the colour it was suggested from
+    values = weightings[positions[order] // HARMONIES_PER_COLOUR]
+    del positions, order
+    remaining = counts - 1
+    active = np.flatnonzero(remaining > 0)
+    while len(active):
+        updated = update_weighting(values[active])
+        changed = updated != values[active]
+        values[active] = updated
+        remaining[active] -= 1
+        # a weighting which stops changing has reached its fixed point and is final
+        active = active[changed & (remaining[active] > 0)]
+
+    return _unpack_harmonies(keys), values
+
+
+def _pack_harmonies(colours):
+    """Packs each harmony colour into one integer, with room for channels outside 0-255"""
+    keys = colours + 0x8000
+    return (keys[:, 0] << 32) | (keys[:, 1] << 16) | keys[:, 2]
+
+
+def _unpack_harmonies(keys):
+    """Converts packed harmony colours back into an (n, 3) integer array"""
+    colours = np.empty((len(keys), 3), dtype=np.int64)
+    for channel, shift in enumerate((32, 16, 0)):
+        colours[:, channel] = ((keys >> shift) & 0xFFFF) - 0x8000
+    return colours
+
+
+def _get_hue_rotation(hue, lightness, saturation, degrees):
+    """Rotates the hue of each colour by the number of degrees, keeping its lightness and saturation"""
+    hue = ((hue * 360 + degrees) % 360) / 360
+    return _to_integer_rgb(hls_to_rgb(hue, lightness, saturation))
+
+
+def _get_monochromatic(red, green, blue):
+    """Steps the saturation and value of each colour up and down, clamping the value at 0"""
+    hue, saturation, value = rgb_to_hsv(red, green, blue)
+    colours = []
+    for saturation_step, value_step in MONOCHROMATIC_STEPS:
+        colours.append(_to_integer_rgb(hsv_to_rgb(hue, saturation + saturation_step, value + value_step), clip=True))
+        colours.append(_to_integer_rgb(hsv_to_rgb(hue, saturation - saturation_step,
+                                                  np.maximum(value - value_step, 0)), clip=True))
+    return colours
+
+
+def _to_integer_rgb(channels, clip=False):
+    """Rounds rgb channels 0-1 to integers 0-255 as an (n, 3) array"""
+    colours = np.round(np.stack(channels, axis=1) * 255)
+    if clip:
+        colours = np.clip(colours, 0, 255)
+    return colours.astype(np.int64)
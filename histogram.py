@@ -0,0 +1,568 @@
+import io
+import math
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageFile
+
+# modes whose array interface converts channels from how they are stored, the a and b channels of LAB being shifted to
+# signed values, so their bands are read one at a time as getpixel reads them
+SPLIT_BAND_MODES = ('LAB',)
+
+
+class ColorHistogram:
+    """
+    The colors of an image and their frequencies as an array of packed colors and an array of counts, in the order the
+    colors were first seen. It is used as a sequence of colors in the format returned by Image.getpixel, while every
+    operation on the whole histogram works on the arrays, taking a fraction of the memory of a dictionary of colors
+    """
+
+    def __init__(self, packed, counts, bands):
+        """
+        Constructor for color histogram
+        :param packed: a 1D array of colors packed by pack_colors, or of the values of single band colors
+        :param counts: an array of the frequency of each color
+        :param bands: the number of channels per color, 0 for single band values
+        """
+        self.packed = np.asarray(packed)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.bands = bands
+        if self.packed.shape != self.counts.shape or self.packed.ndim != 1:
+            raise ValueError('A color histogram needs one count for each color')
+
+    @classmethod
+    def from_dict(cls, colors):
+        """
+        Creates a histogram from a dictionary of color: frequency
+        :param colors: a dictionary of color tuples with 1-4 8 bit channels, or of single band values
+        :return: a ColorHistogram in the order of the dictionary
+        """
+        keys = list(colors)
+        counts = np.fromiter(colors.values(), dtype=np.int64, count=len(keys))
+        if len(keys) == 0:
+            return cls(np.empty(0, dtype=np.uint32), counts, 3)
+        if not isinstance(keys[0], tuple):
+            return cls(np.array(keys), counts, 0)
+
+        bands = len(keys[0])
+        if not 0 < bands <= 4 or any(not isinstance(key, tuple) or len(key) != bands for key in keys):
+            raise ValueError('Colors must all be tuples of the same 1-4 channels')
+        channels = np.array(keys, dtype=np.int64)
+        if channels.min() < 0 or channels.max() > 0xFF:
+            raise ValueError('Color tuples must have 8 bit channels')
+        return cls(pack_colors(channels, bands), counts, bands)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Creates a histogram from a structured array created by to_records, without copying it
+        :param records: a structured array, which may be memory mapped
+        :return: a ColorHistogram in the stored order
+        """
+        field = records.dtype.names[0]
+        return cls(records[field], records['count'], int(field[len('color'):]))
+
+    @classmethod
+    def merge(cls, histograms):
+        """
+        Adds the frequencies of several histograms of the same kind of color together
+        :param histograms: a list of ColorHistogram objects
+        :return: a ColorHistogram ordered by the first histogram each color appears in, then its order in that
+        histogram
+        """
+        histograms = list(histograms)
+        if not histograms:
+            return cls(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64), 3)
+        if len({histogram.bands for histogram in histograms}) > 1:
+            raise ValueError('Only histograms with the same number of bands can be merged')
+
+        packed = np.concatenate([histogram.packed for histogram in histograms])
+        counts = np.concatenate([histogram.counts for histogram in histograms])
+        _, first_index, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        totals = np.rint(np.bincount(inverse.reshape(-1), weights=counts, minlength=len(first_index))).astype(np.int64)
+
+        order = np.argsort(first_index, kind='stable')
+        return cls(packed[first_index[order]], totals[order], histograms[0].bands)
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __getitem__(self, index):
+        """Returns the color at a position, or a histogram of the colors selected by a slice or array of positions"""
+        if isinstance(index, (int, np.integer)):
+            return unpack_colors(self.packed[[index]], self.bands)[0]
+        return self.take(np.arange(len(self))[index] if isinstance(index, slice) else index)
+
+    def __iter__(self):
+        return iter(self.colors())
+
+    def __repr__(self):
+        return 'ColorHistogram({} colors, {} bands, {} pixels)'.format(len(self), self.bands, int(self.counts.sum()))
+
+    def colors(self):
+        """Returns the list of colors in the format returned by Image.getpixel"""
+        return unpack_colors(self.packed, self.bands)
+
+    def items(self):
+        """Returns a list of (color, frequency) tuples"""
+        return list(zip(self.colors(), self.counts.tolist()))
+
+    def to_dict(self):
+        """Returns a dictionary of color: frequency in the histogram order"""
+        return dict(self.items())
+
+    def to_records(self):
+        """
+        Converts the histogram into a structured array of packed colors and counts
+        :return: a structured array with a 'color{bands}' uint32 field and a 'count' field, or None if single band
+        values do not fit into a uint32
+        """
+        if self.bands == 0 and len(self) and (not np.issubdtype(self.packed.dtype, np.integer) or
+                                              self.packed.min() < 0 or self.packed.max() > 0xFFFFFFFF):
+            return None
+        records = np.empty(len(self), dtype=[('color{}'.format(self.bands), '<u4'), ('count', '<i8')])
+        records['color{}'.format(self.bands)] = self.packed
+        records['count'] = self.counts
+        return records
+
+    def channels(self):
+        """Returns an (n, bands) int64 array of the color channels, or an (n, 1) array of single band values"""
+        if self.bands == 0:
+            return self.packed.reshape(-1, 1).astype(np.int64)
+        packed = self.packed.astype(np.int64)
+        return np.stack([(packed >> (8 * (self.bands - 1 - band))) & 0xFF for band in range(self.bands)], axis=1)
+
+    def take(self, indices):
+        """
+        Selects colors by position
+        :param indices: an array of positions
+        :return: a ColorHistogram of the selected colors in the order given
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        return ColorHistogram(self.packed[indices], self.counts[indices], self.bands)
+
+    def filter(self, minimum):
+        """Returns a histogram of the colors with a frequency of at least minimum, keeping their order"""
+        return self.take(np.flatnonzero(self.counts >= minimum))
+
+    def sort_by_count(self):
+        """Returns the histogram in descending order of frequency, colors of equal frequency keeping their order"""
+        return self.take(np.argsort(-self.counts, kind='stable'))
+
+    def top(self, number):
+        """Returns a histogram of the number most frequent colors, as the start of sort_by_count"""
+        return self.take(get_top_indices(self.counts, number))
+
+    def order_by_ranks(self, ranks):
+        """
+        Orders the colors by ranks such as those from ordering.get_hls_ranks
+        :param ranks: an array of the rank of each color
+        :return: a ColorHistogram in ascending rank order, colors with equal ranks keeping their order
+        """
+        return self.take(np.argsort(ranks, kind='stable'))
+
+    def scale(self, factor):
+        """Returns a histogram with every frequency multiplied by factor and rounded to the nearest integer"""
+        return ColorHistogram(self.packed, np.rint(self.counts * factor).astype(np.int64), self.bands)
+
+
+def as_color_histogram(colors):
+    """
+    Accepts a ColorHistogram or a dictionary of color: frequency
+    :param colors: a ColorHistogram or a dictionary
+    :return: a ColorHistogram
+    """
+    if isinstance(colors, ColorHistogram):
+        return colors
+    return ColorHistogram.from_dict(colors)
+
+
+def get_top_indices(values, number):
+    """
+    Finds the positions of the highest values in descending order, with equal values kept in their original order,
+    partitioning rather than sorting every value
+    :param values: an array of values
+    :param number: the number of positions, at most the number of values
+    :return: an array of positions
+    """
+    values = np.asarray(values)
+    number = max(min(number, len(values)), 0)
+    if number == 0:
+        return np.empty(0, dtype=np.int64)
+
+    selected = np.arange(len(values))
+    if number < len(values):
+        # everything above the cut off value is kept, with the earliest equal values filling the remainder
+        cut_off = np.partition(-values, number - 1)[number - 1]
+        above = np.flatnonzero(-values < cut_off)
+        equal = np.flatnonzero(-values == cut_off)[:number - len(above)]
+        selected = np.concatenate([above, equal])
+
+    return selected[np.lexsort((selected, -values[selected]))]
+
+
+def parse_pixels(image):
+    """
+    Creates a histogram of the colours in an image, ordered by first appearance when read by column and then row,
+    and their frequency
+    :param image: a PIL Image object
+    :return: a ColorHistogram whose colors match those returned by Image.getpixel
+    """
+    return count_colors(*column_major_pixels(image))
+
+
+def count_colors(pixels, bands):
+    """
+    Counts the colors of an array of pixels
+    :param pixels: a (pixels, bands) array, or a 1D array of single band values, in the order colors are listed in
+    :param bands: the number of channels per color, 0 for single band values
+    :return: a ColorHistogram ordered by first appearance
+    """
+    keys = pack_colors(pixels, bands)
+
+    unique_keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    # np.unique sorts by key, so reorder the colors by the position they were first seen in
+    order = np.argsort(first_index, kind='stable')
+    return ColorHistogram(unique_keys[order], counts[order], bands)
+
+
+def parse_pixels_in_tiles(image, tile_pixels=1 << 22):
+    """
+    Creates the same histogram as parse_pixels while decoding and counting one region of the image at a time, so the
+    memory used is bounded by the region size and the number of unique colours rather than the size of the image
+    :param image: a PIL Image object, which is decoded a region at a time if it has not been loaded
+    :param tile_pixels: the maximum number of pixels in each region, where the image format allows it
+    :return: a ColorHistogram whose colors match those returned by Image.getpixel
+    """
+    keys = positions = counts = None
+    bands = 0
+    for left, top, pixels in read_tiles(image, tile_pixels):
+        tile, bands = column_major_pixels(pixels)
+        tile_keys, first_index, tile_counts = np.unique(pack_colors(tile, bands), return_index=True,
+                                                        return_counts=True)
+
+        # the position of each color in the column then row order of the whole image
+        tile_positions = (left + first_index // pixels.shape[0]) * image.height + top + first_index % pixels.shape[0]
+        if keys is None:
+            keys, positions, counts = tile_keys, tile_positions, tile_counts
+        else:
+            keys, positions, counts = merge_counts(keys, positions, counts, tile_keys, tile_positions, tile_counts)
+
+    if keys is None:
+        return ColorHistogram(np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64), bands)
+    order = np.argsort(positions, kind='stable')
+    return ColorHistogram(keys[order], counts[order], bands)
+
+
+def merge_counts(keys, positions, counts, new_keys, new_positions, new_counts):
+    """
+    Merges the colors counted in a region into the colors counted so far
+    :param keys: an array of unique color keys
+    :param positions: an array of the first position each color was seen at
+    :param counts: an array of the frequency of each color
+    :param new_keys: an array of unique color keys for the region
+    :param new_positions: an array of the first position each color was seen at in the region
+    :param new_counts: an array of the frequency of each color in the region
+    :return: a tuple of the merged keys, first positions and frequencies, sorted by key
+    """
+    keys = np.concatenate((keys, new_keys))
+    positions = np.concatenate((positions, new_positions))
+    counts = np.concatenate((counts, new_counts))
+
+    # sort by key and then position, so the first of each key holds its earliest position
+    order = np.lexsort((positions, keys))
+    keys, positions, counts = keys[order], positions[order], counts[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], positions[starts], np.add.reduceat(counts, starts)
+
+
+def read_tiles(image, tile_pixels):
+    """
+    Decodes an image a region at a time, reading only the part of the file each region is stored in when the file
+    stores its pixels in strips or tiles or uncompressed, and otherwise decoding the whole image and splitting it into
+    strips of columns
+    :param image: a PIL Image object
+    :param tile_pixels: the maximum number of pixels in each region, exceeded only by single strips or tiles larger
+    than it in the file
+    :return: a generator of tuples of the left and top of each region and an array of its pixels
+    """
+    regions = None
+    if getattr(image, 'filename', None) and can_read_file_regions():
+        regions = _get_file_regions(image, tile_pixels)
+    if regions is None:
+        # JPEG and PNG files, and other compressed files, are stored as a single tile, so they are still decoded whole
+        # and only the pixel arrays are split
+        yield from _split_region(image, (0, 0, image.width, image.height), tile_pixels)
+        return
+
+    for extents, tiles in regions:
+        with Image.open(image.filename) as region:
+            _set_region_tiles(region, tiles, extents)
+            yield from _split_region(region, extents, tile_pixels)
+
+
+def _split_region(region, extents, tile_pixels):
+    """
+    Decodes a region and splits it into strips of columns of at most tile_pixels where it is larger
+    :param region: a PIL Image object of the region
+    :param extents: the (left, top, right, bottom) box of the region in the whole image
+    :param tile_pixels: the maximum number of pixels in each strip, exceeded only by single columns larger than it
+    :return: a generator of tuples of the left and top of each strip and an array of its pixels
+    """
+    left, top, right, bottom = extents
+    columns = max(1, tile_pixels // max(bottom - top, 1))
+    if columns >= right - left:
+        yield left, top, get_pixel_array(region)
+        return
+    for x in range(0, right - left, columns):
+        yield left + x, top, get_pixel_array(region.crop((x, 0, min(x + columns, right - left), bottom - top)))
+
+
+def _set_region_tiles(region, tiles, extents):
+    """
+    Points an unloaded image file at the tiles of one region, so that loading it decodes only that region. This uses
+    the tile descriptors Pillow keeps on opened files, which can_read_file_regions checks before they are relied on
+    """
+    # only strips and tiles of TIFF files and uncompressed files such as BMP and PPM are split into regions, JPEG and
+    # PNG files have one tile of the whole image and never reach here
+    region.tile = tiles
+    region._size = (extents[2] - extents[0], extents[3] - extents[1])
+
+
+@lru_cache(maxsize=None)
+def can_read_file_regions():
+    """
+    Checks that regions of a file decoded from their own tiles match crops of the whole image in this version of
+    Pillow, otherwise images are decoded whole and split into strips of columns
+    """
+    buffer = io.BytesIO()
+    pixels = np.arange(7 * 5 * 3, dtype=np.uint8).reshape((7, 5, 3))
+    Image.fromarray(pixels, 'RGB').save(buffer, 'BMP')
+    try:
+        with Image.open(buffer) as image:
+            regions = _get_file_regions(image, 10)
+        if regions is None or len(regions) < 2:
+            return False
+        for extents, tiles in regions:
+            with Image.open(io.BytesIO(buffer.getvalue())) as region:
+                _set_region_tiles(region, tiles, extents)
+                if not np.array_equal(np.asarray(region), pixels[extents[1]:extents[3], extents[0]:extents[2]]):
+                    return False
+    except Exception:
+        return False
+    return True
+
+
+def _get_file_regions(image, tile_pixels):
+    """
+    Groups the strips or tiles of an image file into rectangular regions of at most tile_pixels, splitting
+    uncompressed strips into bands of rows
+    :return: a list of tuples of the extents of each region and its tiles moved to start at 0, 0, or None if the image
+    is already loaded or its tiles cannot be read separately
+    """
+    if not getattr(image, 'tile', None) or getattr(image, 'use_load_libtiff', False):
+        return None
+
+    tiles = []
+    for tile in image.tile:
+        tiles += _split_raw_tile(image, tile, tile_pixels)
+
+    regions = []
+    group, extents = [], None
+    for tile in tiles:
+        if group:
+            union = (min(extents[0], tile[1][0]), min(extents[1], tile[1][1]),
+                     max(extents[2], tile[1][2]), max(extents[3], tile[1][3]))
+            # a region must be exactly covered by its tiles to be decoded as one image
+            if _get_area(union) <= tile_pixels and _get_area(union) == sum(_get_area(t[1]) for t in group + [tile]):
+                group.append(tile)
+                extents = union
+                continue
+            regions.append(_get_region(group, extents))
+        group, extents = [tile], tile[1]
+    if group:
+        regions.append(_get_region(group, extents))
+
+    if sum(_get_area(extents) for extents, _ in regions) != image.width * image.height:
+        return None
+    return regions
+
+
+def _split_raw_tile(image, tile, tile_pixels):
+    """Splits an uncompressed tile into bands of rows of at most tile_pixels, where the row length can be found"""
+    codec_name, (left, top, right, bottom), offset, args = tile[:4]
+    if codec_name != 'raw' or (right - left) * (bottom - top) <= tile_pixels:
+        return [tile]
+
+    args = (args,) if isinstance(args, str) else tuple(args)
+    rawmode, stride, ystep = args + (image.mode, 0, 1)[len(args):]
+    if not stride:
+        try:
+            stride = len(Image.new(image.mode, (right - left, 1)).tobytes('raw', rawmode))
+        except (ValueError, OSError):
+            return [tile]
+
+    rows = max(1, tile_pixels // (right - left))
+    bands = []
+    for band_top in range(top, bottom, rows):
+        band_bottom = min(band_top + rows, bottom)
+        # bottom up files store the last row first
+        row = band_top - top if ystep > 0 else bottom - band_bottom
+        bands.append(_make_tile('raw', (left, band_top, right, band_bottom), offset + row * stride,
+                                (rawmode, stride, ystep)))
+    return bands
+
+
+def _get_region(tiles, extents):
+    """Moves a group of tiles to start at 0, 0 so they can be decoded as one image the size of their extents"""
+    left, top = extents[:2]
+    return extents, [_make_tile(tile[0], (tile[1][0] - left, tile[1][1] - top, tile[1][2] - left, tile[1][3] - top),
+                                *tile[2:4]) for tile in tiles]
+
+
+def _make_tile(codec_name, extents, offset, args):
+    """Creates a tile descriptor as used by the installed version of Pillow, a plain tuple before Pillow 11"""
+    if hasattr(ImageFile, '_Tile'):
+        return ImageFile._Tile(codec_name, extents, offset, args)
+    return codec_name, extents, offset, args
+
+
+def _get_area(extents):
+    """Returns the number of pixels covered by extents"""
+    return (extents[2] - extents[0]) * (extents[3] - extents[1])
+
+
+def sample_pixels(image, sample_rate, seed=0):
+    """
+    Creates a histogram of the colours in a stratified sample of the pixels of an image, taking one pixel at a random
+    position in each cell of a grid laid over the image, with frequencies scaled up to estimate those of every pixel
+    :param image: a PIL Image object
+    :param sample_rate: the fraction of pixels sampled, greater than 0 and at most 1
+    :param seed: the seed for the positions sampled in each cell, so the same sample is taken each time
+    :return: a ColorHistogram of estimated frequencies ordered by first appearance in the sample, read by column and
+    then row
+    """
+    pixels = get_pixel_array(image)
+    rows, columns = get_sample_shape(image.width, image.height, sample_rate)
+    random = np.random.default_rng(seed)
+    y = _get_strata(image.height, rows, random.random((rows, columns)))
+    x = _get_strata(image.width, columns, random.random((rows, columns)).T).T
+
+    colors = count_colors(*column_major_pixels(pixels[y, x]))
+    return colors.scale((image.width * image.height) / (rows * columns))
+
+
+def get_sample_shape(width, height, sample_rate):
+    """
+    Calculates the grid of cells a stratified sample takes one pixel from each of
+    :param width: the width of the image
+    :param height: the height of the image
+    :param sample_rate: the fraction of pixels sampled
+    :return: a tuple of the number of rows and columns of cells
+    """
+    if not 0 < sample_rate <= 1:
+        raise ValueError('The sample rate must be greater than 0 and at most 1: {}'.format(sample_rate))
+    scale = math.sqrt(sample_rate)
+    return min(height, max(1, round(height * scale))), min(width, max(1, round(width * scale)))
+
+
+def get_sampling_errors(counts, total, sampled):
+    """
+    Estimates the standard error of frequencies scaled up from a sample of pixels, as for a simple random sample
+    without replacement, which the stratified sample is expected to improve on
+    :param counts: an array of estimated frequencies
+    :param total: the number of pixels in the image
+    :param sampled: the number of pixels sampled
+    :return: an array of the standard error of each frequency, 0 when every pixel was sampled
+    """
+    counts = np.asarray(counts, dtype=float)
+    proportions = np.clip(counts / total, 0, 1)
+    return np.sqrt(counts * (total / sampled) * (1 - proportions) * (1 - sampled / total))
+
+
+def _get_strata(length, cells, offsets):
+    """Picks a position in each cell along one axis from random offsets 0-1, with a row of offsets for each cell"""
+    bounds = (np.arange(cells + 1) * length) // cells
+    starts, sizes = bounds[:-1, None], np.diff(bounds)[:, None]
+    return starts + np.minimum((offsets * sizes).astype(np.int64), sizes - 1)
+
+
+def column_major_pixels(image):
+    """
+    Reads the decoded pixel buffer of an image in bulk in the same column then row order as the original pixel loop
+    :param image: a PIL Image object, or an array of its pixels
+    :return: a tuple of a (pixels, bands) array and the number of bands, or a 1D array and 0 for single band modes
+    """
+    pixels = get_pixel_array(image)
+    if pixels.dtype == bool:
+        # mode '1' images report 0 or 255 from getpixel
+        pixels = pixels.astype(np.uint8) * 255
+
+    # transpose so that the flattened buffer runs down each column before moving to the next one
+    if pixels.ndim == 3:
+        bands = pixels.shape[2]
+        return pixels.transpose(1, 0, 2).reshape(-1, bands), bands
+    return pixels.transpose(1, 0).reshape(-1), 0
+
+
+def get_pixel_array(image):
+    """
+    Reads the decoded pixel buffer of an image as an array of the values returned by Image.getpixel
+    :param image: a PIL Image object, or an array of its pixels which is returned unchanged
+    :return: a (height, width, bands) array, or a (height, width) array for single band modes
+    """
+    if isinstance(image, Image.Image) and image.mode in SPLIT_BAND_MODES:
+        return np.stack([np.asarray(band) for band in image.split()], axis=2)
+    return np.asarray(image)
+
+
+def pack_colors(pixels, bands):
+    """
+    Packs 8 bit color channels into a single uint32 key per color
+    :param pixels: a (pixels, bands) uint8 array, or a 1D array of single band values
+    :param bands: the number of channels per color, 0 for single band values which are used as keys unchanged
+    :return: a 1D array of keys
+    """
+    if bands == 0:
+        return pixels
+
+    keys = np.zeros(len(pixels), dtype=np.uint32)
+    for band in range(bands):
+        keys = (keys << 8) | pixels[:, band].astype(np.uint32)
+    return keys
+
+
+def unpack_colors(keys, bands):
+    """
+    Converts packed color keys back into the color format returned by Image.getpixel
+    :param keys: a 1D array of keys created by pack_colors
+    :param bands: the number of channels per color, 0 for single band values
+    :return: a list of color tuples, or a list of values for single band images
+    """
+    if bands == 0:
+        return keys.tolist()
+
+    channels = [(keys >> (8 * (bands - 1 - band))) & 0xFF for band in range(bands)]
+    return list(zip(*[channel.tolist() for channel in channels]))
+
+
+def to_records(colors):
+    """
+    Converts a histogram into a structured array of packed color keys and counts
+    :param colors: a ColorHistogram or a dictionary of color: frequency
+    :return: a structured array with a 'color{bands}' uint32 field and a 'count' field, or None if the colors are not
+    8 bit channel tuples or unsigned integers which fit into a uint32 key
+    """
+    try:
+        return as_color_histogram(colors).to_records()
+    except ValueError:
+        return None
+
+
+def from_records(records):
+    """
+    Converts a structured array created by to_records back into a histogram
+    :param records: a structured array, which may be memory mapped
+    :return: a ColorHistogram in the stored order
+    """
+    return ColorHistogram.from_records(records)
@@ -0,0 +1,207 @@
+"""Timing, memory and cache measurements for the stages and graphics of an analysis"""
+import json
+import time
+import functools
+import threading
+import tracemalloc
+
+
+class Instrumentation:
+    """Records a measurement for each stage and graphic, which can be reported as a dictionary or JSON or passed to
+    hooks as each one finishes"""
+
+    def __init__(self, trace_memory=False):
+        """
+        Constructor for instrumentation
+        :param trace_memory: records the peak memory allocated during each measurement with tracemalloc, which slows
+        the analysis, default: False
+        """
+        self.trace_memory = trace_memory
+        self.records = []
+        self.__hooks = []
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __getstate__(self):
+        """Pickles the records, hooks and options, as locks and the measurements running in each thread cannot be"""
+        state = self.__dict__.copy()
+        del state['_Instrumentation__lock'], state['_Instrumentation__local']
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled object with a new lock and no running measurements"""
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def add_hook(self, hook):
+        """
+        Adds a function called with the record of each measurement when it finishes
+        :param hook: a function taking a record dictionary
+        """
+        self.__hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Removes a function added with add_hook
+        :param hook: the function to remove
+        """
+        self.__hooks.remove(hook)
+
+    def measure(self, name, kind, **details):
+        """
+        Measures the code run within a with statement, nested measurements recording their parent
+        :param name: the name of the stage or graphic
+        :param kind: 'stage' or 'graphic'
+        :param details: extra values kept in the record, such as the image name
+        :return: a context manager giving the record, which is completed when the with statement ends
+        """
+        return _Measurement(self, name, kind, details)
+
+    def add_records(self, records):
+        """
+        Adds finished records, such as those measured in a worker process, passing each to the hooks
+        :param records: a list of record dictionaries
+        """
+        with self.__lock:
+            self.records.extend(records)
+        for record in records:
+            for hook in list(self.__hooks):
+                hook(record)
+
+    def set_cache(self, outcome):
+        """
+        Records how the cache was used by the current measurement
+        :param outcome: 'hit', 'miss' or 'disabled'
+        """
+        record = self.current()
+        if record is not None:
+            record['cache'] = outcome
+
+    def count(self, **counts):
+        """
+        Records the number of items handled by the current measurement, such as pixels or unique colors
+        :param counts: the name and number of each item
+        """
+        record = self.current()
+        if record is not None:
+            record['counts'].update(counts)
+
+    def current(self):
+        """Returns the record of the innermost measurement running in this thread, or None"""
+        stack = self.__get_stack()
+        return stack[-1]['record'] if stack else None
+
+    def report(self):
+        """
+        Summarises the measurements
+        :return: a dictionary of every record and of totals for each kind and name of measurement, with the number of
+        calls, wall and cpu time in seconds, the largest peak memory in bytes and the number of cache hits and misses
+        """
+        with self.__lock:
+            records = list(self.records)
+
+        totals = {}
+        for record in records:
+            total = totals.setdefault('{}:{}'.format(record['kind'], record['name']), {
+                'calls': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_memory': None, 'cache_hits': 0,
+                'cache_misses': 0})
+            total['calls'] += 1
+            total['wall_time'] += record['wall_time']
+            total['cpu_time'] += record['cpu_time']
+            if record['peak_memory'] is not None:
+                total['peak_memory'] = max(total['peak_memory'] or 0, record['peak_memory'])
+            total['cache_hits'] += record['cache'] == 'hit'
+            total['cache_misses'] += record['cache'] == 'miss'
+
+        return {'records': records, 'totals': totals}
+
+    def to_json(self, path=None, indent=2):
+        """
+        Reports the measurements as JSON
+        :param path: a file path the report is written to, default: None only returns it
+        :param indent: the indentation of the JSON
+        :return: the JSON string
+        """
+        report = json.dumps(self.report(), indent=indent)
+        if path is not None:
+            with open(path, 'w') as outfile:
+                outfile.write(report)
+        return report
+
+    def _start(self, record):
+        """Starts a measurement, keeping the peak memory of any measurement it is nested in"""
+        stack = self.__get_stack()
+        if stack:
+            record['parent'] = stack[-1]['record']['name']
+
+        frame = {'record': record, 'wall': time.perf_counter(), 'cpu': time.process_time(), 'memory': None}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                frame['started_tracing'] = True
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'], frame['peak'] = current, current
+        stack.append(frame)
+
+    def _finish(self, record):
+        """Completes a measurement and passes its record to the hooks"""
+        stack = self.__get_stack()
+        frame = stack.pop()
+        record['wall_time'] = time.perf_counter() - frame['wall']
+        record['cpu_time'] = time.process_time() - frame['cpu']
+
+        if frame['memory'] is not None:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_memory'] = peak - frame['memory']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+            if frame.get('started_tracing'):
+                tracemalloc.stop()
+
+        self.add_records([record])
+
+    def __get_stack(self):
+        """Returns the measurements running in this thread"""
+        if not hasattr(self.__local, 'stack'):
+            self.__local.stack = []
+        return self.__local.stack
+
+
+class _Measurement:
+    """Context manager for Instrumentation.measure"""
+
+    def __init__(self, instrumentation, name, kind, details):
+        self.__instrumentation = instrumentation
+        self.__record = {'name': name, 'kind': kind, **details, 'parent': None, 'wall_time': None, 'cpu_time': None,
+                         'peak_memory': None, 'cache': None, 'counts': {}}
+
+    def __enter__(self):
+        self.__instrumentation._start(self.__record)
+        return self.__record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__record['error'] = None if exc_type is None else exc_type.__name__
+        self.__instrumentation._finish(self.__record)
+        return False
+
+
+def measured(kind):
+    """
+    Decorates a method of an object with an instrumentation attribute so every call is measured, named after the
+    method without leading underscores
+    :param kind: 'stage' or 'graphic'
+    :return: the decorator
+    """
+    def decorator(function):
+        name = function.__name__.lstrip('_')
+
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.measure(name, kind, image=self.filename):
+                return function(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,48 +1,172 @@
 # Project to parse image files and create a sample of all the colours as graphics
+import io
 import os
 import math
-import colorsys
-import pickle
+import logging
+from functools import cached_property, partial
 from random import shuffle
-import bz2
-from PIL import Image, ImageDraw
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from PIL import Image
 from suggestions import suggestions_algorithm
+from quantization import quantize_colors, QUANTIZATION_METHODS
+from histogram import ColorHistogram, parse_pixels, parse_pixels_in_tiles, sample_pixels, get_sample_shape, \
+    get_sampling_errors
+from refinement import RefinementIndex, get_bar_heights
+from rendering import render_frequency_bars, render_grid, render_bar_region, get_bar_rows, save_image, encode_image, \
+    get_output_format, fits_output_format, check_output_size
+from pyramid import save_deep_zoom
+from ordering import get_hls_ranks, order_by_ranks
+from cache import CacheStore, get_file_hash, get_bytes_hash, get_image_hash, get_histogram_hash
+from instrumentation import Instrumentation, measured
+
+logger = logging.getLogger(__name__)
+
+
+# analysis inherited by the worker processes of AnalyseImage.create_basic_selection
+_shared_analysis = None
+
+
+def _set_shared_analysis(analysis):
+    """Stores the analysis a forked worker process creates graphics from"""
+    global _shared_analysis
+    _shared_analysis = analysis
+
+
+def _create_shared_graphic(method_name, kwargs):
+    """
+    Calls a graphic method of the shared analysis in a worker process
+    :return: a tuple of the result of the method and the instrumentation records made while it ran, which are sent
+    back to the parent process
+    """
+    records = _shared_analysis.instrumentation.records
+    first = len(records)
+    result = getattr(_shared_analysis, method_name)(**kwargs)
+    return result, records[first:]
+
+
+def _open_source(source):
+    """
+    Opens an image from a file in the ./source directory or from memory
+    :param source: a file name, a PIL Image, the encoded bytes of an image file, a file-like object or a NumPy array
+    :return: a tuple of the PIL Image, the path of its file or None, and its encoded bytes or None
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.path.join('./source', source)
+        return Image.open(path), path, None
+    if isinstance(source, Image.Image):
+        return source, None, None
+    if isinstance(source, np.ndarray):
+        return Image.fromarray(source), None, None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    elif hasattr(source, 'read'):
+        data = source.read()
+    else:
+        raise TypeError('Unsupported image source: {}'.format(type(source).__name__))
+    return Image.open(io.BytesIO(data)), None, data
 
 
 class AnalyseImage:
-    """Image class"""
-
-    def __init__(self, filename: str, use_cache=True, grid_swatch_width=200, grid_spacing=10, target_height=60000):
+    """Image class, whose analysis stages are each calculated the first time a graphic needs them"""
+
+    # algorithm version of each cached stage, increase a version whenever the results of that stage change
+    __stage_versions = {'im_color': 1, 'im_palette': 1, 'im_refinedColor': 1, 'im_suggestions': 1}
+    # stages whose data is a ColorHistogram of color: frequency
+    __histogram_stages = {'im_color', 'im_palette', 'im_refinedColor'}
+    # the analysis stages read to calculate each analysis stage
+    __stage_dependencies = {
+        'colors': (),
+        'palette': ('colors',),
+        'is_greyscale': ('colors',),
+        'reduced_colors': ('palette',),
+        'refinement_index': ('palette',),
+        'multiplier': ('refinement_index',),
+        'reduced_color_key_ordered_list': ('reduced_colors',),
+        'grid_max_size': ('reduced_color_key_ordered_list',),
+        'grid_extended_max_size': ('palette',),
+        'color_suggestions': ('palette', 'grid_extended_max_size'),
+    }
+
+    def __init__(self, filename, use_cache=None, grid_swatch_width=200, grid_spacing=10, target_height=60000,
+                 cache_directory='./imageinterpreter_cache', cache_size_limit=None, sample_rate=1,
+                 tile_pixels=None, quantize=None, palette_size=256, quantize_bits=5, instrumentation=None,
+                 results_directory=None, name=None):
         """
         Constructor for image
-        :param filename: String
-        :param use_cache: tells the program to ignore cached data for the image
+        :param filename: the name of an image file in the ./source directory, or an image in memory as a PIL Image,
+        the encoded bytes of an image file, a file-like object or a NumPy array of pixels, or a ColorHistogram of the
+        colors of one or more images, such as HistogramAccumulator.histogram
+        :param use_cache: tells the program whether to read and write cached data for the image, default: None caches
+        images from files and not images in memory
         :param grid_swatch_width: the width in pixels of each square on a grid graphic
         :param grid_spacing: the number of pixels separating each row/column
         :param target_height: the number of pixels for color frequency bars and number of colors sampled for grids
+        :param cache_directory: the folder used to store cached data
+        :param cache_size_limit: the maximum size of the cache in bytes before least recently used files are removed
+        :param sample_rate: the fraction of pixels read for a quicker preview analysis, taken as a stratified sample
+        with frequencies scaled up to the whole image, default: 1 reads every pixel
+        :param tile_pixels: the number of pixels decoded and counted at a time when reading every pixel, which bounds
+        the memory used for very large images, default: None decodes the whole image at once
+        :param quantize: merges similar colors into a palette before the color data and suggestions are created, 'bits',
+        'median_cut' or 'kmeans', see quantization.quantize_colors, default: None uses every color
+        :param palette_size: the maximum number of palette colors for the median_cut and kmeans methods
+        :param quantize_bits: the number of bits kept for each channel by the bits method
+        :param instrumentation: an Instrumentation object recording the time, memory, cache use and item counts of
+        each stage and graphic, which can be shared between objects, default: a new Instrumentation object
+        :param results_directory: the folder a sub-folder of saved graphics is created in, default: None saves the
+        graphics of images from files in ./Results and does not save the graphics of images in memory
+        :param name: the name used for saved graphics and messages, default: the file name without its extension,
+        'image' for images in memory or 'histogram' for a ColorHistogram
         """
-        # open image
-        try:
-            self.__im = Image.open('./source/{}'.format(filename))
-            print(self.__im.filename)
-        except FileNotFoundError:
-            print('File Not Found: process aborted')
-            raise
+        # open image, or analyse the colors already counted in a histogram
+        if isinstance(filename, ColorHistogram):
+            self.__im, self.__source_path, self.__source_bytes = None, None, None
+            self.__histogram = filename
+            logger.info('Histogram of {} colors'.format(len(filename)))
+        else:
+            try:
+                self.__im, self.__source_path, self.__source_bytes = _open_source(filename)
+                logger.info(self.__im.filename if self.__source_path else 'Image in memory')
+            except FileNotFoundError:
+                logger.error('File Not Found: process aborted')
+                raise
+            self.__histogram = None
+
+        # images in memory are analysed without reading or writing files unless asked to
+        in_memory = self.__source_path is None
+        if use_cache is None:
+            use_cache = not in_memory
+        if results_directory is None and not in_memory:
+            results_directory = './Results'
+        if name is None:
+            if self.__histogram is not None:
+                name = 'histogram'
+            else:
+                name = 'image' if in_memory else os.path.basename(self.__source_path).split('.')[0]
 
         # image class attributes
+        self.filename = filename if isinstance(filename, str) else name
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
         self.color_frequency_bars = None
         self.color_grid = None
         self.color_suggestions_grid = None
 
         """Private attributes"""
-        # create directory
-        if not os.path.exists('./Results'):
-            os.mkdir('./Results')
-        try:
-            os.mkdir('./Results/{}'.format(self.__im.filename.split('/')[-1].split('.')[0]))
-        except FileExistsError:
-            pass
-        self.__path = './Results/{}'.format(self.__im.filename.split('/')[-1].split('.')[0])
+        self.__name = name
+        self.__results_directory = results_directory
+
+        # cache of stage data keyed by the image contents
+        self.__use_cache = use_cache
+        self.__cache = CacheStore(cache_directory, cache_size_limit)
+        self.__content_hash = None
+
+        # chromatic ranks of each list of colors, shared by every ordered graphic
+        self.__hls_ranks = {}
+
+        # target height: (reduced colors, specific value, multiplier) of frequency bars at other heights
+        self.__refinements = {}
 
         # graphic max length
         self.__max_length = 60000
@@ -52,42 +176,45 @@ class AnalyseImage:
         if self.__target_height > self.__max_length:
             self.__target_height = self.__max_length
 
-        # specific value is the frequency required to occupy one pixel of the target height
-        self.__specific_value = math.ceil((self.__im.width * self.__im.height) / self.__target_height)
-
-        # Parse Pixels
-        print('\n{}\n1. Parsing pixels'.format(filename))
-        self.__colors = self.__load_data('im_color', self.__parse_pixels, use_cache=use_cache)
-
-        # Check if greyscale
-        print('2. Checking if the image is greyscale')
-        self.__is_greyscale = self.__check_if_greyscale()
-
-        # Create color data
-        print('3. Creating color data')
-        self.__reduced_colors = self.__load_data('im_refinedColor', self.__refine_color_data, use_cache=use_cache)
+        # a histogram holds the total frequency of its colors, which were counted or sampled when it was created
+        if self.__histogram is not None:
+            if len(self.__histogram) == 0 or self.__histogram.counts.sum() <= 0:
+                raise ValueError('The histogram has no colors to analyse')
+            sample_rate, tile_pixels = 1, None
+            self.__pixels = int(self.__histogram.counts.sum())
+            self.__pixels_sampled = self.__pixels
+        else:
+            self.__pixels = self.__im.width * self.__im.height
+            rows, columns = get_sample_shape(self.__im.width, self.__im.height, sample_rate)
+            self.__pixels_sampled = rows * columns
 
-        # Create reduced color list for grids
-        self.__reduced_color_key_ordered_list = list({k: v for k, v in sorted(self.__reduced_colors.items(),
-                                                                              key=lambda item: item[1], reverse=True)})
+        # specific value is the frequency required to occupy one pixel of the target height
+        self.__specific_value = self.__get_specific_value(self.__target_height)
+
+        # preview analysis from a sample of the pixels, which is cached separately to the exact analysis
+        self.__sample_rate = sample_rate
+        self.__sample_parameters = {'sample_rate': sample_rate} if sample_rate < 1 else {}
+        self.__tile_pixels = tile_pixels
+
+        # quantized palette the later stages are created from, which is cached for each set of options
+        if quantize is not None and quantize not in QUANTIZATION_METHODS:
+            raise ValueError('Unknown quantization method: {}, use one of {}'.format(quantize, QUANTIZATION_METHODS))
+        self.__quantize = quantize
+        self.__palette_size = palette_size
+        self.__quantize_bits = quantize_bits
+        self.__palette_parameters = dict(self.__sample_parameters)
+        if quantize == 'bits':
+            self.__palette_parameters.update(quantize=quantize, quantize_bits=quantize_bits)
+        elif quantize is not None:
+            self.__palette_parameters.update(quantize=quantize, palette_size=palette_size)
 
         # grid variables
         self.__grid_swatch_width = grid_swatch_width
         self.__grid_spacing = grid_spacing
-        self.__grid_max_size = self.__get_max_grid_size(self.__reduced_color_key_ordered_list, self.__grid_swatch_width,
-                                                        self.__grid_spacing, output=False)
-        self.__grid_extended_max_size = self.__get_max_grid_size(self.__colors.keys(), self.__grid_swatch_width,
-                                                                 self.__grid_spacing, output=False)
-        print('4. The normal maximum grid size is {}'.format(self.__grid_max_size))
 
-        # Create suggestions
-        print('5. Gathering {} suggestions'.format(self.__grid_extended_max_size))
-        self.__color_suggestions = self.__load_data('im_suggestions', suggestions_algorithm, use_cache=use_cache,
-                                                    colour_dict=self.__colors.items(),
-                                                    number_requested=(self.__grid_extended_max_size *
-                                                                      self.__grid_extended_max_size))
-
-    def create_color_frequency_bars(self, width=2000, random=False, ordered=False, save=True):
+    @measured('graphic')
+    def create_color_frequency_bars(self, width=2000, random=False, ordered=False, save=True, output_format='png',
+                                    compress_level=6, palette=False, target_height=None, tiled=False):
         """
         Creates a color frequency bars image file
         :param width: int width of the resulting image, default: 2000
@@ -95,60 +222,73 @@ class AnalyseImage:
         :param ordered: orders the colors chromatically, overriding the random parameter
         :param save: bool whether to save the resulting image in the format
         {filename}_color_frequency_bars.png to program directory
-        :return: A dictionary of the colours used and their frequency in the original
+        :param output_format: the format the graphic is saved in, 'png', 'webp' or 'webp_lossless', default: 'png'
+        :param compress_level: 0-9, lower saves quicker and larger files, default: 6
+        :param palette: saves the graphic as a palette image when it has at most 256 colors, default: False
+        :param target_height: the height of the graphic, at most 60000 unless tiled, default: None uses the target
+        height of the object, other heights are refined from the refinement index of the image
+        :param tiled: saves the graphic as a Deep Zoom pyramid of tiles rendered one at a time, with no height limit,
+        instead of as one image, default: False
+        :return: A list of (colour, frequency) tuples of the colours used and their frequency in the original, in the
+        order drawn
         """
-        print('\nCreating Color Frequency Bars for {} | width: {} | height: {} | random: {} | ordered: {} | save: {}'
-              .format(self.__im.filename, width, self.__target_height, random, ordered, save))
-
-        # check environment for multiplier
-        try:
-            print('Multiplier: {}'.format(self.__multiplier))
-        except AttributeError:
-            print('3.1. recreating color data in current environment')
-            self.__refine_color_data()
-
-        # Create a blank image
-        colour_graphic = Image.new("RGB", (width, self.__target_height))
-
-        # creates a drawing object
-        draw = ImageDraw.Draw(colour_graphic)
+        if target_height is None:
+            target_height = self.__target_height
+        if not tiled:
+            target_height = min(target_height, self.__max_length)
+        self.__check_tiled(tiled, save)
+        if target_height < 1:
+            raise ValueError('The target height must be at least 1: {}'.format(target_height))
+        if save and not tiled:
+            check_output_size((width, target_height), output_format)
+        logger.info('Creating Color Frequency Bars for {} | width: {} | height: {} | random: {} | ordered: {} | '
+                    'save: {}'.format(self.__name, width, target_height, random, ordered, save))
+        reduced_colors, specific_value, multiplier = self.__get_refinement(target_height)
 
         # orders the colors chromatically
         if ordered:
-            colour_data_set = self.__sort_dictionary_colors_by_hsl(self.__reduced_colors)
+            source = 'reduced_colors' if target_height == self.__target_height else \
+                'reduced_colors_height{}'.format(target_height)
+            colour_data_set = reduced_colors.order_by_ranks(self.__get_hls_ranks(source, reduced_colors))
         else:
             # randomises the colour data if parameter is passed
-            colour_data_set = list(self.__reduced_colors.items())
+            colour_data_set = reduced_colors
             if random:
-                shuffle(colour_data_set)
-
-        # iterates over colours in the reduced dictionary & draws rectangles with a proportional height to frequency
-        y = 0
-        for key, value in colour_data_set:
-            # sets the height for each rectangle and ensures it is at least 1 pixel tall
-            frequency = math.floor(value / (self.__specific_value * self.__multiplier))
-            if frequency == 0:
-                frequency = 1
-
-            draw.rectangle([(0, y), (width - 1, y + frequency)], fill='rgb' + str(key[:3]))
-            y += frequency
-            if y >= self.__target_height:
-                break
-
+                indices = list(range(len(colour_data_set)))
+                shuffle(indices)
+                colour_data_set = colour_data_set.take(indices)
+
+        # draws each colour in the reduced histogram as a band with a proportional height to frequency
+        heights = get_bar_heights(colour_data_set.counts, specific_value * multiplier)
+        bar_colors = colour_data_set.channels()[:, :3]
+        self.instrumentation.count(colors=len(colour_data_set))
+        name = '{}_width{}_height{}_random{}_ordered{}_color_frequency_bars'.format(self.__name, width, target_height,
+                                                                                    random, ordered)
+        if tiled:
+            rows = get_bar_rows(bar_colors, heights, target_height)
+            self.__save_pyramid(lambda region: render_bar_region(rows, region), width, target_height,
+                                'Color Frequency Bars', name, output_format, compress_level, palette)
+            logger.info('Color Frequency Bars: Finished')
+            self.color_frequency_bars = None
+            return colour_data_set.items()
+
+        colour_graphic = render_frequency_bars(bar_colors, heights, width, target_height)
         if save:
-            colour_graphic.save('{}/{}_width{}_height{}_random{}_ordered{}_color_frequency_bars.png'
-                                .format(self.__path, self.__im.filename.split('/')[-1].split('.')[0], width,
-                                        self.__target_height, random, ordered), 'PNG')
-            print('Color Frequency Bars saved to the Results directory: {}_width{}_height{}_random{}_ordered{}_color_'
-                  'frequency_bars.png'.format(self.__im.filename.split('/')[-1].split('.')[0], width,
-                                              self.__target_height, random, ordered))
-
-        print('Color Frequency Bars: Finished')
+            # palette bars are rendered again as a palette image, which is quicker than converting the graphic
+            if palette and output_format == 'png':
+                output_graphic = render_frequency_bars(bar_colors, heights, width, target_height, palette=True)
+            else:
+                output_graphic = colour_graphic
+            self.__save_graphic(output_graphic, 'Color Frequency Bars', name, output_format, compress_level, palette)
+
+        logger.info('Color Frequency Bars: Finished')
         self.color_frequency_bars = colour_graphic
-        return colour_data_set
+        return colour_data_set.items()
 
+    @measured('graphic')
     def create_color_grid(self, ordered=False, random=False, save=True, grid=50, text=True, background=(0, 0, 0),
-                          extra_large=False, arg_swatch_width=-1, arg_grid_spacing=-1):
+                          extra_large=False, arg_swatch_width=-1, arg_grid_spacing=-1, output_format='png',
+                          compress_level=6, palette=False, tiled=False):
         """
         Creates a grid of the image colors
         :param ordered: bool to order the colors chromatically, default: False
@@ -157,16 +297,24 @@ class AnalyseImage:
         :param grid: int for the number of rows/columns in the grid, must be 100 or less, default: 50
         :param text: bool to add the color tuple overlay text to each color, default: True
         :param background: rgb tuple for the grid background in the format (r, g, b), default: black
-        :param extra_large: overrides reduced color list to make a larger grid
+        :param extra_large: overrides reduced color list with every color, or every palette color when quantizing
         :param arg_swatch_width: overrides the object default swatch width
         :param arg_grid_spacing: overrides the object default grid spacing
+        :param output_format: the format the graphic is saved in, 'png', 'webp' or 'webp_lossless', default: 'png'
+        :param compress_level: 0-9, lower saves quicker and larger files, default: 6
+        :param palette: saves the graphic as a palette image when it has at most 256 colors, default: False
+        :param tiled: saves the graphic as a Deep Zoom pyramid of tiles rendered one at a time, with no size limit, so
+        extra large grids can show every color, default: False
         :return: the list of colors used ordered by frequency
         """
 
         colors = self.__reduced_color_key_ordered_list
+        source = 'reduced_colors_by_frequency'
         swatch_width = self.__grid_swatch_width
         grid_spacing = self.__grid_spacing
         max_grid_size = self.__grid_max_size
+        if tiled:
+            max_grid_size = self.__get_max_grid_size(colors, swatch_width, grid_spacing, output=False, limited=False)
 
         if arg_swatch_width > 0:
             swatch_width = arg_swatch_width
@@ -175,19 +323,24 @@ class AnalyseImage:
 
         # override reduced colors
         if extra_large:
-            colors = list(self.__colors.keys())
-            max_grid_size = self.__get_max_grid_size(colors, swatch_width, grid_spacing)
+            colors = self.__palette
+            source = 'palette'
+            max_grid_size = self.__get_max_grid_size(colors, swatch_width, grid_spacing, limited=not tiled)
 
         self.color_grid = self.__create_grid(colors, grid=grid, text=text,
                                              ordered=ordered, random=random, save=save, suggestions=False,
                                              background=background, arg_swatch_width=swatch_width,
-                                             arg_grid_spacing=grid_spacing, arg_max_grid_size=max_grid_size)
+                                             arg_grid_spacing=grid_spacing, arg_max_grid_size=max_grid_size,
+                                             source=source, output_format=output_format,
+                                             compress_level=compress_level, palette=palette, tiled=tiled)
 
-        return colors
+        return colors.colors()
 
+    @measured('graphic')
     def create_color_suggestions_grid(self, ordered=False, random=False, save=True, grid=50, text=True,
                                       background=(0, 0, 0), extra_large=False, arg_swatch_width=-1,
-                                      arg_grid_spacing=-1):
+                                      arg_grid_spacing=-1, output_format='png', compress_level=6, palette=False,
+                                      tiled=False):
         """
         Creates a grid from the suggestions based on the image
         :param ordered: bool to order colors chromatically, default: False
@@ -199,11 +352,19 @@ class AnalyseImage:
         :param extra_large: overrides the normal max grid size to the full extended range
         :param arg_swatch_width: overrides the object default swatch width
         :param arg_grid_spacing: overrides the object default grid spacing
+        :param output_format: the format the graphic is saved in, 'png', 'webp' or 'webp_lossless', default: 'png'
+        :param compress_level: 0-9, lower saves quicker and larger files, default: 6
+        :param palette: saves the graphic as a palette image when it has at most 256 colors, default: False
+        :param tiled: saves the graphic as a Deep Zoom pyramid of tiles rendered one at a time, with no size limit,
+        default: False, the number of suggestions is still that of the largest grid of a single image
         :return: the list of rgb tuples used to make the grid
         """
         swatch_width = self.__grid_swatch_width
         grid_spacing = self.__grid_spacing
         max_grid_size = self.__grid_max_size
+        if tiled:
+            max_grid_size = self.__get_max_grid_size(self.__reduced_color_key_ordered_list, swatch_width, grid_spacing,
+                                                     output=False, limited=False)
 
         if arg_swatch_width > 0:
             swatch_width = arg_swatch_width
@@ -211,88 +372,325 @@ class AnalyseImage:
             grid_spacing = arg_grid_spacing
 
         if extra_large:
-            max_grid_size = self.__get_max_grid_size(self.__color_suggestions, swatch_width, grid_spacing)
+            max_grid_size = self.__get_max_grid_size(self.__color_suggestions, swatch_width, grid_spacing,
+                                                     limited=not tiled)
 
         self.color_suggestions_grid = self.__create_grid(self.__color_suggestions, grid=grid, text=text,
                                                          ordered=ordered, random=random, save=save, suggestions=True,
                                                          background=background, arg_swatch_width=swatch_width,
-                                                         arg_grid_spacing=grid_spacing, arg_max_grid_size=max_grid_size)
+                                                         arg_grid_spacing=grid_spacing, arg_max_grid_size=max_grid_size,
+                                                         source='suggestions', output_format=output_format,
+                                                         compress_level=compress_level, palette=palette, tiled=tiled)
 
         return self.__color_suggestions
 
-    def create_basic_selection(self, grid_spacing=10, swatch_width=200):
+    @measured('graphic')
+    def create_basic_selection(self, grid_spacing=10, swatch_width=200, concurrent=False, max_workers=None,
+                               output_format='png', compress_level=6, palette=False):
         """
         Creates a basic selection of all graphics for an image
+        :param grid_spacing: overrides the object default grid spacing for the main grids
+        :param swatch_width: overrides the object default swatch width for the main grids
+        :param concurrent: renders and saves the graphics in a pool of worker processes forked from this object, or
+        threads where fork is not available, so the analysis is shared rather than copied for each graphic. The
+        instrumentation records of forked workers are added to this object as each graphic finishes, but the graphic
+        attributes such as color_grid are left unset, as the graphics are not copied back from the workers
+        :param max_workers: the number of workers used when concurrent, default: the number of CPUs
+        :param output_format: the format every graphic is saved in, see create_color_frequency_bars, except frequency
+        bars taller than WebP allows, which are saved as PNG
+        :param compress_level: 0-9, lower saves quicker and larger files, default: 6
+        :param palette: saves graphics with at most 256 colors as palette images, default: False
+        :return: a list of the results of each graphic method, or of futures for them when concurrent
         """
-        self.create_color_frequency_bars()
-        self.create_color_frequency_bars(random=True)
-        self.create_color_frequency_bars(ordered=True)
+        grid_options = {'arg_grid_spacing': grid_spacing, 'arg_swatch_width': swatch_width}
+        large_swatch_options = {'arg_swatch_width': 400, 'arg_grid_spacing': 100}
+        graphics = [
+            (self.create_color_frequency_bars, {}),
+            (self.create_color_frequency_bars, {'random': True}),
+            (self.create_color_frequency_bars, {'ordered': True}),
+
+            (self.create_color_grid, {'random': True, **grid_options}),
+            (self.create_color_grid, {'random': True, 'text': False, **grid_options}),
+            (self.create_color_grid, {'ordered': True, **grid_options}),
+            (self.create_color_grid, {'ordered': True, 'text': False, **grid_options}),
+
+            (self.create_color_suggestions_grid, {'random': True, **grid_options}),
+            (self.create_color_suggestions_grid, {'random': True, 'text': False, **grid_options}),
+            (self.create_color_suggestions_grid, {'ordered': True, **grid_options}),
+            (self.create_color_suggestions_grid, {'ordered': True, 'text': False, **grid_options}),
+
+            (self.create_color_grid, {'grid': 10, 'text': True, **large_swatch_options}),
+            (self.create_color_grid, {'grid': 10, 'text': False, **large_swatch_options}),
+
+            (self.create_color_suggestions_grid, {'grid': 10, 'text': True, **large_swatch_options}),
+            (self.create_color_suggestions_grid, {'grid': 10, 'text': False, **large_swatch_options}),
+        ]
+
+        output_options = {'output_format': output_format, 'compress_level': compress_level, 'palette': palette}
+        graphics = [(function, {**kwargs, **output_options}) for function, kwargs in graphics]
+        # frequency bars too tall for WebP are saved as PNG rather than shortened, so they keep the bar heights of the
+        # analysis
+        if not fits_output_format((2000, self.__target_height), output_format):
+            logger.info('Color Frequency Bars of height {} are too tall for {}, saving them as PNG'
+                        .format(self.__target_height, output_format))
+            for function, kwargs in graphics:
+                if function == self.create_color_frequency_bars:
+                    kwargs['output_format'] = 'png'
+
+        if not concurrent:
+            return [function(**kwargs) for function, kwargs in graphics]
+
+        # the analysis is completed once up front so the workers only render and save
+        self.prepare('reduced_colors', 'multiplier', 'grid_max_size', 'color_suggestions')
+        self.__get_hls_ranks('reduced_colors', self.__reduced_colors)
+        self.__get_hls_ranks('reduced_colors_by_frequency', self.__reduced_color_key_ordered_list)
+        self.__get_hls_ranks('suggestions', self.__color_suggestions)
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers inherit this object instead of it being pickled for each graphic
+            executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('fork'),
+                                           initializer=_set_shared_analysis, initargs=(self,))
+            futures = []
+            for function, kwargs in graphics:
+                future = Future()
+                executor.submit(_create_shared_graphic, function.__name__, kwargs).add_done_callback(
+                    partial(self.__finish_shared_graphic, future))
+                futures.append(future)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            futures = [executor.submit(function, **kwargs) for function, kwargs in graphics]
 
-        self.create_color_grid(random=True, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
-        self.create_color_grid(random=True, text=False, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
-        self.create_color_grid(ordered=True, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
-        self.create_color_grid(ordered=True, text=False, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
+        executor.shutdown(wait=False)
+        return futures
 
-        self.create_color_suggestions_grid(random=True, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
-        self.create_color_suggestions_grid(random=True, text=False, arg_grid_spacing=grid_spacing,
-                                           arg_swatch_width=swatch_width)
-        self.create_color_suggestions_grid(ordered=True, arg_grid_spacing=grid_spacing, arg_swatch_width=swatch_width)
-        self.create_color_suggestions_grid(ordered=True, text=False, arg_grid_spacing=grid_spacing,
-                                           arg_swatch_width=swatch_width)
+    def __finish_shared_graphic(self, future, worker_future):
+        """
+        Completes the future of a graphic created in a worker process with its result, adding the instrumentation
+        records sent back with it
+        :param future: the future returned for the graphic
+        :param worker_future: the future of _create_shared_graphic
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result, records = worker_future.result()
+        except BaseException as error:
+            future.set_exception(error)
+            return
+        self.instrumentation.add_records(records)
+        future.set_result(result)
+
+    def get_color_histogram(self):
+        """
+        Counts the colors of the image, reading them from the cache when they were counted before
+        :return: a ColorHistogram of every color in the image, ordered by appearance, and its frequency
+        """
+        return self.__colors
 
-        self.create_color_grid(grid=10, text=True, arg_swatch_width=400, arg_grid_spacing=100)
-        self.create_color_grid(grid=10, text=False, arg_swatch_width=400, arg_grid_spacing=100)
+    def get_sampling_error(self):
+        """
+        Estimates the error in the reduced color frequencies of a preview analysis from the number of pixels sampled
+        :return: a dictionary of the sample rate, the number of pixels sampled, the mean and maximum standard error of
+        the reduced color frequencies relative to each frequency, and the maximum standard error of a frequency bar
+        height in pixels, all errors 0 when every pixel is read
+        """
+        counts = self.__reduced_colors.counts
+        errors = get_sampling_errors(counts, self.__pixels, self.__pixels_sampled)
+
+        relative_errors = errors / np.maximum(counts, 1)
+        sampling_error = {
+            'sample_rate': self.__sample_rate,
+            'pixels_sampled': self.__pixels_sampled,
+            'mean_relative_error': float(relative_errors.mean()) if len(counts) else 0.0,
+            'max_relative_error': float(relative_errors.max()) if len(counts) else 0.0,
+            'max_bar_height_error': float(errors.max() / (self.__specific_value * self.__multiplier)) if len(counts)
+            else 0.0,
+        }
+        logger.info('Sampled {pixels_sampled} pixels at a rate of {sample_rate} | reduced color frequency error: mean '
+                    '{:.1%}, max {:.1%} | bar height error: max {:.1f} pixels'
+                    .format(sampling_error['mean_relative_error'], sampling_error['max_relative_error'],
+                            sampling_error['max_bar_height_error'], **sampling_error))
+        return sampling_error
+
+    def get_graphic_bytes(self, graphic, output_format='png', compress_level=6, palette=False):
+        """
+        Encodes the graphic last created, without writing a file
+        :param graphic: 'color_frequency_bars', 'color_grid' or 'color_suggestions_grid'
+        :param output_format: 'png', 'webp' or 'webp_lossless', default: 'png'
+        :param compress_level: 0-9, lower encodes quicker and larger, default: 6
+        :param palette: encodes the graphic as a palette image when it has at most 256 colors, default: False
+        :return: the encoded bytes
+        """
+        if graphic not in ('color_frequency_bars', 'color_grid', 'color_suggestions_grid'):
+            raise ValueError('Unknown graphic: {}'.format(graphic))
+        image = getattr(self, graphic)
+        if image is None:
+            raise ValueError('The {} graphic has not been created'.format(graphic))
+        return encode_image(image, output_format, compress_level, palette)
+
+    def prepare(self, *stages):
+        """
+        Calculates analysis stages before any graphic needs them, each after the stages it depends on
+        :param stages: the names of the stages, keys of the stage dependency graph, default: every stage
+        """
+        for stage in stages or self.__stage_dependencies:
+            self.__prepare_stage(stage)
+
+    def __prepare_stage(self, stage):
+        """Calculates the stages a stage depends on and then the stage itself, if not already calculated"""
+        if stage not in self.__stage_dependencies:
+            raise ValueError('Unknown analysis stage: {}'.format(stage))
+        for dependency in self.__stage_dependencies[stage]:
+            self.__prepare_stage(dependency)
+        getattr(self, '_AnalyseImage__{}'.format(stage))
+
+    @cached_property
+    def __path(self):
+        """The Results directory for the graphics of the image, created when the first graphic is saved"""
+        path = os.path.join(self.__results_directory, self.__name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @cached_property
+    @measured('stage')
+    def __colors(self):
+        """A histogram of every color in the image, ordered by appearance, and its frequency"""
+        if self.__histogram is not None:
+            colors = self.__histogram
+        else:
+            logger.info('{}: 1. Parsing pixels'.format(self.__name))
+            colors = self.__load_data('im_color', self.__parse_pixels, use_cache=self.__use_cache,
+                                      cache_parameters=self.__sample_parameters)
+        self.instrumentation.count(pixels=self.__pixels, unique_colors=len(colors))
+        return colors
 
-        self.create_color_suggestions_grid(grid=10, text=True, arg_swatch_width=400, arg_grid_spacing=100)
-        self.create_color_suggestions_grid(grid=10, text=False, arg_swatch_width=400, arg_grid_spacing=100)
+    @cached_property
+    @measured('stage')
+    def __palette(self):
+        """The colors of the image merged into a palette when quantizing, otherwise every color of the image"""
+        if self.__quantize is None:
+            return self.__colors
+        logger.info('1.1. Quantizing colors: {}'.format(self.__quantize))
+        palette = self.__load_data('im_palette', self.__quantize_colors, use_cache=self.__use_cache,
+                                   cache_parameters=self.__palette_parameters)
+        self.instrumentation.count(palette_colors=len(palette))
+        return palette
+
+    @cached_property
+    @measured('stage')
+    def __is_greyscale(self):
+        """Whether every color of the image is grey"""
+        logger.info('2. Checking if the image is greyscale')
+        return self.__check_if_greyscale()
+
+    @cached_property
+    @measured('stage')
+    def __reduced_colors(self):
+        """A histogram of the colors frequent enough to appear at the target height and their frequency"""
+        logger.info('3. Creating color data')
+        reduced_colors = self.__load_data('im_refinedColor', self.__refine_color_data, use_cache=self.__use_cache,
+                                          cache_parameters={'target_height': self.__target_height,
+                                                            **self.__palette_parameters})
+        self.instrumentation.count(reduced_colors=len(reduced_colors))
+        return reduced_colors
+
+    @cached_property
+    @measured('stage')
+    def __refinement_index(self):
+        """The frequencies of the palette sorted once, from which the reduced colors of any target height are found"""
+        return RefinementIndex(self.__palette)
+
+    @cached_property
+    @measured('stage')
+    def __multiplier(self):
+        """The multiplier of the specific value used for the reduced colors, set when they are calculated"""
+        logger.info('3.1. Finding the multiplier of cached color data')
+        return self.__refinement_index.get_multiplier(self.__specific_value, self.__target_height)
+
+    @cached_property
+    @measured('stage')
+    def __reduced_color_key_ordered_list(self):
+        """The reduced colors for grids, in descending order of frequency"""
+        return self.__reduced_colors.sort_by_count()
+
+    @cached_property
+    @measured('stage')
+    def __grid_max_size(self):
+        """The normal maximum number of grid rows/columns"""
+        grid_max_size = self.__get_max_grid_size(self.__reduced_color_key_ordered_list, self.__grid_swatch_width,
+                                                 self.__grid_spacing, output=False)
+        logger.info('4. The normal maximum grid size is {}'.format(grid_max_size))
+        return grid_max_size
+
+    @cached_property
+    @measured('stage')
+    def __grid_extended_max_size(self):
+        """The maximum number of grid rows/columns using every color of the image, or of its quantized palette"""
+        return self.__get_max_grid_size(self.__palette, self.__grid_swatch_width, self.__grid_spacing,
+                                        output=False)
+
+    @cached_property
+    @measured('stage')
+    def __color_suggestions(self):
+        """The suggested colors for the image, enough to fill the extended maximum grid"""
+        logger.info('5. Gathering {} suggestions'.format(self.__grid_extended_max_size))
+        number_requested = self.__grid_extended_max_size * self.__grid_extended_max_size
+        suggestions = self.__load_data('im_suggestions', suggestions_algorithm, use_cache=self.__use_cache,
+                                       cache_parameters={'number_requested': number_requested,
+                                                         **self.__palette_parameters},
+                                       colour_dict=self.__palette, number_requested=number_requested)
+        self.instrumentation.count(suggestions=len(suggestions))
+        return suggestions
 
     def __parse_pixels(self):
-        """Creates a dictionary of its colours, ordered by appearance, and their frequency for the image object"""
-        # converts the image to rgb colour space
-        self.__im.convert("RGB")
-
-        # initialises a new dictionary
-        colors = {}
-
-        print("{} pixels".format(self.__im.width * self.__im.height))
-        # iterates through all the pixels in the image by column and then row
-        for x in range(self.__im.width):
-            for y in range(self.__im.height):
-                # if the colour is already in the dictionary then the frequency value is incremented by 1
-                if self.__im.getpixel((x, y)) in colors:
-                    colors[self.__im.getpixel((x, y))] += 1
-                else:
-                    # otherwise a new key is made in the dictionary for the colour
-                    colors[self.__im.getpixel((x, y))] = 1
-        return colors
+        """Creates a histogram of its colours, ordered by appearance, and their frequency for the image object"""
+        logger.info("{} pixels".format(self.__pixels))
+        if self.__sample_rate < 1:
+            logger.info("Preview: sampling {} pixels".format(self.__pixels_sampled))
+            self.instrumentation.count(sampled_pixels=self.__pixels_sampled)
+            return sample_pixels(self.__im, self.__sample_rate)
+        if self.__tile_pixels:
+            return parse_pixels_in_tiles(self.__im, self.__tile_pixels)
+        return parse_pixels(self.__im)
+
+    def __quantize_colors(self):
+        """Merges the colors of the image into a palette, returning a histogram of palette color and frequency"""
+        palette = quantize_colors(self.__colors, self.__quantize, palette_size=self.__palette_size,
+                                  bits=self.__quantize_bits)
+        logger.info('{} colors merged into {} palette colors'.format(len(self.__colors), len(palette)))
+        return palette
 
     def __refine_color_data(self):
         """Refines the color data to the resolution of the specific value, reducing the multiplier to fill the target
-        height - returning a dictionary of the color rgba(255, 255, 255, 255) and frequency """
-        # iterates over the dictionary of colours and removes all with less than the minimum frequency for one pixel
-        self.__multiplier = 1.002
-        graphic_height = 0
-        reduced_colours = {}
-
-        while graphic_height < self.__target_height:
-            reduced_colours = {}
-            graphic_height = 0
-            self.__multiplier -= 0.002
-            """iterates over the dictionary of colours and creates a reduced set with all colours occupying at least one 
-            pixel based on the multiplied specific_value"""
-            for key, value in list(self.__colors.items()):
-                if self.__colors[key] >= math.floor(self.__specific_value * self.__multiplier):
-                    reduced_colours[key] = value
-                    # calculate the height which will be occupied in the graphic
-                    frequency = math.floor(value / (self.__specific_value * self.__multiplier))
-                    if frequency == 0:
-                        frequency = 1
-                    graphic_height += frequency
-
+        height - returning a histogram of the color rgba(255, 255, 255, 255) and frequency """
+        reduced_colours, self.__multiplier = self.__refinement_index.refine(self.__specific_value,
+                                                                            self.__target_height)
         return reduced_colours
 
+    def __get_specific_value(self, target_height):
+        """Calculates the frequency required to occupy one pixel of a target height"""
+        return math.ceil(self.__pixels / target_height)
+
+    def __get_refinement(self, target_height):
+        """
+        Finds the reduced colors of frequency bars of a target height, the target height of the object using the
+        cached stages and other heights the refinement index
+        :param target_height: the height of the graphic in pixels
+        :return: a tuple of the reduced ColorHistogram, the specific value and the multiplier
+        """
+        if target_height == self.__target_height:
+            return self.__reduced_colors, self.__specific_value, self.__multiplier
+        if target_height not in self.__refinements:
+            specific_value = self.__get_specific_value(target_height)
+            with self.instrumentation.measure('refinement', 'stage', image=self.filename, target_height=target_height):
+                reduced_colors, multiplier = self.__refinement_index.refine(specific_value, target_height)
+                self.instrumentation.count(reduced_colors=len(reduced_colors))
+            self.__refinements[target_height] = (reduced_colors, specific_value, multiplier)
+        return self.__refinements[target_height]
+
     def __create_grid(self, colors, grid=50, text=True, ordered=False, random=False, save=True, suggestions=False,
-                      background=(0, 0, 0), arg_swatch_width=-1, arg_grid_spacing=-1, arg_max_grid_size=-1):
+                      background=(0, 0, 0), arg_swatch_width=-1, arg_grid_spacing=-1, arg_max_grid_size=-1,
+                      source=None, output_format='png', compress_level=6, palette=False, tiled=False):
         """
         Creates a grid image from the supplied colors
         :param colors: a list of rgb color tuples in the format (r, g, b) 0-255
@@ -305,8 +703,14 @@ class AnalyseImage:
         :param arg_swatch_width: a swatch width int can be passed to override the object swatch width
         :param arg_grid_spacing: a grid spacing int can be passed to override the object grid spacing
         :param arg_max_grid_size: a max grid size int can be passed to override the object max grid size
-        :return: an Image object with the color grid drawn on it
+        :param source: the name the chromatic ranks of the colors are kept under, see __get_hls_ranks
+        :param output_format: the format the graphic is saved in
+        :param compress_level: the compression level the graphic is saved with
+        :param palette: a bool whether to save the graphic as a palette image when it has at most 256 colors
+        :param tiled: a bool whether to save the graphic as a Deep Zoom pyramid with no size limit
+        :return: an Image object with the color grid drawn on it, or None for a tiled graphic
         """
+        self.__check_tiled(tiled, save)
         # grid variables
         swatch_width = self.__grid_swatch_width
         grid_spacing = self.__grid_spacing
@@ -328,142 +732,171 @@ class AnalyseImage:
             if grid > self.__grid_max_size:
                 grid = self.__grid_max_size
 
-        print('\nCreating Color Grid for {} | ordered: {} | random: {} | grid: {} | text: {} | '
-              'background: {} | save: {}'.format(self.__im.filename.split('/')[-1].split('.')[0], ordered, random, grid,
-                                                 text, background, save))
+        logger.info('Creating Color Grid for {} | ordered: {} | random: {} | grid: {} | text: {} | '
+                    'background: {} | save: {}'.format(self.__name, ordered, random, grid, text, background, save))
 
-        # randomise colors
+        # selects colors by index so the shared list keeps its order and the ranks of the selection can be looked up
+        indices = list(range(len(colors)))
         if random:
-            shuffle(colors)
-            colors = colors[:grid * grid]
-        else:
-            colors = colors[:grid * grid]
+            shuffle(indices)
+        indices = indices[:grid * grid]
 
         # order colors
         if ordered:
-            colors = self.__sort_colors_by_hsl(colors)
+            indices = order_by_ranks(indices, self.__get_hls_ranks(source, colors)[indices])
+
+        if isinstance(colors, ColorHistogram):
+            colors = colors.take(indices).colors()
+        else:
+            colors = [colors[index] for index in indices]
 
         # Create image file
         length = (grid * swatch_width) + ((grid + 1) * grid_spacing)
-        if length > self.__max_length:
+        if length > self.__max_length and not tiled:
             length = self.__max_length
-        grid_graphic = Image.new("RGB", (length, length), color=background)
-        draw = ImageDraw.Draw(grid_graphic)
-
-        # variables for drawing
-        x = 0
-        y = grid_spacing
-        count = 0
-
-        # Draw grid
-        for color in colors:
-            x += grid_spacing
-            draw.rectangle([(x, y), (x + swatch_width, y + swatch_width)],
-                           fill='rgb' + str(color[:3]))
-            if text:
-                draw.text((x + 5, y + 5), str(color[:3]), fill=self.__choose_text_contrast_color(color[:3]))
-            x += swatch_width
-            count += 1
-
-            # starts a new line if count reaches full width
-            if count >= grid:
-                count = 0
-                x = 0
-                y += (swatch_width + grid_spacing)
+        if save and not tiled:
+            check_output_size((length, length), output_format)
 
         # Save the image
         if suggestions:
             type_string = '_suggestions'
         else:
             type_string = ''
+        name = '{}{}_ordered{}_random{}_grid{}_text{}_background{}_color_grid'.format(
+            self.__name, type_string, ordered, random, grid, text, background)
+        text_color = self.__choose_text_contrast_color if text else None
 
+        # Draw grid
+        self.instrumentation.count(colors=len(colors))
+        if tiled:
+            self.__save_pyramid(lambda region: render_grid(colors, grid, swatch_width, grid_spacing, length,
+                                                           background=background, text_color=text_color,
+                                                           region=region),
+                                length, length, 'Color {} Grid'.format(type_string), name, output_format,
+                                compress_level, palette)
+            logger.info('Color {} Grid: Finished'.format(type_string))
+            return None
+
+        grid_graphic = render_grid(colors, grid, swatch_width, grid_spacing, length, background=background,
+                                   text_color=text_color)
         if save:
-            grid_graphic.save(
-                '{}/{}{}_ordered{}_random{}_grid{}_text{}_background{}_color_grid.png'
-                .format(self.__path, self.__im.filename.split('/')[-1].split('.')[0], type_string, ordered, random,
-                        grid, text, background), 'PNG')
-            print(
-                'Color {} Grid saved to the Results directory: {}{}_ordered{}_random{}_grid{}_text{}'
-                '_background{}_color_grid.png'.format(type_string, self.__im.filename.split('/')[-1].split('.')[0],
-                                                      type_string, ordered, random, grid, text, background))
-
-        print('Color {} Grid: Finished'.format(type_string))
+            self.__save_graphic(grid_graphic, 'Color {} Grid'.format(type_string), name, output_format, compress_level,
+                                palette)
+
+        logger.info('Color {} Grid: Finished'.format(type_string))
         return grid_graphic
 
+    def __save_graphic(self, graphic, description, name, output_format, compress_level, palette):
+        """
+        Saves a graphic to the Results directory of the image, unless the image has no results directory
+        :param graphic: an Image object
+        :param description: the name of the graphic type for messages
+        :param name: the file name without its extension
+        :param output_format: 'png', 'webp' or 'webp_lossless'
+        :param compress_level: 0-9, the compression level
+        :param palette: a bool whether to save the graphic as a palette image when it has at most 256 colors
+        """
+        if self.__results_directory is None:
+            return
+        filename = '{}.{}'.format(name, get_output_format(output_format)[1])
+        save_image(graphic, '{}/{}'.format(self.__path, filename), output_format, compress_level, palette)
+        logger.info('{} saved to the Results directory: {}'.format(description, filename))
+
+    def __save_pyramid(self, render_region, width, height, description, name, output_format, compress_level,
+                       palette):
+        """
+        Saves a graphic as a Deep Zoom pyramid in the Results directory of the image, see pyramid.save_deep_zoom
+        :param render_region: a function returning an Image of a (left, top, right, bottom) box of the graphic
+        :param width: the width of the graphic
+        :param height: the height of the graphic
+        :param description: the name of the graphic type for messages
+        :param name: the name of the .dzi descriptor and _files directory
+        """
+        with self.instrumentation.measure('save_pyramid', 'stage', image=self.filename):
+            save_deep_zoom(render_region, width, height, os.path.join(self.__path, name), output_format,
+                           compress_level, palette)
+            self.instrumentation.count(pixels=width * height)
+        logger.info('{} saved to the Results directory as tiles: {}.dzi'.format(description, name))
+
+    def __check_tiled(self, tiled, save):
+        """Checks that a tiled graphic, which is only written as files, can be saved"""
+        if tiled and (not save or self.__results_directory is None):
+            raise ValueError('Tiled graphics are written to the results directory, so they need save=True and a '
+                             'results_directory')
+
     def __check_if_greyscale(self):
         """
-        Iterates through all the colors in the image color dictionary and returns True if they are all greyscale
+        Checks all the colors in the image color histogram and returns True if they are all greyscale
         :return: True if the image is greyscale
         """
-        for color in self.__colors:
-            if color[0] != color[1] != color[2]:
-                return False
-        return True
+        # single band and greyscale with alpha images have no color channels to compare
+        if self.__colors.bands < 3:
+            return True
+        channels = self.__colors.channels()
+        return not np.any((channels[:, 0] != channels[:, 1]) & (channels[:, 1] != channels[:, 2]))
 
-    def __load_data(self, type_string, function, use_cache=True, **kwargs):
+    def __load_data(self, type_string, function, use_cache=True, cache_parameters=None, **kwargs):
         """
         Loads data from cache files if present or creates files to improve efficiency
         :param type_string: a string for the sub-folder to be called
         :param function: a function to be called to generate the data to be dumped to the file
         :param use_cache: skips the caching process and calculates data from scratch regardless
+        :param cache_parameters: a dictionary of the parameters which change the result of the function
         :param kwargs: takes arguments for functions requiring arguments
         :return: the data which has been retrieved or generated
         """
         # bypass cache
         if not use_cache:
-            if type_string == 'im_suggestions':
-                return function(colour_dict=kwargs['colour_dict'], number_requested=kwargs['number_requested'])
-            else:
-                return function()
-
-        # Check temp folder exists
-        if not os.path.exists('./imageinterpreter_cache'):
-            os.mkdir('./imageinterpreter_cache')
-
-        # Check sub-folder exists
-        if not os.path.exists('./imageinterpreter_cache/{}'.format(type_string)):
-            os.mkdir('./imageinterpreter_cache/{}'.format(type_string))
-
-        # Check file exists
-        if os.path.exists('./imageinterpreter_cache/{}/{}'.format(type_string, self.__im.filename.split('/')[-1]
-                                                                  .split('.')[0])):
-            infile = bz2.BZ2File('./imageinterpreter_cache/{}/{}'.format(type_string, self.__im.filename.split('/')[-1]
-                                                                         .split('.')[0]), 'r')
-            data = pickle.load(infile)
-            infile.close()
-
-        # Create temp file
+            self.instrumentation.set_cache('disabled')
+            return function(**kwargs)
+
+        # the key covers the image contents, the algorithm version and the parameters used by the stage
+        if self.__content_hash is None:
+            self.__content_hash = self.__get_content_hash()
+        key = self.__cache.get_key(self.__content_hash, type_string, self.__stage_versions[type_string],
+                                   **(cache_parameters or {}))
+
+        # color histograms are stored in a binary format which is quicker to read
+        if type_string in self.__histogram_stages:
+            found, data = self.__cache.load_histogram(type_string, key)
         else:
-            outfile = bz2.BZ2File('./imageinterpreter_cache/{}/{}'.format(type_string,
-                                                                          self.__im.filename.split('/')[-1]
-                                                                          .split('.')[0]), 'w')
+            found, data = self.__cache.load(type_string, key)
 
-            if type_string == 'im_suggestions':
-                data = function(colour_dict=kwargs['colour_dict'], number_requested=kwargs['number_requested'])
+        self.instrumentation.set_cache('hit' if found else 'miss')
+        if not found:
+            data = function(**kwargs)
+            if type_string in self.__histogram_stages:
+                self.__cache.save_histogram(type_string, key, data)
             else:
-                data = function()
-
-            pickle.dump(data, outfile)
-            outfile.close()
+                self.__cache.save(type_string, key, data)
 
         return data
 
-    def __get_max_grid_size(self, data, swatch_width, grid_spacing, output=True):
+    def __get_content_hash(self):
+        """Hashes the source file, the encoded bytes or the pixels of an image in memory, or the source histogram"""
+        if self.__histogram is not None:
+            return get_histogram_hash(self.__histogram)
+        if self.__source_path is not None:
+            return get_file_hash(self.__source_path)
+        if self.__source_bytes is not None:
+            return get_bytes_hash(self.__source_bytes)
+        return get_image_hash(self.__im)
+
+    def __get_max_grid_size(self, data, swatch_width, grid_spacing, output=True, limited=True):
         """
         Calculates the maximum number of grid rows/columns
         :param data: a data structure with a length
         :param swatch_width: an integer width for each swatch
+        :param limited: limits the grid to the max length of a graphic, which tiled graphics do not have
         :return: an integer max number of rows/columns
         """
-        if output:
-            print('\n')
         max_grid_size = math.floor(math.sqrt(len(data)))
-        if max_grid_size * (swatch_width + grid_spacing) > self.__max_length:
+        if limited and max_grid_size * (swatch_width + grid_spacing) > self.__max_length:
             if output:
-                print('The grid size was limited by a max width of: {}'.format(self.__max_length))
+                logger.info('The grid size was limited by a max width of: {}'.format(self.__max_length))
             max_grid_size = math.floor(self.__max_length / (swatch_width + grid_spacing))
         if output:
-            print('The grid max size is: {}'.format(max_grid_size))
+            logger.info('The grid max size is: {}'.format(max_grid_size))
 
         return max_grid_size
 
@@ -482,63 +915,14 @@ class AnalyseImage:
 
         return text_colour
 
-    @staticmethod
-    def __sort_colors_by_hsl(color_key_list):
+    def __get_hls_ranks(self, source, colors):
         """
-        Sorts colors by HSL
-        :param color_key_list: a list of color tuples in the format (r, g, b) 0-255
-        :return: a sorted list of color tuples in the format (r, g, b) 0-255
+        Ranks a list of colors chromatically by HSL, once for each object
+        :param source: the name of the list of colors, 'reduced_colors', 'reduced_colors_by_frequency', 'palette' or
+        'suggestions'
+        :param colors: the list of colors, always the same list for a name
+        :return: an array of the rank of each color in the list
         """
-        # convert 0-255 colours to 0-1 float
-        color_float_list = list()
-        for elem in color_key_list:
-            new_colour = []
-            for x in range(3):
-                new_colour.append(elem[x] / 255.0)
-            color_float_list.append(new_colour)
-
-        # sorts colors
-        color_float_list.sort(key=lambda rgb: colorsys.rgb_to_hls(*rgb))
-
-        # converts sorted floats to 0-255 integers
-        sorted_color_key_list = []
-        for elem in color_float_list:
-            new_colour = []
-            for colour_value in elem:
-                new_colour.append(int(colour_value * 255))
-            sorted_color_key_list.append(tuple(new_colour))
-
-        return sorted_color_key_list
-
-    @staticmethod
-    def __sort_dictionary_colors_by_hsl(color_dictionary):
-        """
-        Orders a dictionary of rgb(tuple), frequency chromatically by HSL
-        :param color_dictionary: a dictionary of key rgb tuple and any value
-        :return: a sorted dictionary of rgb tuple and value from input dictionary
-        """
-        # convert 0-255 colours to 0-1 float
-        color_float_list = list()
-        for key, value in color_dictionary.items():
-            new_colour = []
-            for x in range(3):
-                new_colour.append(key[x] / 255.0)
-            color_float_list.append(new_colour)
-
-        # sorts colors
-        color_float_list.sort(key=lambda rgb: colorsys.rgb_to_hls(*rgb))
-
-        # converts sorted floats to 0-255 integers
-        sorted_color_key_dictionary = {}
-        for elem in color_float_list:
-            new_colour = []
-            for colour_value in elem:
-                new_colour.append(int(colour_value * 255))
-            try:
-                sorted_color_key_dictionary[tuple(new_colour)] = color_dictionary[tuple(new_colour)]
-            except KeyError:
-                # Allow RGBA tuple
-                new_colour.append(255)
-                sorted_color_key_dictionary[tuple(new_colour)] = color_dictionary[tuple(new_colour)]
-
-        return sorted_color_key_dictionary.items()
+        if source not in self.__hls_ranks:
+            self.__hls_ranks[source] = get_hls_ranks(colors)
+        return self.__hls_ranks[source]
@@ -0,0 +1,46 @@
+"""Chromatic ordering of colors by their HLS values, calculated for whole lists of colors at once"""
+import numpy as np
+from colorspace import rgb_to_hls
+from histogram import ColorHistogram
+
+
+def get_hls_keys(colors):
+    """
+    Calculates the HLS sort key of each color, identical to colorsys.rgb_to_hls of the color as 0-1 floats
+    :param colors: a list of color tuples whose first three values are r, g, b 0-255, extra values are ignored, or a
+    ColorHistogram
+    :return: a tuple of hue, lightness and saturation arrays
+    """
+    if isinstance(colors, ColorHistogram):
+        rgb = colors.channels()[:, :3]
+    else:
+        rgb = np.array([color[:3] for color in colors], dtype=np.int64).reshape(-1, 3)
+    return rgb_to_hls(*(rgb[:, channel] / 255.0 for channel in range(3)))
+
+
+def get_hls_ranks(colors):
+    """
+    Ranks colors chromatically, so that any selection of them can be ordered without calculating their keys again
+    :param colors: a list of color tuples in the format (r, g, b, ...) 0-255, or a ColorHistogram
+    :return: an array of the rank of each color, equal for colors with equal keys
+    """
+    hue, lightness, saturation = get_hls_keys(colors)
+    order = np.lexsort((saturation, lightness, hue))
+
+    keys = np.stack((hue, lightness, saturation), axis=1)[order]
+    new_key = np.ones(len(order), dtype=bool)
+    new_key[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.cumsum(new_key) - 1
+    return ranks
+
+
+def order_by_ranks(items, ranks):
+    """
+    Orders a selection of items by their ranks from get_hls_ranks
+    :param items: a list of items
+    :param ranks: an array of the rank of each item
+    :return: a list of the items in chromatic order, items with equal ranks keeping their order
+    """
+    return [items[index] for index in np.argsort(ranks, kind='stable').tolist()]
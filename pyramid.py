@@ -0,0 +1,105 @@
+"""Deep Zoom tile pyramids of graphics too large to hold in memory, rendered and saved one tile at a time"""
+import os
+import math
+from PIL import Image
+from rendering import save_image, get_output_format
+
+# the width and height of each tile and the pixels it shares with each neighbour, the Deep Zoom defaults
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+
+
+def save_deep_zoom(render_region, width, height, path, output_format='png', compress_level=6, palette=False,
+                   tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """
+    Saves a graphic as a Deep Zoom pyramid: a <path>.dzi descriptor and a <path>_files directory with a directory of
+    tiles for each level, the last level being the full graphic and each level before it half the size. The full size
+    tiles are rendered one at a time and each smaller tile is reduced from the saved tiles of the level above, so the
+    memory used depends on the tile size and not on the size of the graphic
+    :param render_region: a function taking a (left, top, right, bottom) box of the graphic and returning an RGB Image
+    of that region
+    :param width: the width of the graphic
+    :param height: the height of the graphic
+    :param path: the path of the pyramid without an extension
+    :param output_format: the format of the tiles, see rendering.OUTPUT_FORMATS, default: 'png'
+    :param compress_level: 0-9, lower saves quicker and larger tiles, default: 6
+    :param palette: saves PNG tiles with at most 256 colors as palette images, default: False
+    :param tile_size: the width and height of each tile without its overlap
+    :param overlap: the number of pixels each tile repeats from its neighbours
+    :return: the path of the .dzi descriptor
+    """
+    if width < 1 or height < 1:
+        raise ValueError('A pyramid needs a graphic of at least 1x1 pixels: {}x{}'.format(width, height))
+    _, extension, _ = get_output_format(output_format)
+    tiles_path = '{}_files'.format(path)
+    levels = get_level_sizes(width, height)
+
+    for level in range(len(levels) - 1, -1, -1):
+        level_width, level_height = levels[level]
+        level_path = os.path.join(tiles_path, str(level))
+        os.makedirs(level_path, exist_ok=True)
+        for row in range(math.ceil(level_height / tile_size)):
+            for column in range(math.ceil(level_width / tile_size)):
+                left, top, right, bottom = get_tile_box(column, row, level_width, level_height, tile_size, overlap)
+                if level == len(levels) - 1:
+                    tile = render_region((left, top, right, bottom))
+                else:
+                    # each pixel is the mean of a 2x2 block of the level above, which starts on an even pixel
+                    upper_width, upper_height = levels[level + 1]
+                    box = (2 * left, 2 * top, min(2 * right, upper_width), min(2 * bottom, upper_height))
+                    tile = read_region(tiles_path, level + 1, levels[level + 1], box, extension, tile_size,
+                                       overlap).reduce(2)
+                save_image(tile, os.path.join(level_path, '{}_{}.{}'.format(column, row, extension)), output_format,
+                           compress_level, palette)
+
+    descriptor = '{}.dzi'.format(path)
+    with open(descriptor, 'w') as outfile:
+        outfile.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{}" Overlap="{}" '
+                      'TileSize="{}">\n  <Size Width="{}" Height="{}"/>\n</Image>\n'
+                      .format(extension, overlap, tile_size, width, height))
+    return descriptor
+
+
+def get_level_sizes(width, height):
+    """
+    Calculates the size of each level of a pyramid, from 1x1 pixels up to the full graphic
+    :param width: the width of the graphic
+    :param height: the height of the graphic
+    :return: a list of (width, height) tuples, indexed by level
+    """
+    max_level = (max(width, height) - 1).bit_length()
+    return [(-(-width // (1 << (max_level - level))), -(-height // (1 << (max_level - level))))
+            for level in range(max_level + 1)]
+
+
+def get_tile_box(column, row, width, height, tile_size, overlap):
+    """
+    Calculates the region of a level covered by a tile, including the overlap with its neighbours
+    :return: a (left, top, right, bottom) box
+    """
+    return (max(column * tile_size - overlap, 0), max(row * tile_size - overlap, 0),
+            min((column + 1) * tile_size + overlap, width), min((row + 1) * tile_size + overlap, height))
+
+
+def read_region(tiles_path, level, size, box, extension, tile_size, overlap):
+    """
+    Assembles a region of a level from its saved tiles, reading only the tiles the region covers
+    :param tiles_path: the _files directory of the pyramid
+    :param level: the level read
+    :param size: the (width, height) of the level
+    :param box: the (left, top, right, bottom) region of the level
+    :return: an RGB Image object of the region
+    """
+    left, top, right, bottom = box
+    region = Image.new('RGB', (right - left, bottom - top))
+    for row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+        for column in range(left // tile_size, (right - 1) // tile_size + 1):
+            tile_left, tile_top, _, _ = get_tile_box(column, row, size[0], size[1], tile_size, overlap)
+            # the part of the region in the tile, without the overlap read from its neighbours
+            part = (max(left, column * tile_size), max(top, row * tile_size),
+                    min(right, (column + 1) * tile_size), min(bottom, (row + 1) * tile_size))
+            with Image.open(os.path.join(tiles_path, str(level), '{}_{}.{}'.format(column, row, extension))) as tile:
+                region.paste(tile.convert('RGB').crop((part[0] - tile_left, part[1] - tile_top, part[2] - tile_left,
+                                                       part[3] - tile_top)), (part[0] - left, part[1] - top))
+    return region
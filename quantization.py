@@ -0,0 +1,152 @@
+"""Quantization of color histograms into a bounded palette, merging the frequencies of similar colors"""
+import heapq
+import itertools
+import numpy as np
+from histogram import ColorHistogram, as_color_histogram, pack_colors
+
+QUANTIZATION_METHODS = ('bits', 'median_cut', 'kmeans')
+
+
+def quantize_colors(colors, method='median_cut', palette_size=256, bits=5, iterations=10):
+    """
+    Merges the colors of a histogram into a palette, each palette color being the frequency weighted mean of the
+    colors merged into it
+    :param colors: a ColorHistogram with 8 bit channels, as created by parse_pixels, or a dictionary of color:
+    frequency
+    :param method: 'bits' to reduce the bit depth of every channel, 'median_cut' to split the colors into boxes of
+    similar frequency or 'kmeans' to cluster the colors starting from the median cut palette
+    :param palette_size: the maximum number of colors for median_cut and kmeans
+    :param bits: the number of bits kept for each channel by the bits method, 1-8
+    :param iterations: the maximum number of k-means iterations
+    :return: a ColorHistogram of palette color: total frequency, ordered by the first appearance of any of its colors
+    """
+    if method not in QUANTIZATION_METHODS:
+        raise ValueError('Unknown quantization method: {}, use one of {}'.format(method, QUANTIZATION_METHODS))
+    colors = as_color_histogram(colors)
+    if len(colors) == 0:
+        return colors
+
+    channels = colors.channels()
+    if channels.min() < 0 or channels.max() > 0xFF:
+        raise ValueError('Quantization requires 8 bit color channels')
+    weights = colors.counts
+
+    if method == 'bits':
+        labels = get_bit_labels(channels, bits)
+    else:
+        labels = get_median_cut_labels(channels, weights, palette_size)
+        if method == 'kmeans':
+            labels = get_kmeans_labels(channels, weights, labels, iterations)
+
+    # colors whose weighted means round to the same color are merged, as are their frequencies
+    palette = np.rint(get_weighted_means(channels, weights, labels)).astype(np.int64)[labels]
+    palette_keys = np.zeros(len(palette), dtype=np.int64)
+    for channel in range(palette.shape[1]):
+        palette_keys = (palette_keys << 8) | palette[:, channel]
+    _, first_index, inverse = np.unique(palette_keys, return_index=True, return_inverse=True)
+    frequencies = np.bincount(inverse.reshape(-1), weights=weights).astype(np.int64)
+
+    order = np.argsort(first_index, kind='stable')
+    palette_colors = palette[first_index[order]]
+    if colors.bands == 0:
+        packed = palette_colors[:, 0].astype(colors.packed.dtype)
+    else:
+        packed = pack_colors(palette_colors, colors.bands)
+    return ColorHistogram(packed, frequencies[order], colors.bands)
+
+
+def get_bit_labels(channels, bits):
+    """
+    Groups colors which are identical in the highest bits of every channel
+    :param channels: an (n, bands) integer array of colors
+    :param bits: the number of bits kept for each channel, 1-8
+    :return: an array of the group of each color
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError('The number of bits must be 1-8: {}'.format(bits))
+    reduced = channels >> (8 - bits)
+    keys = np.zeros(len(channels), dtype=np.int64)
+    for channel in range(channels.shape[1]):
+        keys = (keys << bits) | reduced[:, channel]
+    return np.unique(keys, return_inverse=True)[1].reshape(-1)
+
+
+def get_median_cut_labels(channels, weights, palette_size):
+    """
+    Splits the colors into boxes, each time cutting the box with the widest channel range at the weighted median of
+    that channel, until there are palette_size boxes or no box can be cut
+    :param channels: an (n, bands) integer array of colors
+    :param weights: an array of the frequency of each color
+    :param palette_size: the maximum number of boxes
+    :return: an array of the box of each color
+    """
+    if palette_size < 1:
+        raise ValueError('The palette size must be at least 1: {}'.format(palette_size))
+    # a heap of the boxes by their widest channel range, ties taken in the order the boxes were made
+    boxes = []
+    made = itertools.count()
+    _push_box(boxes, np.arange(len(channels)), channels, made)
+    while len(boxes) < palette_size and -boxes[0][0] > 0:
+        _, _, channel, box = heapq.heappop(boxes)
+        box = box[np.argsort(channels[box, channel], kind='stable')]
+        values = channels[box, channel]
+        cumulative = np.cumsum(weights[box])
+        cut = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+        # cut between different values so that identical channel values stay in one box
+        cut = int(np.searchsorted(values, values[cut], side='right'))
+        if cut == len(box):
+            cut = int(np.searchsorted(values, values[-1], side='left'))
+        _push_box(boxes, box[:cut], channels, made)
+        _push_box(boxes, box[cut:], channels, made)
+
+    labels = np.empty(len(channels), dtype=np.int64)
+    for label, (_, _, _, box) in enumerate(boxes):
+        labels[box] = label
+    return labels
+
+
+def _push_box(boxes, box, channels, made):
+    """Adds a box of colors to the heap of boxes, keyed by its widest channel range and then the order it was made"""
+    ranges = np.ptp(channels[box], axis=0)
+    heapq.heappush(boxes, (-int(ranges.max()), next(made), int(np.argmax(ranges)), box))
+
+
+def get_kmeans_labels(channels, weights, labels, iterations, chunk_size=8192):
+    """
+    Refines groups of colors with weighted k-means, moving each color to its nearest group mean until no color moves
+    :param channels: an (n, bands) integer array of colors
+    :param weights: an array of the frequency of each color
+    :param labels: an array of the initial group of each color
+    :param iterations: the maximum number of iterations
+    :param chunk_size: the number of colors measured against every mean at a time, which bounds the memory used
+    :return: an array of the group of each color
+    """
+    points = channels.astype(float)
+    for _ in range(iterations):
+        means = get_weighted_means(channels, weights, labels)
+        squared_means = (means ** 2).sum(axis=1)
+        new_labels = np.empty_like(labels)
+        for start in range(0, len(points), chunk_size):
+            chunk = points[start:start + chunk_size]
+            distances = squared_means[None, :] - 2 * chunk @ means.T
+            new_labels[start:start + chunk_size] = np.argmin(distances, axis=1)
+
+        # groups left without colors are dropped and the remaining groups numbered again
+        new_labels = np.unique(new_labels, return_inverse=True)[1].reshape(-1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels
+
+
+def get_weighted_means(channels, weights, labels):
+    """
+    Calculates the frequency weighted mean color of each group
+    :param channels: an (n, bands) integer array of colors
+    :param weights: an array of the frequency of each color
+    :param labels: an array of the group of each color, numbered from 0 with no empty groups
+    :return: a (groups, bands) float array of means
+    """
+    totals = np.bincount(labels, weights=weights)
+    return np.stack([np.bincount(labels, weights=weights * channels[:, channel]) / totals
+                     for channel in range(channels.shape[1])], axis=1)
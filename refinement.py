@@ -0,0 +1,118 @@
+import math
+import functools
+import numpy as np
+from histogram import as_color_histogram
+
+# the multiplier starts at 1 and is lowered by this step until the reduced colors fill the target height
+MULTIPLIER_START = 1.002
+MULTIPLIER_STEP = 0.002
+
+
+def refine_color_data(colors, specific_value, target_height):
+    """
+    Refines the color data to the resolution of the specific value, finding the largest multiplier on the 0.002 step
+    scale whose reduced colors fill the target height
+    :param colors: a ColorHistogram, or a dictionary of color: frequency
+    :param specific_value: the frequency required to occupy one pixel of the target height
+    :param target_height: the number of pixels the reduced colors should fill
+    :return: a tuple of the reduced ColorHistogram in the original order and the multiplier used
+    """
+    return RefinementIndex(colors).refine(specific_value, target_height)
+
+
+class RefinementIndex:
+    """
+    The frequencies of a histogram sorted once, from which the reduced colors and multiplier of any target height are
+    found with binary searches, without sorting or filtering every color again
+    """
+
+    def __init__(self, colors):
+        """
+        Constructor for refinement index
+        :param colors: a ColorHistogram, or a dictionary of color: frequency
+        """
+        self.colors = as_color_histogram(colors)
+        self.order = np.argsort(self.colors.counts, kind='stable')
+        self.sorted_values = self.colors.counts[self.order]
+
+    def refine(self, specific_value, target_height):
+        """
+        Refines the color data to the resolution of the specific value, as refine_color_data
+        :param specific_value: the frequency required to occupy one pixel of the target height
+        :param target_height: the number of pixels the reduced colors should fill
+        :return: a tuple of the reduced ColorHistogram in the original order and the multiplier used
+        """
+        multiplier = self.get_multiplier(specific_value, target_height)
+        start = np.searchsorted(self.sorted_values, math.floor(specific_value * multiplier), side='left')
+        return self.colors.take(np.sort(self.order[start:])), multiplier
+
+    def get_multiplier(self, specific_value, target_height):
+        """
+        Finds the largest multiplier on the 0.002 step scale whose reduced colors fill the target height
+        :param specific_value: the frequency required to occupy one pixel of the target height
+        :param target_height: the number of pixels the reduced colors should fill
+        :return: the multiplier
+        """
+        multipliers = get_multipliers()
+
+        # the graphic height only grows as the multiplier falls, so binary search for the first multiplier to fill it
+        low, high = 0, len(multipliers) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.fills(specific_value * multipliers[middle], target_height):
+                high = middle
+            else:
+                low = middle + 1
+        return multipliers[low]
+
+    def fills(self, pixel_value, target_height):
+        """
+        Checks whether the reduced colors of a pixel value fill the target height, only measuring the bars when there
+        are fewer reduced colors than pixels
+        :param pixel_value: the frequency represented by one pixel, the specific value multiplied by the multiplier
+        :param target_height: the number of pixels the reduced colors should fill
+        :return: whether the frequency bars graphic would be at least the target height
+        """
+        start = np.searchsorted(self.sorted_values, math.floor(pixel_value), side='left')
+        # every reduced color takes at least one pixel
+        if len(self.sorted_values) - start >= target_height:
+            return True
+        return int(get_bar_heights(self.sorted_values[start:], pixel_value).sum()) >= target_height
+
+
+@functools.lru_cache(maxsize=None)
+def get_multipliers():
+    """
+    Lists every multiplier the original refinement loop could reach, accumulating each step in the same way so the
+    floating point values are identical
+    :return: a tuple of positive multipliers in descending order
+    """
+    multipliers = []
+    multiplier = MULTIPLIER_START - MULTIPLIER_STEP
+    while multiplier > 0:
+        multipliers.append(multiplier)
+        multiplier -= MULTIPLIER_STEP
+    return tuple(multipliers)
+
+
+def get_graphic_height(sorted_values, specific_value, multiplier):
+    """
+    Calculates the height the reduced colors would occupy in a frequency bars graphic
+    :param sorted_values: an ascending array of color frequencies
+    :param specific_value: the frequency required to occupy one pixel of the target height
+    :param multiplier: the multiplier applied to the specific value
+    :return: the height in pixels, with every reduced color taking at least one pixel
+    """
+    pixel_value = specific_value * multiplier
+    included = sorted_values[np.searchsorted(sorted_values, math.floor(pixel_value), side='left'):]
+    return int(get_bar_heights(included, pixel_value).sum())
+
+
+def get_bar_heights(values, pixel_value):
+    """
+    Calculates the height of the bar for each color in a frequency bars graphic
+    :param values: an array of color frequencies
+    :param pixel_value: the frequency represented by one pixel, the specific value multiplied by the multiplier
+    :return: an integer array of heights in pixels, each at least 1
+    """
+    return np.maximum(np.floor(np.asarray(values) / pixel_value), 1).astype(np.int64)
@@ -0,0 +1,426 @@
+import io
+import math
+import itertools
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# labels are drawn this many pixels in from the top left of their swatch
+LABEL_MARGIN = 5
+# space around glyph masks for glyphs which extend before their origin
+LABEL_PADDING = 4
+# the Pillow format, file extension and encoder options of each output format
+OUTPUT_FORMATS = {
+    'png': ('PNG', 'png', {}),
+    'webp': ('WEBP', 'webp', {'quality': 90}),
+    'webp_lossless': ('WEBP', 'webp', {'lossless': True}),
+}
+# the largest width or height of a WebP image
+WEBP_MAX_SIZE = 16383
+
+
+def render_frequency_bars(colors, heights, width, height, palette=False):
+    """
+    Renders a color frequency bars graphic by building a single column of row colors and stretching it to the width
+    :param colors: a list of rgb tuples (r, g, b) 0-255, in the order the bars are drawn from the top
+    :param heights: an array of the height in pixels of each bar
+    :param width: the width of the graphic
+    :param height: the height of the graphic, bars beyond it are not drawn
+    :param palette: renders a palette (P) image when at most 256 colors are drawn, default: False
+    :return: an RGB Image object, or a P Image object
+    """
+    rows = get_bar_rows(colors, heights, height)
+    if palette:
+        # the column is indexed before it is stretched, which is far quicker than converting the whole graphic
+        row_colors = (rows[:, 0].astype(np.uint32) << 16) | (rows[:, 1].astype(np.uint32) << 8) | rows[:, 2]
+        _, first_index, indices = np.unique(row_colors, return_index=True, return_inverse=True)
+        if len(first_index) <= 256:
+            column = Image.fromarray(indices.astype(np.uint8).reshape(-1, 1), 'P')
+            column.putpalette(rows[first_index].tobytes())
+            return column.resize((width, height), Image.NEAREST)
+    return Image.fromarray(rows[:, None, :], 'RGB').resize((width, height), Image.NEAREST)
+
+
+def render_bar_region(rows, region):
+    """
+    Renders a region of a frequency bars graphic, such as one tile of a pyramid
+    :param rows: a (height, 3) uint8 array of the color of each row, as returned by get_bar_rows
+    :param region: a (left, top, right, bottom) box of the graphic
+    :return: an RGB Image object of the region
+    """
+    left, top, right, bottom = region
+    return Image.fromarray(np.ascontiguousarray(np.broadcast_to(rows[top:bottom, None, :],
+                                                                (bottom - top, right - left, 3))), 'RGB')
+
+
+def save_image(image, outfile, output_format='png', compress_level=6, palette=False):
+    """
+    Saves a graphic in an output format
+    :param image: an RGB or P Image object
+    :param outfile: a file path or a file object
+    :param output_format: 'png', 'webp' for lossy WebP or 'webp_lossless', see OUTPUT_FORMATS
+    :param compress_level: 0-9, the PNG zlib level or scaled to the WebP encoder method 0-6, lower is quicker and
+    larger, default: 6
+    :param palette: saves PNG graphics with at most 256 colors as palette (P) images, which are quicker to encode and
+    smaller, default: False
+    """
+    if not 0 <= compress_level <= 9:
+        raise ValueError('The compress level must be 0-9: {}'.format(compress_level))
+    pil_format, _, params = get_output_format(output_format)
+
+    check_output_size(image.size, output_format)
+    if pil_format == 'WEBP':
+        params = {**params, 'method': round(compress_level * 6 / 9)}
+    else:
+        params = {**params, 'compress_level': compress_level}
+
+    # WebP has no palette images, so only PNG graphics are converted
+    if palette and pil_format == 'PNG':
+        image = to_palette_image(image)
+    image.save(outfile, pil_format, **params)
+
+
+def encode_image(image, output_format='png', compress_level=6, palette=False):
+    """
+    Encodes a graphic in memory, see save_image for the parameters
+    :return: the encoded bytes
+    """
+    buffer = io.BytesIO()
+    save_image(image, buffer, output_format, compress_level, palette)
+    return buffer.getvalue()
+
+
+def fits_output_format(size, output_format):
+    """
+    Checks whether a graphic can be saved in an output format, before it is rendered
+    :param size: the (width, height) of the graphic
+    :param output_format: a key of OUTPUT_FORMATS
+    :return: False for WebP graphics wider or taller than WEBP_MAX_SIZE, otherwise True
+    """
+    return get_output_format(output_format)[0] != 'WEBP' or max(size) <= WEBP_MAX_SIZE
+
+
+def check_output_size(size, output_format):
+    """
+    Raises a ValueError for a graphic which cannot be saved in an output format, see fits_output_format
+    :param size: the (width, height) of the graphic
+    :param output_format: a key of OUTPUT_FORMATS
+    """
+    if not fits_output_format(size, output_format):
+        raise ValueError('WebP graphics must be at most {0}x{0} pixels: {1}x{2}'.format(WEBP_MAX_SIZE, *size))
+
+
+def get_output_format(output_format):
+    """
+    Looks up an output format
+    :param output_format: a key of OUTPUT_FORMATS
+    :return: a tuple of the Pillow format, the file extension and the encoder options
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown output format: {}, use one of {}'.format(output_format, tuple(OUTPUT_FORMATS)))
+    return OUTPUT_FORMATS[output_format]
+
+
+def to_palette_image(image, band_pixels=1 << 22):
+    """
+    Converts a graphic with at most 256 colors to a palette image with exactly the same colors
+    :param image: an RGB or P Image object
+    :param band_pixels: the number of pixels converted at a time, which bounds the memory used
+    :return: a P Image object, or the image unchanged if it has more than 256 colors
+    """
+    if image.mode == 'P':
+        return image
+    colors = image.getcolors(256)
+    if colors is None:
+        return image
+
+    # Pillow's palette lookup shares a result between close colors, so each color is looked up exactly by its value
+    palette = np.array([color for _, color in colors], dtype=np.uint8)
+    lookup = np.zeros(1 << 24, dtype=np.uint8)
+    lookup[(palette[:, 0].astype(np.uint32) << 16) | (palette[:, 1].astype(np.uint32) << 8) | palette[:, 2]] = \
+        np.arange(len(palette), dtype=np.uint8)
+
+    indices = np.empty((image.height, image.width), dtype=np.uint8)
+    band_height = max(1, band_pixels // max(image.width, 1))
+    for top in range(0, image.height, band_height):
+        band = np.asarray(image.crop((0, top, image.width, min(top + band_height, image.height))))
+        indices[top:top + band_height] = lookup[(band[:, :, 0].astype(np.uint32) << 16) |
+                                                (band[:, :, 1].astype(np.uint32) << 8) | band[:, :, 2]]
+
+    palette_image = Image.fromarray(indices, 'P')
+    palette_image.putpalette(palette.tobytes())
+    return palette_image
+
+
+def get_bar_rows(colors, heights, height):
+    """
+    Calculates the color of each row of a frequency bars graphic
+    :param colors: a list of rgb tuples (r, g, b) 0-255, in the order the bars are drawn from the top
+    :param heights: an array of the height in pixels of each bar
+    :param height: the height of the graphic
+    :return: a (height, 3) uint8 array, black below the last bar
+    """
+    rows = np.zeros((height, 3), dtype=np.uint8)
+    heights = np.asarray(heights, dtype=np.int64)
+    if len(heights) == 0 or height == 0:
+        return rows
+
+    # bars are only drawn until one reaches the bottom of the graphic
+    ends = np.cumsum(heights)
+    drawn = int(np.searchsorted(ends, height, side='left')) + 1
+    colors = np.asarray(colors[:drawn], dtype=np.uint8).reshape(-1, 3)
+    heights = heights[:drawn]
+
+    bar_rows = np.repeat(colors, heights, axis=0)[:height]
+    rows[:len(bar_rows)] = bar_rows
+
+    # each bar includes the row below it, which is covered by the next bar unless it is the last one drawn
+    if len(bar_rows) < height:
+        rows[len(bar_rows)] = colors[-1]
+    return rows
+
+
+def render_grid(colors, grid, swatch_width, grid_spacing, length, background=(0, 0, 0), text_color=None,
+                region=None):
+    """
+    Renders a grid graphic by compositing each row of swatches as arrays and pasting cached label tiles
+    :param colors: a list of color tuples, of which the first three values (r, g, b) 0-255 are drawn
+    :param grid: the number of columns in the grid
+    :param swatch_width: the width of each swatch, which covers swatch_width + 1 pixels as a drawn rectangle does
+    :param grid_spacing: the number of pixels separating each row/column
+    :param length: the width and height of the graphic, swatches beyond it are cut off
+    :param background: the background color in any format accepted by Image.new
+    :param text_color: a function returning the label color for an rgb tuple, or None for no labels
+    :param region: a (left, top, right, bottom) box of the graphic to render, such as one tile of a pyramid, default:
+    None renders the whole graphic
+    :return: an RGB Image object of the region
+    """
+    left, top, right, bottom = region if region is not None else (0, 0, length, length)
+    right, bottom = min(right, length), min(bottom, length)
+    indices = get_grid_cells(len(colors), grid, swatch_width, grid_spacing, (left, top, right, bottom),
+                             text_color is not None)
+    rgb_colors = {index: tuple(colors[index][:3]) for index in indices}
+    labels = {}
+    if text_color is not None:
+        labels = {index: get_label_tile(color, text_color(color)) for index, color in rgb_colors.items()}
+        # labels which reach outside their own swatch would be partly covered by the swatches drawn after them
+        for (label_top, label_left), tile in labels.values():
+            if min(label_top, label_left) + LABEL_MARGIN < 0 or \
+                    max(label_top + tile.shape[0], label_left + tile.shape[1]) + LABEL_MARGIN > swatch_width:
+                return draw_grid(colors, grid, swatch_width, grid_spacing, length, background, text_color, region)
+
+    # each row is composited as an array and pasted, so only the graphic and one row of it are held at once
+    canvas = Image.new('RGB', (right - left, bottom - top), background)
+    if grid == 0 or len(indices) == 0:
+        return canvas
+
+    step = swatch_width + grid_spacing
+    positions = np.arange(left, right) - grid_spacing
+
+    for row, row_indices in itertools.groupby(indices, key=lambda index: index // grid):
+        row_top = grid_spacing + row * step
+        row_indices = list(row_indices)
+        row_length = min(grid, len(colors) - row * grid)
+        row_right = min(grid_spacing + (row_length - 1) * step + swatch_width + 1, right) - left
+        # rows reached by labels alone are only pasted onto, and labels stay within their swatch so none reach here
+        if row_top + swatch_width + 1 <= top or row_right <= 0:
+            continue
+        first_cell = row_indices[0] - row * grid
+        row_colors = np.array([rgb_colors[index] for index in row_indices], dtype=np.uint8)
+
+        # the swatch covering each column, taking the later swatch where two overlap with no spacing
+        cell = np.minimum(positions // step, row_length - 1)
+        covered = (positions >= 0) & (positions - cell * step <= swatch_width)
+        line_top = max(row_top - top, 0)
+        line_bottom = min(row_top + swatch_width + 1 - top, bottom - top)
+        local_cell = np.clip(cell[:row_right] - first_cell, 0, len(row_colors) - 1)
+        behind = np.asarray(canvas.crop((0, line_top, row_right, line_top + 1)))[0]
+        line = np.where(covered[:row_right, None], row_colors[local_cell], behind)
+        strip = np.repeat(line[None], line_bottom - line_top, axis=0)
+
+        for index in row_indices:
+            if index not in labels:
+                continue
+            (label_top, label_left), tile = labels[index]
+            tile_top = row_top + LABEL_MARGIN + label_top - top - line_top
+            tile_left = grid_spacing + (index - row * grid) * step + LABEL_MARGIN + label_left - left
+            # labels are cut off at the edges of the region, and of the graphic
+            crop_top, crop_left = max(-tile_top, 0), max(-tile_left, 0)
+            crop_bottom = min(tile.shape[0], strip.shape[0] - tile_top)
+            crop_right = min(tile.shape[1], row_right - tile_left)
+            if crop_top >= crop_bottom or crop_left >= crop_right:
+                continue
+            strip[tile_top + crop_top:tile_top + crop_bottom, tile_left + crop_left:tile_left + crop_right] = \
+                tile[crop_top:crop_bottom, crop_left:crop_right]
+
+        canvas.paste(Image.fromarray(strip, 'RGB'), (0, line_top))
+
+    return canvas
+
+
+def get_grid_cells(count, grid, swatch_width, grid_spacing, region, text):
+    """
+    Finds the swatches of a grid graphic whose squares or labels reach into a region
+    :param count: the number of colors in the grid
+    :param grid: the number of columns in the grid
+    :param swatch_width: the width of each swatch
+    :param grid_spacing: the number of pixels separating each row/column
+    :param region: a (left, top, right, bottom) box of the graphic
+    :param text: whether the swatches are labelled
+    :return: a list of the indices of the swatches, in the order they are drawn
+    """
+    if grid == 0 or count == 0:
+        return []
+    step = swatch_width + grid_spacing
+    # the pixels right of and below the top left of a swatch that its square, or a label cut off by it, can cover
+    extent = max(swatch_width + 1, get_label_reach() if text else 0)
+    left, top, right, bottom = region
+
+    def get_cells(start, end, cells):
+        first = max((start - grid_spacing - extent) // step + 1, 0)
+        last = min(max(-(-(end - grid_spacing) // step), 0), cells)
+        return range(first, last)
+
+    rows = get_cells(top, bottom, math.ceil(count / grid))
+    columns = get_cells(left, right, grid)
+    return [row * grid + column for row in rows for column in columns if row * grid + column < count]
+
+
+@lru_cache(maxsize=None)
+def get_label_reach():
+    """Measures the furthest any label reaches right of or below the top left of its swatch"""
+    reach = 0
+    for digit in '0123456789':
+        shape = get_label_mask('({0}{0}{0}, {0}{0}{0}, {0}{0}{0})'.format(digit)).shape
+        reach = max(reach, LABEL_MARGIN + max(shape) - LABEL_PADDING)
+    return reach
+
+
+@lru_cache(maxsize=16384)
+def get_label_tile(color, fill):
+    """
+    Creates the label for a swatch, keyed by its text and fill color, blended onto the swatch color so it can be
+    pasted directly
+    :param color: the rgb tuple (r, g, b) of the swatch, whose text is used as the label
+    :param fill: the rgb tuple of the label text color
+    :return: a tuple of the (top, left) offset of the tile from the label position and a (height, width, 3) uint8
+    array covering the drawn pixels of the label
+    """
+    mask = get_label_mask(str(color))
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    if len(rows) == 0:
+        return (0, 0), np.empty((0, 0, 3), dtype=np.uint8)
+    mask = mask[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1, None].astype(np.uint32)
+
+    # blends the text color onto the swatch with the same integer rounding Pillow uses to draw text
+    blended = np.array(color, dtype=np.uint32) * (255 - mask) + np.array(fill, dtype=np.uint32) * mask + 128
+    tile = (((blended >> 8) + blended) >> 8).astype(np.uint8)
+    tile.flags.writeable = False
+    return (rows[0] - LABEL_PADDING, columns[0] - LABEL_PADDING), tile
+
+
+def get_label_mask(text):
+    """
+    Creates the coverage mask of a label, composed from cached glyph masks where that matches Pillow's own text
+    rendering for the label font and otherwise rendered directly
+    :param text: the label text
+    :return: a uint8 array with the label origin at (LABEL_PADDING, LABEL_PADDING)
+    """
+    if not can_compose_labels():
+        return render_label_mask(text)
+    return compose_label_mask(text)
+
+
+def compose_label_mask(text):
+    """
+    Composes the coverage mask of a label from the mask of each glyph at its pen position, which overlap by taking the
+    maximum coverage as the font renderer does
+    :param text: the label text
+    :return: a uint8 array with the label origin at (LABEL_PADDING, LABEL_PADDING)
+    """
+    glyphs = [get_glyph_mask(character) for character in text]
+    positions = [0] + [get_glyph_advance(text[index], text[index + 1]) for index in range(len(text) - 1)]
+    positions = [math.floor(position + 0.5) for position in np.cumsum(positions).tolist()]
+
+    mask = np.zeros((max(glyph.shape[0] for glyph in glyphs),
+                     max(position + glyph.shape[1] for position, glyph in zip(positions, glyphs))), dtype=np.uint8)
+    for position, glyph in zip(positions, glyphs):
+        region = mask[:glyph.shape[0], position:position + glyph.shape[1]]
+        np.maximum(region, glyph, out=region)
+    return mask
+
+
+def render_label_mask(text):
+    """
+    Renders the coverage mask of a label with the label font
+    :param text: the label text
+    :return: a uint8 array with the label origin at (LABEL_PADDING, LABEL_PADDING)
+    """
+    left, top, right, bottom = get_label_font().getbbox(text)
+    mask = Image.new('L', (max(right, 0) + 2 * LABEL_PADDING, max(bottom, 0) + 2 * LABEL_PADDING))
+    ImageDraw.Draw(mask).text((LABEL_PADDING, LABEL_PADDING), text, fill=255, font=get_label_font())
+    return np.asarray(mask)
+
+
+@lru_cache(maxsize=None)
+def get_glyph_mask(character):
+    """Renders and caches the coverage mask of one glyph, with its origin at (LABEL_PADDING, LABEL_PADDING)"""
+    mask = render_label_mask(character)
+    mask.flags.writeable = False
+    return mask
+
+
+@lru_cache(maxsize=None)
+def get_glyph_advance(character, next_character):
+    """Caches the distance from a glyph to the next, including any kerning between the pair"""
+    font = get_label_font()
+    return font.getlength(character + next_character) - font.getlength(next_character)
+
+
+@lru_cache(maxsize=None)
+def can_compose_labels():
+    """Checks that composed glyph masks match rendered labels for the label font in this version of Pillow"""
+    samples = ['(0, 0, 0)', '(255, 255, 255)', '(108, 47, 191)', '(13, 220, 96)', '(7, 9, 4)', '(181, 30, 62)']
+    for text in samples:
+        composed = compose_label_mask(text)
+        rendered = render_label_mask(text)
+        height = max(composed.shape[0], rendered.shape[0])
+        width = max(composed.shape[1], rendered.shape[1])
+        if not np.array_equal(np.pad(composed, ((0, height - composed.shape[0]), (0, width - composed.shape[1]))),
+                              np.pad(rendered, ((0, height - rendered.shape[0]), (0, width - rendered.shape[1])))):
+            return False
+    return True
+
+
+@lru_cache(maxsize=None)
+def get_label_font():
+    """Loads the default font used for labels once, rather than for every label drawn"""
+    return ImageFont.load_default()
+
+
+def draw_grid(colors, grid, swatch_width, grid_spacing, length, background=(0, 0, 0), text_color=None,
+              region=None):
+    """
+    Draws a grid graphic one swatch at a time, for labels too large to be composited, see render_grid
+    :return: an RGB Image object of the region
+    """
+    left, top, right, bottom = region if region is not None else (0, 0, length, length)
+    right, bottom = min(right, length), min(bottom, length)
+    grid_graphic = Image.new("RGB", (right - left, bottom - top), color=background)
+    draw = ImageDraw.Draw(grid_graphic)
+    step = swatch_width + grid_spacing
+
+    # Draw the swatches reaching into the region, offset to its top left
+    for index in get_grid_cells(len(colors), grid, swatch_width, grid_spacing, (left, top, right, bottom),
+                                text_color is not None):
+        color = tuple(colors[index][:3])
+        row, column = divmod(index, grid)
+        x = grid_spacing + column * step - left
+        y = grid_spacing + row * step - top
+        draw.rectangle([(x, y), (x + swatch_width, y + swatch_width)], fill=color)
+        if text_color is not None:
+            draw.text((x + LABEL_MARGIN, y + LABEL_MARGIN), str(color), fill=text_color(color),
+                      font=get_label_font())
+
+    return grid_graphic
@@ -0,0 +1,447 @@
+# Serves the graphics of AnalyseImage over a local HTTP server, analysing images in a pool of processes
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import argparse
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, parse_qsl
+from PIL import UnidentifiedImageError
+from main import AnalyseImage
+from cache import get_file_hash, get_bytes_hash
+from rendering import get_output_format
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_bool(value):
+    """Parses a boolean query parameter"""
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError('Not a boolean: {}'.format(value))
+
+
+def _parse_color(value):
+    """Parses an r,g,b query parameter"""
+    return tuple(int(channel) for channel in value.split(','))
+
+
+# the query parameters of each kind of option and the parser of each
+ANALYSIS_OPTIONS = {'sample_rate': float, 'quantize': str, 'palette_size': int, 'quantize_bits': int,
+                    'grid_swatch_width': int, 'grid_spacing': int}
+OUTPUT_OPTIONS = {'output_format': str, 'compress_level': int, 'palette': _parse_bool}
+_GRID_OPTIONS = {'ordered': _parse_bool, 'random': _parse_bool, 'grid': int, 'text': _parse_bool,
+                 'background': _parse_color, 'extra_large': _parse_bool, 'arg_swatch_width': int,
+                 'arg_grid_spacing': int}
+GRAPHIC_OPTIONS = {
+    'color_frequency_bars': {'width': int, 'random': _parse_bool, 'ordered': _parse_bool, 'target_height': int},
+    'color_grid': _GRID_OPTIONS,
+    'color_suggestions_grid': _GRID_OPTIONS,
+}
+# the seconds the rest of a request refused before it was read is dropped for, before the connection is closed
+LINGER_SECONDS = 1
+CONTENT_TYPES = {'png': 'image/png', 'webp': 'image/webp'}
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+                  411: 'Length Required', 413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+                  500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+# analyses kept by each worker process, so graphics of an image requested together share its analysis stages
+WORKER_ANALYSES = 4
+_worker_analyses = OrderedDict()
+
+
+def render_graphic(content_hash, source, graphic, analysis_options, graphic_options, output_options):
+    """
+    Creates and encodes a graphic in a worker process, reusing the analysis of an image recently requested
+    :param content_hash: the hash of the image contents, which identifies its analysis
+    :param source: a file name in the ./source directory or the encoded bytes of an image
+    :param graphic: 'color_frequency_bars', 'color_grid' or 'color_suggestions_grid'
+    :param analysis_options: a dictionary of keyword arguments for AnalyseImage
+    :param graphic_options: a dictionary of keyword arguments for the create method of the graphic
+    :param output_options: a dictionary of keyword arguments for get_graphic_bytes
+    :return: the encoded graphic
+    """
+    analysis_key = (content_hash, tuple(sorted(analysis_options.items())))
+    analysis = _worker_analyses.pop(analysis_key, None)
+    if analysis is None:
+        analysis = AnalyseImage(source, results_directory=None, name=content_hash[:12], **analysis_options)
+    _worker_analyses[analysis_key] = analysis
+    while len(_worker_analyses) > WORKER_ANALYSES:
+        _worker_analyses.popitem(last=False)
+
+    getattr(analysis, 'create_{}'.format(graphic))(save=False, **graphic_options)
+    return analysis.get_graphic_bytes(graphic, **output_options)
+
+
+class ServiceError(Exception):
+    """An error answered with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AnalysisService:
+    """
+    Creates graphics for requests without blocking the event loop: images are analysed in a pool of processes,
+    identical requests made while a graphic is being created share it, and recent graphics are kept in memory
+    """
+
+    def __init__(self, workers=None, max_pending=None, tasks_per_worker=None, cache_size=256 << 20,
+                 max_body_size=64 << 20, max_connections=256, request_timeout=30, use_cache=True):
+        """
+        Constructor for analysis service
+        :param workers: the number of worker processes, default: the number of CPUs
+        :param max_pending: the maximum number of graphics being created at once, further requests being refused with
+        503 until one finishes, default: twice the number of workers
+        :param tasks_per_worker: the number of graphics a worker process creates before it is replaced, which releases
+        the memory used for large images, default: None keeps workers for the life of the service
+        :param cache_size: the maximum total size in bytes of the graphics kept in memory, least recently used first
+        out
+        :param max_body_size: the largest image upload accepted in bytes
+        :param max_connections: the maximum number of open connections, further connections being refused with 503
+        :param request_timeout: the seconds a client has to send its request
+        :param use_cache: reads and writes the analysis stages of every image in the cache directory, so graphics of
+        an image already analysed, or uploaded again, are quicker to create
+        """
+        self.__workers = workers or os.cpu_count() or 1
+        self.__max_pending = max_pending or self.__workers * 2
+        self.__tasks_per_worker = tasks_per_worker
+        self.__cache_size = cache_size
+        self.__max_body_size = max_body_size
+        self.__max_connections = max_connections
+        self.__request_timeout = request_timeout
+        self.__use_cache = use_cache
+
+        self.__executor = self.__create_executor()
+        self.__server = None
+        self.__connections = 0
+
+        # key: (future, pool of worker processes) of each graphic being created, and key: (content type, bytes) of
+        # recent graphics
+        self.__in_flight = {}
+        self.__graphics = OrderedDict()
+        self.__graphics_size = 0
+        self.__counts = {'requests': 0, 'hits': 0, 'coalesced': 0, 'created': 0, 'rejected': 0, 'failed': 0}
+
+    async def start(self, host='127.0.0.1', port=8080, path=None):
+        """
+        Starts serving HTTP requests
+        :param host: the address listened on, default: localhost only
+        :param port: the port listened on, 0 for any free port
+        :param path: a Unix socket path listened on instead of a port, default: None
+        :return: the asyncio Server
+        """
+        if path is not None:
+            self.__server = await asyncio.start_unix_server(self.__handle_connection, path=path)
+        else:
+            self.__server = await asyncio.start_server(self.__handle_connection, host, port)
+        logger.info('Serving on {}'.format(', '.join(str(sock.getsockname()) for sock in self.__server.sockets)))
+        return self.__server
+
+    async def close(self):
+        """Stops serving and shuts down the worker processes"""
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        """
+        Reports the use of the service
+        :return: a dictionary of the number of requests, graphics served from memory, requests which shared a graphic
+        being created, graphics created, requests refused and failures, with the graphics being created, the graphics
+        kept in memory and their total size in bytes
+        """
+        return {**self.__counts, 'in_flight': len(self.__in_flight), 'cached_graphics': len(self.__graphics),
+                'cached_bytes': self.__graphics_size, 'connections': self.__connections}
+
+    async def get_graphic(self, graphic, source=None, data=None, options=None):
+        """
+        Creates a graphic of an image, or serves it from memory
+        :param graphic: 'color_frequency_bars', 'color_grid' or 'color_suggestions_grid'
+        :param source: the name of an image file in the ./source directory
+        :param data: the encoded bytes of an image, in place of a source
+        :param options: a dictionary of string values of analysis, graphic and output options, as query parameters
+        :return: a tuple of the content type, the encoded graphic and whether it was a 'hit' in memory, 'coalesced'
+        with an identical request or a 'miss'
+        """
+        self.__counts['requests'] += 1
+        if graphic not in GRAPHIC_OPTIONS:
+            raise ServiceError(404, 'Unknown graphic: {}'.format(graphic))
+        analysis_options, graphic_options, output_options = parse_options(graphic, options or {})
+        content_type = CONTENT_TYPES[get_output_format(output_options.get('output_format', 'png'))[1]]
+
+        loop = asyncio.get_running_loop()
+        if source is not None:
+            path = os.path.join('./source', source)
+            if os.path.basename(source) != source or source.startswith('.') or not os.path.isfile(path):
+                raise ServiceError(404, 'Image not found: {}'.format(source))
+            content_hash = await loop.run_in_executor(None, get_file_hash, path)
+        elif data:
+            content_hash = await loop.run_in_executor(None, get_bytes_hash, data)
+        else:
+            raise ServiceError(400, 'A source image name or image data is needed')
+
+        key = hashlib.sha256(repr((content_hash, graphic, sorted(analysis_options.items()),
+                                   sorted(graphic_options.items()), sorted(output_options.items()))).encode()
+                             ).hexdigest()
+        if key in self.__graphics:
+            self.__graphics.move_to_end(key)
+            self.__counts['hits'] += 1
+            return self.__graphics[key] + ('hit',)
+
+        if key in self.__in_flight:
+            self.__counts['coalesced'] += 1
+            return content_type, await self.__wait(*self.__in_flight[key]), 'coalesced'
+
+        # graphics are only queued up to a limit, so a burst of requests cannot grow the queue without bound
+        if len(self.__in_flight) >= self.__max_pending:
+            self.__counts['rejected'] += 1
+            raise ServiceError(503, 'Too many graphics being created, try again later')
+
+        arguments = (render_graphic, content_hash, source if source is not None else data, graphic,
+                     {'use_cache': self.__use_cache, **analysis_options}, graphic_options, output_options)
+        executor = self.__executor
+        try:
+            future = loop.run_in_executor(executor, *arguments)
+        except BrokenProcessPool:
+            # a worker process died since the last graphic was created, so the graphic is created in a new pool
+            executor = self.__replace_executor(executor)
+            future = loop.run_in_executor(executor, *arguments)
+        self.__in_flight[key] = (future, executor)
+        future.add_done_callback(lambda done: self.__finish(key, content_type, done))
+        return content_type, await self.__wait(future, executor), 'miss'
+
+    def __finish(self, key, content_type, future):
+        """Keeps a graphic in memory once it is created, removing the least recently used graphics over the limit"""
+        del self.__in_flight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self.__counts['created'] += 1
+        data = future.result()
+        if len(data) > self.__cache_size:
+            return
+        self.__graphics[key] = (content_type, data)
+        self.__graphics_size += len(data)
+        while self.__graphics_size > self.__cache_size:
+            _, (_, removed) = self.__graphics.popitem(last=False)
+            self.__graphics_size -= len(removed)
+
+    async def __wait(self, future, executor):
+        """
+        Waits for a graphic being created, which is not cancelled if this request is, and reports its errors
+        :param future: the future of the graphic
+        :param executor: the pool of worker processes creating it
+        :return: the encoded graphic
+        """
+        try:
+            return await asyncio.shield(future)
+        except (ValueError, TypeError, UnidentifiedImageError) as error:
+            self.__counts['failed'] += 1
+            raise ServiceError(400, str(error))
+        except BrokenProcessPool:
+            # a worker process died, for example by running out of memory, and every graphic in its pool failed
+            self.__counts['failed'] += 1
+            self.__replace_executor(executor)
+            raise ServiceError(500, 'The worker process failed')
+        except Exception as error:
+            self.__counts['failed'] += 1
+            logger.exception('Failed to create a graphic')
+            raise ServiceError(500, '{}: {}'.format(type(error).__name__, error))
+
+    def __replace_executor(self, executor):
+        """
+        Replaces a broken pool of worker processes, unless a request sharing it has already replaced it
+        :param executor: the broken pool
+        :return: the current pool
+        """
+        if self.__executor is executor:
+            logger.error('A worker process failed, replacing the pool')
+            executor.shutdown(wait=False)
+            self.__executor = self.__create_executor()
+        return self.__executor
+
+    def __create_executor(self):
+        """
+        Creates the pool of worker processes. Workers are started by a fork server rather than forked from the service,
+        which would give each worker a copy of the open client connections, and of locks held by the service threads
+        """
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(method)
+        if method == 'forkserver':
+            context.set_forkserver_preload(['service'])
+        return ProcessPoolExecutor(max_workers=self.__workers, mp_context=context,
+                                   max_tasks_per_child=self.__tasks_per_worker)
+
+    async def __handle_connection(self, reader, writer):
+        """Answers one HTTP request on a connection"""
+        self.__connections += 1
+        received = False
+        try:
+            try:
+                if self.__connections > self.__max_connections:
+                    raise ServiceError(503, 'Too many connections, try again later')
+                try:
+                    method, target, body = await asyncio.wait_for(self.__read_request(reader),
+                                                                  self.__request_timeout)
+                except asyncio.TimeoutError:
+                    raise ServiceError(408, 'The request was not received in time')
+                received = True
+                status, headers, content = await self.__route(method, target, body)
+            except Exception as error:
+                if isinstance(error, (asyncio.IncompleteReadError, ConnectionError)):
+                    return
+                if not isinstance(error, ServiceError):
+                    logger.exception('Failed to answer a request')
+                    error = ServiceError(500, 'Internal error')
+                status, headers, content = error.status, {'Content-Type': 'application/json'}, \
+                    json.dumps({'error': str(error)}).encode()
+                if error.status == 503:
+                    headers['Retry-After'] = '1'
+
+            head = ['HTTP/1.1 {} {}'.format(status, STATUS_REASONS[status]),
+                    'Content-Length: {}'.format(len(content)), 'Connection: close']
+            head += ['{}: {}'.format(name, value) for name, value in headers.items()]
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + content)
+            await writer.drain()
+            if not received:
+                # closing with the rest of the request unread resets the connection, which can discard the answer
+                # before the client reads it, so the rest is read and dropped for a moment first
+                writer.write_eof()
+                await asyncio.wait_for(self.__discard(reader), LINGER_SECONDS)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self.__connections -= 1
+            writer.close()
+
+    @staticmethod
+    async def __discard(reader):
+        """Reads and drops the rest of a request until the client closes the connection"""
+        while await reader.read(1 << 16):
+            pass
+
+    async def __read_request(self, reader):
+        """
+        Reads the request line, headers and body of an HTTP request
+        :return: a tuple of the method, the request target and the body
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise ServiceError(431, 'The request headers are too large')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ')
+        except ValueError:
+            raise ServiceError(400, 'Malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+        if 'transfer-encoding' in headers:
+            raise ServiceError(411, 'Send the image with a Content-Length')
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ServiceError(400, 'Malformed Content-Length')
+        if length > self.__max_body_size:
+            raise ServiceError(413, 'Images may be at most {} bytes'.format(self.__max_body_size))
+        body = await reader.readexactly(length) if length else b''
+        return method, target, body
+
+    async def __route(self, method, target, body):
+        """
+        Answers a request:
+        GET /health reports the stats of the service as JSON,
+        GET /graphics/<graphic>?source=<file name>&<options> creates a graphic of an image in the ./source directory,
+        POST /graphics/<graphic>?<options> creates a graphic of the image sent as the body
+        :return: a tuple of the status, a dictionary of headers and the body
+        """
+        url = urlsplit(target)
+        parts = url.path.strip('/').split('/')
+        if parts == ['health']:
+            if method != 'GET':
+                raise ServiceError(405, 'Use GET')
+            return 200, {'Content-Type': 'application/json'}, json.dumps(self.stats()).encode()
+        if len(parts) != 2 or parts[0] != 'graphics':
+            raise ServiceError(404, 'Unknown path: {}'.format(url.path))
+
+        options = dict(parse_qsl(url.query))
+        if method == 'GET':
+            if 'source' not in options:
+                raise ServiceError(400, 'A source parameter is needed, or POST the image')
+            source = options.pop('source')
+            content_type, content, outcome = await self.get_graphic(parts[1], source=source, options=options)
+        elif method == 'POST':
+            content_type, content, outcome = await self.get_graphic(parts[1], data=body, options=options)
+        else:
+            raise ServiceError(405, 'Use GET or POST')
+        return 200, {'Content-Type': content_type, 'X-Cache': outcome}, content
+
+
+def parse_options(graphic, options):
+    """
+    Parses the query parameters of a graphic request
+    :param graphic: the graphic requested
+    :param options: a dictionary of parameter name: string value
+    :return: a tuple of dictionaries of analysis, graphic and output options
+    """
+    parsed = ({}, {}, {})
+    for name, value in options.items():
+        for kind, parsers in enumerate((ANALYSIS_OPTIONS, GRAPHIC_OPTIONS[graphic], OUTPUT_OPTIONS)):
+            if name in parsers:
+                try:
+                    parsed[kind][name] = parsers[name](value)
+                except ValueError:
+                    raise ServiceError(400, 'Invalid {}: {}'.format(name, value))
+                break
+        else:
+            raise ServiceError(400, 'Unknown option for {}: {}'.format(graphic, name))
+    try:
+        get_output_format(parsed[2].get('output_format', 'png'))
+    except ValueError as error:
+        raise ServiceError(400, str(error))
+    return parsed
+
+
+async def serve(host='127.0.0.1', port=8080, path=None, **service_options):
+    """Runs an analysis service until it is interrupted, see AnalysisService for the options"""
+    service = AnalysisService(**service_options)
+    server = await service.start(host, port, path)
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description='Serve the graphics of images over local HTTP')
+    parser.add_argument('--host', default='127.0.0.1', help='the address listened on')
+    parser.add_argument('--port', type=int, default=8080, help='the port listened on')
+    parser.add_argument('--unix', default=None, help='a Unix socket path listened on instead of a port')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='the maximum number of graphics being created at once')
+    parser.add_argument('--cache-size', type=int, default=256 << 20,
+                        help='the maximum bytes of graphics kept in memory')
+    parser.add_argument('--max-body-size', type=int, default=64 << 20, help='the largest image upload in bytes')
+    parser.add_argument('--no-cache', action='store_true', help='calculate all data without the cache')
+    arguments = parser.parse_args()
+
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.unix, workers=arguments.workers,
+                          max_pending=arguments.max_pending, cache_size=arguments.cache_size,
+                          max_body_size=arguments.max_body_size, use_cache=not arguments.no_cache))
+    except KeyboardInterrupt:
+        pass
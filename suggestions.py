@@ -1,98 +1,76 @@
-from colorharmonies import (Color, complementaryColor, triadicColor, splitComplementaryColor, tetradicColor,
-                            analogousColor, monochromaticColor)
+import numpy as np
+from harmonies import get_harmony_weightings
+from histogram import as_color_histogram, get_top_indices
 
 
 def suggestions_algorithm(colour_dict=None, number_requested=1000):
-    """Algorithm handler"""
-    weighted_ideas = get_ideas(colour_dict)  # dictionary of unique colours from ideas with their calculated weightings
-    generated_suggestions = generate_suggestions(weighted_ideas)
-    final_suggestions = present_suggestions(generated_suggestions, number_requested)
-    return final_suggestions
+    """Algorithm handler - takes a ColorHistogram, or a dictionary of colour: frequency"""
+    idea_colours, idea_weightings = get_ideas(colour_dict)  # unique colours from ideas with their weightings
+    suggestion_colours, weightings = get_suggestion_weightings(idea_colours, idea_weightings)
+    top_suggestions = select_top_suggestions(weightings, number_requested)
+    colour_list = map(tuple, suggestion_colours[top_suggestions].tolist())
+    return [elem + (convert_tuple_to_rgb_hex(elem),) for elem in colour_list]
 
 
 def get_ideas(colour_dict):
-    """1. Get Ideas"""
-    data = dict()
-
-    if len(colour_dict) == 0:
-        add_colour_to_dictionary(data, '#ffffff')  # add white if there are no colour tags
-    else:
-        for key, value in colour_dict:
-            for count in range(value):
-                add_colour_to_dictionary(data, key)
-
-    """sort dictionary by value descending"""
-    return sort_dictionary_by_desc_value(data)
+    """1. Get Ideas - takes a ColorHistogram, or a dictionary of colour: frequency, and returns an (n, bands) array of
+    the colours and an array of their weightings"""
+    colours = as_color_histogram(colour_dict)
 
+    if len(colours) == 0:
+        return np.array([[255, 255, 255]]), np.array([0.2])  # add white if there are no colour tags
 
-def generate_suggestions(data):
-    """3. Generate Suggestions - takes dictionary of key:colour and value:weighting and returns an ordered dictionary"""
-    """Using this library for the colour generation: https://github.com/baptistemanteau/colorharmonies"""
+    """weights each colour directly from its frequency rather than adding it once per pixel"""
+    colours = colours.take(np.flatnonzero(colours.counts > 0))
+    weightings = get_frequency_weightings(colours.counts)
 
-    suggestion_results = dict()
-    for key in data:
+    """sort by value descending, keeping the original order of equal values"""
+    order = np.argsort(-weightings, kind='stable')
+    return colours.channels()[order], weightings[order]
 
-        # https://stackoverflow.com/questions/29643352/converting-hex-to-rgb-value-in-python
-        current_colour = Color(key, "", "")
 
-        """3b calculate suggestions"""
-        # complimentary colour - returns 1
-        add_colour_to_dictionary(suggestion_results, tuple(complementaryColor(current_colour)),
-                                 data[key])
+def get_frequency_weightings(counts):
+    """returns the weighting each colour reaches when added to a dictionary count times - takes a list of counts"""
+    counts = np.asarray(counts, dtype=np.int64)
+    return WEIGHTING_TABLE[np.minimum(counts, len(WEIGHTING_TABLE) - 1)]
 
-        # triadic colour - returns 2
-        for new_triadic_colour in triadicColor(current_colour):
-            add_colour_to_dictionary(suggestion_results, tuple(new_triadic_colour), data[key])
 
-        # split complementary colour - returns 2
-        for new_split_complementary_colour in splitComplementaryColor(current_colour):
-            add_colour_to_dictionary(suggestion_results, tuple(new_split_complementary_colour),
-                                     data[key])
+def create_weighting_table(initial_value=0.2):
+    """returns an array of the weighting after each number of additions, up to the point the weighting stops changing
 
-        # tetradic colour - returns 3
-        for new_tetradic_colour in tetradicColor(current_colour):
-            add_colour_to_dictionary(suggestion_results, tuple(new_tetradic_colour),
-                                     data[key])
+    The recurrence has the closed form 1 - 0.8 ** count but that differs in the last bits, so the table steps the same
+    floating point update the original per pixel loop used until it reaches its fixed point"""
+    weightings = [0.0, initial_value]
+    while update_weighting(weightings[-1]) != weightings[-1]:
+        weightings.append(update_weighting(weightings[-1]))
+    return np.array(weightings)
 
-        # analogous colour - returns 2
-        for new_analogous_colour in analogousColor(current_colour):
-            add_colour_to_dictionary(suggestion_results, tuple(new_analogous_colour),
-                                     data[key])
 
-        # monochromatic colour - returns list
-        for new_monochromatic_colour in monochromaticColor(current_colour):
-            add_colour_to_dictionary(suggestion_results, tuple(new_monochromatic_colour),
-                                     data[key])
+def get_suggestion_weightings(colours, weightings):
+    """3b calculate suggestions - takes an (n, 3+) array of colours and an array of their weightings and returns an
+    array of the unique suggested colours, in the order they were first suggested, and an array of their weightings"""
+    """Follows the colour generation from this library, for all colours at once:
+    https://github.com/baptistemanteau/colorharmonies"""
+    if len(colours) == 0:
+        return np.empty((0, 3), dtype=np.int64), np.empty(0)
 
-    # 3c sort array by weighting
-    return sort_dictionary_by_desc_value(suggestion_results)
+    return get_harmony_weightings(np.asarray(colours, dtype=np.int64)[:, :3], weightings, update_weighting)
 
 
-def present_suggestions(data, number_requested):
-    """5. Present suggestions takes an ordered dictionary of key:colour and value:weighting and returns a list of
-    html hex colours """
-    colour_list = [item[0] for item in list(data.items())[:number_requested]]
-
-    return [elem + (convert_tuple_to_rgb_hex(elem),) for elem in colour_list]
+def select_top_suggestions(weightings, number_requested):
+    """4. Select suggestions - returns the indexes of the highest number_requested weightings in descending order, with
+    equal weightings kept in their original order, partitioning rather than sorting every suggestion"""
+    return get_top_indices(weightings, number_requested)
 
 
-def sort_dictionary_by_desc_value(dictionary):
-    """sorts a given dictionary in descending order of value"""
-    return {k: v for k, v in sorted(dictionary.items(), key=lambda item: item[1], reverse=True)}
-
-
-def add_colour_to_dictionary(dictionary, colour, initial_value=0.2):
-    """uses algorithm to add unique colours to dictionary or update weighting - takes dictionary and colour"""
-    if colour in dictionary:
-        """Update value using equation ans * (0.8 + ((1 / ans) / 5))"""
-        value = dictionary.get(colour, None)
-        value = value * (0.8 + ((1 / value) / 5))
-        dictionary[colour] = value
-    else:
-        dictionary[colour] = initial_value
-    return dictionary
+def update_weighting(value):
+    """Update value using equation ans * (0.8 + ((1 / ans) / 5))"""
+    return value * (0.8 + ((1 / value) / 5))
 
 
 def convert_tuple_to_rgb_hex(rgb_tuple):
     """converts a tuple in the format (r, g, b) to html hex"""
     return '#%02x%02x%02x' % rgb_tuple
+
+
+WEIGHTING_TABLE = create_weighting_table()
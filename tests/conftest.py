@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# the modules are imported from the project root, as the benchmarks are
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def work_directory(tmp_path, monkeypatch):
+    """Runs a test in an empty directory with a ./source folder, as AnalyseImage reads images from ./source"""
+    (tmp_path / 'source').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,86 @@
+import random
+import pytest
+from accumulator import HistogramAccumulator
+from histogram import ColorHistogram, parse_pixels
+from benchmarks.histogram_benchmark import create_noise_image
+
+
+def create_histograms(number, seed=0):
+    """Creates histograms of random colors from a small range, so that most colors appear in several of them"""
+    rng = random.Random(seed)
+    histograms = []
+    for _ in range(number):
+        colors = {}
+        for _ in range(rng.randrange(0, 40)):
+            colors[(rng.randrange(0, 256, 51), rng.randrange(0, 256, 85), rng.randrange(0, 256, 128))] = \
+                rng.randrange(1, 1000)
+        histograms.append(ColorHistogram.from_dict(colors))
+    return histograms
+
+
+def merge(histograms):
+    histograms = [histogram for histogram in histograms if len(histogram)]
+    return ColorHistogram.merge(histograms).items() if histograms else []
+
+
+def test_added_histograms_match_merging_them():
+    accumulator = HistogramAccumulator(use_cache=False)
+    histograms = create_histograms(12)
+    for number, histogram in enumerate(histograms):
+        assert accumulator.add_histogram(histogram) == number
+        assert accumulator.histogram.items() == merge(histograms[:number + 1])
+    assert accumulator.keys() == list(range(12))
+
+
+def test_removed_histograms_match_merging_those_left():
+    accumulator = HistogramAccumulator(use_cache=False)
+    histograms = dict(enumerate(create_histograms(12, seed=1)))
+    for key, histogram in histograms.items():
+        accumulator.add_histogram(histogram, key)
+
+    keys = list(histograms)
+    random.Random(2).shuffle(keys)
+    for key in keys:
+        assert accumulator.remove(key) is histograms.pop(key)
+        assert accumulator.histogram.items() == merge(histograms.values())
+    assert len(accumulator) == 0
+
+    # an emptied accumulator takes histograms of any number of bands again
+    single_band = ColorHistogram.from_dict({7: 3, 200: 1})
+    accumulator.add_histogram(single_band)
+    assert accumulator.histogram.items() == single_band.items()
+
+
+def test_window_holds_the_latest_histograms():
+    accumulator = HistogramAccumulator(use_cache=False, window=3)
+    histograms = create_histograms(8, seed=3)
+    for number, histogram in enumerate(histograms):
+        accumulator.add_histogram(histogram)
+        assert accumulator.keys() == list(range(max(number - 2, 0), number + 1))
+        assert accumulator.histogram.items() == merge(histograms[max(number - 2, 0):number + 1])
+
+
+def test_invalid_keys_and_bands_are_rejected():
+    accumulator = HistogramAccumulator(use_cache=False)
+    accumulator.add_histogram(ColorHistogram.from_dict({(1, 2, 3): 4}), 'frame')
+    with pytest.raises(ValueError):
+        accumulator.add_histogram(ColorHistogram.from_dict({(1, 2, 3): 4}), 'frame')
+    with pytest.raises(ValueError):
+        accumulator.add_histogram(ColorHistogram.from_dict({(1, 2, 3, 4): 4}))
+    with pytest.raises(KeyError):
+        accumulator.remove('missing')
+    with pytest.raises(ValueError):
+        HistogramAccumulator(window=0)
+
+
+def test_images_are_counted_and_analysed():
+    accumulator = HistogramAccumulator(use_cache=False)
+    images = [create_noise_image(12, 9, levels=3, seed=seed) for seed in range(3)]
+    for image in images:
+        accumulator.add(image)
+
+    assert accumulator.keys() == [0, 1, 2]
+    assert accumulator.get_histogram(1).items() == parse_pixels(images[1]).items()
+    assert accumulator.histogram.items() == merge([parse_pixels(image) for image in images])
+    assert accumulator.analyse().get_color_histogram().items() == accumulator.histogram.items()
+    assert accumulator.analyse(2).get_color_histogram().items() == parse_pixels(images[2]).items()
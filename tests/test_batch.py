@@ -0,0 +1,60 @@
+import os
+import numpy as np
+from PIL import Image
+from batch import run_batch, find_images
+from instrumentation import Instrumentation
+
+
+class CrashingInstrumentation(Instrumentation):
+    """Instrumentation which ends its worker process abruptly when an image it names is analysed"""
+
+    def __init__(self, crash_names):
+        super().__init__()
+        self.crash_names = crash_names
+
+    def measure(self, name, kind, **details):
+        if os.path.basename(str(details.get('image'))) in self.crash_names:
+            os._exit(1)
+        return super().measure(name, kind, **details)
+
+
+ANALYSIS_OPTIONS = {'use_cache': False, 'target_height': 300}
+SELECTION_OPTIONS = {'swatch_width': 20, 'grid_spacing': 2, 'compress_level': 1}
+
+
+def create_images(directory, names):
+    rng = np.random.default_rng(0)
+    for name in names:
+        Image.fromarray((rng.integers(0, 2, size=(4, 4, 3)) * 255).astype(np.uint8)).save(os.path.join(directory, name))
+
+
+def test_find_images_only_lists_images(work_directory):
+    create_images('source', ['b.png', 'a.png'])
+    (work_directory / 'source' / 'notes.txt').write_text('not an image')
+    assert find_images('./source') == [os.path.join('./source', 'a.png'), os.path.join('./source', 'b.png')]
+
+
+def test_batch_reports_errors_per_image(work_directory):
+    create_images('source', ['a.png', 'b.png'])
+    (work_directory / 'source' / 'broken.png').write_bytes(b'not a png')
+    results = run_batch('./source', workers=2, analysis_options=ANALYSIS_OPTIONS,
+                        selection_options=SELECTION_OPTIONS)
+    assert results[os.path.join('./source', 'a.png')] is None
+    assert results[os.path.join('./source', 'b.png')] is None
+    assert 'UnidentifiedImageError' in results[os.path.join('./source', 'broken.png')]
+    assert os.path.isdir(os.path.join('Results', 'a'))
+
+
+def test_batch_survives_a_worker_process_dying(work_directory):
+    names = ['a.png', 'b.png', 'crash.png', 'd.png', 'e.png']
+    create_images('source', names)
+    results = run_batch('./source', workers=2, max_pending=3,
+                        analysis_options=dict(ANALYSIS_OPTIONS,
+                                              instrumentation=CrashingInstrumentation(('crash.png',))),
+                        selection_options=SELECTION_OPTIONS)
+
+    assert sorted(results) == [os.path.join('./source', name) for name in names]
+    assert 'BrokenProcessPool' in results[os.path.join('./source', 'crash.png')]
+    for name in names:
+        if name != 'crash.png':
+            assert results[os.path.join('./source', name)] is None
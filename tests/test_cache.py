@@ -0,0 +1,149 @@
+import os
+import stat
+import numpy as np
+import pytest
+import cache
+from cache import CacheStore, FILE_MODE
+from histogram import ColorHistogram
+
+
+def list_files(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, _, files in os.walk(directory) for name in files)
+
+
+def test_keys_cover_everything_affecting_a_stage(tmp_path):
+    store = CacheStore(str(tmp_path))
+    key = store.get_key('hash', 'im_color', 1, sample_rate=0.5, tile_pixels=None)
+    assert key == store.get_key('hash', 'im_color', 1, tile_pixels=None, sample_rate=0.5)
+    changed = [store.get_key('other', 'im_color', 1, sample_rate=0.5, tile_pixels=None),
+               store.get_key('hash', 'im_palette', 1, sample_rate=0.5, tile_pixels=None),
+               store.get_key('hash', 'im_color', 2, sample_rate=0.5, tile_pixels=None),
+               store.get_key('hash', 'im_color', 1, sample_rate=0.25, tile_pixels=None),
+               store.get_key('hash', 'im_color', 1, sample_rate=0.5, tile_pixels=None, quantize='bits'),
+               store.get_key('hash', 'im_color', 1, sample_rate='0.5', tile_pixels=None)]
+    assert len({key, *changed}) == len(changed) + 1
+
+
+def test_entries_are_replaced_atomically(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.save('stage', 'key', {'value': 1})
+    assert store.load('stage', 'key') == (True, {'value': 1})
+    store.save('stage', 'key', {'value': 2})
+    assert store.load('stage', 'key') == (True, {'value': 2})
+
+    # a write which fails leaves the entry it would have replaced and no temporary file
+    with pytest.raises(Exception):
+        store.save('stage', 'key', lambda: None)
+    assert store.load('stage', 'key') == (True, {'value': 2})
+    assert list_files(str(tmp_path)) == [os.path.join('stage', 'key.pkl.bz2')]
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='file modes are only kept on POSIX systems')
+def test_entries_are_readable_as_other_files(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.save('stage', 'key', [1, 2, 3])
+    assert stat.S_IMODE(os.stat(os.path.join(str(tmp_path), 'stage', 'key.pkl.bz2')).st_mode) == FILE_MODE
+    assert FILE_MODE & stat.S_IRUSR
+
+
+def test_missing_and_damaged_entries_are_not_found(tmp_path):
+    store = CacheStore(str(tmp_path))
+    assert store.load('stage', 'missing') == (False, None)
+
+    store.save('stage', 'key', [1, 2, 3])
+    with open(os.path.join(str(tmp_path), 'stage', 'key.pkl.bz2'), 'wb') as outfile:
+        outfile.write(b'damaged')
+    assert store.load('stage', 'key') == (False, None)
+    store.save('stage', 'key', [4])
+    assert store.load('stage', 'key') == (True, [4])
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = CacheStore(str(tmp_path))
+    for number in range(4):
+        store.save('stage', str(number), os.urandom(2000))
+        os.utime(os.path.join(str(tmp_path), 'stage', '{}.pkl.bz2'.format(number)), (number, number))
+    entry_size = os.path.getsize(os.path.join(str(tmp_path), 'stage', '0.pkl.bz2'))
+
+    # reading an entry marks it as recently used
+    assert store.load('stage', '0')[0]
+    limited_store = CacheStore(str(tmp_path), size_limit=entry_size * 3 + 100)
+    limited_store.save('stage', '4', os.urandom(2000))
+    assert list_files(str(tmp_path)) == [os.path.join('stage', name + '.pkl.bz2') for name in ('0', '3', '4')]
+
+
+def test_the_cache_is_only_walked_to_measure_it_again(tmp_path, monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(cache.os, 'walk', lambda directory: walks.append(directory) or walk(directory))
+    store = CacheStore(str(tmp_path), size_limit=1 << 30)
+    for number in range(cache.RESCAN_WRITES + 1):
+        store.save('stage', str(number), number)
+    assert len(walks) == 2
+
+    # once over the limit, every write evicts
+    store.size_limit = 0
+    store.save('stage', 'last', 0)
+    assert list_files(str(tmp_path)) == []
+
+
+def test_histograms_are_memory_mapped_when_read(tmp_path):
+    store = CacheStore(str(tmp_path))
+    histogram = ColorHistogram.from_dict({(255, 0, 0): 10, (0, 0, 255): 5, (7, 8, 9): 1})
+    store.save_histogram('im_color', 'key', histogram)
+    assert list_files(str(tmp_path)) == [os.path.join('im_color', 'key.npy')]
+
+    found, loaded = store.load_histogram('im_color', 'key')
+    assert found and loaded.items() == histogram.items() and loaded.bands == 3
+    assert isinstance(loaded.packed.base, np.memmap)
+    assert store.load_histogram('im_color', 'missing') == (False, None)
+
+
+def test_histograms_which_cannot_be_packed_are_pickled(tmp_path):
+    store = CacheStore(str(tmp_path))
+    histogram = ColorHistogram.from_dict({0.5: 3, 1.25: 1})
+    store.save_histogram('im_color', 'key', histogram)
+    assert list_files(str(tmp_path)) == [os.path.join('im_color', 'key.pkl.bz2')]
+    found, loaded = store.load_histogram('im_color', 'key')
+    assert found and loaded.items() == histogram.items()
+
+
+def test_pickled_dictionaries_are_migrated(tmp_path):
+    store = CacheStore(str(tmp_path))
+    colors = {(1, 2, 3, 255): 4, (5, 6, 7, 0): 2}
+    store.save('im_color', 'key', colors)
+
+    found, loaded = store.load_histogram('im_color', 'key')
+    assert found and loaded.items() == list(colors.items())
+    assert list_files(str(tmp_path)) == [os.path.join('im_color', 'key.npy')]
+    assert store.load_histogram('im_color', 'key')[1].items() == list(colors.items())
+
+
+def test_damaged_histograms_are_not_found(tmp_path):
+    store = CacheStore(str(tmp_path))
+    os.makedirs(os.path.join(str(tmp_path), 'im_color'))
+    with open(os.path.join(str(tmp_path), 'im_color', 'key.npy'), 'wb') as outfile:
+        outfile.write(b'damaged')
+    assert store.load_histogram('im_color', 'key') == (False, None)
+
+
+def test_files_which_cannot_be_removed_are_left(tmp_path, monkeypatch):
+    store = CacheStore(str(tmp_path))
+    for number in range(3):
+        store.save_histogram('im_color', str(number), ColorHistogram.from_dict({(number, 0, 0): 1}))
+        os.utime(os.path.join(str(tmp_path), 'im_color', '{}.npy'.format(number)), (number, number))
+    store.load_histogram('im_color', '0')
+    os.utime(os.path.join(str(tmp_path), 'im_color', '0.npy'), (0, 0))
+
+    # memory mapped files cannot be removed on Windows
+    remove = os.remove
+
+    def remove_unmapped(path):
+        if path.endswith('0.npy'):
+            raise PermissionError(path)
+        remove(path)
+    monkeypatch.setattr(cache.os, 'remove', remove_unmapped)
+    store.size_limit = 1
+    store.evict()
+    assert list_files(str(tmp_path)) == [os.path.join('im_color', '0.npy')]
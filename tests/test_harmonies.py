@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+from harmonies import get_harmony_weightings
+from suggestions import update_weighting
+
+
+def create_colours(number, seed=0):
+    """Creates random colours, with greys and extremes, and random weightings"""
+    rng = np.random.default_rng(seed)
+    colours = np.concatenate([[[0, 0, 0], [255, 255, 255], [128, 128, 128], [255, 0, 0]],
+                              rng.integers(0, 256, size=(number, 3)),
+                              np.repeat(rng.integers(0, 256, size=(number // 10, 1)), 3, axis=1)])
+    return colours, rng.random(len(colours))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_chunks_match_one_chunk(chunk_size):
+    colours, weightings = create_colours(300)
+    expected_colours, expected_weightings = get_harmony_weightings(colours, weightings, update_weighting,
+                                                                   chunk_size=len(colours))
+    chunk_colours, chunk_weightings = get_harmony_weightings(colours, weightings, update_weighting,
+                                                             chunk_size=chunk_size)
+    assert np.array_equal(chunk_colours, expected_colours)
+    assert np.array_equal(chunk_weightings, expected_weightings)
+
+
+def test_no_colours_have_no_harmonies():
+    colours, weightings = get_harmony_weightings(np.empty((0, 3), dtype=np.int64), [], update_weighting)
+    assert colours.shape == (0, 3)
+    assert len(weightings) == 0
+
+
+def test_generate_suggestions_matches_colorharmonies():
+    pytest.importorskip('colorharmonies')
+    from benchmarks.harmony_benchmark import generate_suggestions, generate_suggestions_loop, create_color_data
+    from benchmarks.weighting_benchmark import get_ideas_dictionary
+
+    ideas = get_ideas_dictionary(create_color_data(200))
+    assert list(generate_suggestions(ideas).items()) == list(generate_suggestions_loop(ideas).items())
@@ -0,0 +1,143 @@
+import gc
+import struct
+import warnings
+import numpy as np
+import pytest
+from PIL import Image
+from histogram import parse_pixels, parse_pixels_in_tiles, can_read_file_regions, sample_pixels, get_sample_shape, \
+    get_sampling_errors
+from benchmarks.histogram_benchmark import parse_pixels_loop, create_noise_image
+
+MODES = ('1', 'L', 'LA', 'La', 'P', 'PA', 'RGB', 'RGBA', 'RGBa', 'RGBX', 'CMYK', 'YCbCr', 'LAB', 'HSV', 'I', 'F',
+         'I;16')
+
+
+def create_mode_image(mode, width=9, height=7):
+    """Creates a small image of random pixels in a mode, with LAB pixels covering both halves of every channel"""
+    if mode == 'LAB':
+        pixels = np.random.default_rng(1).integers(0, 256, width * height * 3, dtype=np.uint8)
+        return Image.frombytes('LAB', (width, height), pixels.tobytes())
+    return create_noise_image(width, height, levels=4).convert(mode)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_parse_pixels_matches_getpixel(mode):
+    image = create_mode_image(mode)
+    assert parse_pixels(image).items() == list(parse_pixels_loop(image).items())
+
+
+# (file name, mode, save options), raw files are decoded a region at a time and the others whole
+FILES = [
+    ('strips.tif', 'RGB', {}),
+    ('grey.tif', 'L', {}),
+    ('lzw.tif', 'RGB', {'compression': 'tiff_lzw'}),
+    ('bottom_up.bmp', 'RGB', {}),
+    ('palette.bmp', 'P', {}),
+    ('pixels.ppm', 'RGB', {}),
+    ('alpha.png', 'RGBA', {}),
+    ('photo.jpg', 'RGB', {'quality': 50}),
+]
+
+
+@pytest.mark.parametrize('name, mode, options', FILES)
+@pytest.mark.parametrize('tile_pixels', [1, 13, 100, 1 << 22])
+def test_parse_pixels_in_tiles_matches_parse_pixels(tmp_path, name, mode, options, tile_pixels):
+    path = str(tmp_path / name)
+    create_noise_image(31, 19, levels=4).convert(mode).save(path, **options)
+    with Image.open(path) as image:
+        expected = parse_pixels(image).items()
+    with Image.open(path) as image:
+        assert parse_pixels_in_tiles(image, tile_pixels).items() == expected
+
+
+def save_tiled_tiff(image, path, tile_size=16):
+    """Saves an L or RGB image as an uncompressed tiled TIFF, which Pillow only reads, padding the edge tiles"""
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+    bands = 1 if pixels.ndim == 2 else pixels.shape[2]
+    rows, columns = -(-height // tile_size), -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, columns * tile_size) + pixels.shape[2:], dtype=np.uint8)
+    padded[:height, :width] = pixels
+    tiles = [padded[row * tile_size:(row + 1) * tile_size, column * tile_size:(column + 1) * tile_size].tobytes()
+             for row in range(rows) for column in range(columns)]
+
+    # the bits per sample, tile offsets and tile byte counts follow the directory of 11 tags
+    bits_offset = 8 + 2 + 11 * 12 + 4
+    offsets_offset = bits_offset + 2 * bands
+    counts_offset = offsets_offset + 4 * len(tiles)
+    data_offset = counts_offset + 4 * len(tiles)
+    tags = [(256, 4, 1, width), (257, 4, 1, height), (258, 3, bands, bits_offset if bands > 1 else 8),
+            (259, 3, 1, 1), (262, 3, 1, 2 if bands == 3 else 1), (277, 3, 1, bands), (284, 3, 1, 1),
+            (322, 3, 1, tile_size), (323, 3, 1, tile_size), (324, 4, len(tiles), offsets_offset),
+            (325, 4, len(tiles), counts_offset)]
+    with open(path, 'wb') as outfile:
+        outfile.write(b'II*\0' + struct.pack('<IH', 8, len(tags)))
+        for tag, kind, count, value in tags:
+            # a single short value is padded to the four bytes of the value field
+            value_field = struct.pack('<HH', value, 0) if kind == 3 and count == 1 else struct.pack('<I', value)
+            outfile.write(struct.pack('<HHI', tag, kind, count) + value_field)
+        outfile.write(struct.pack('<I{}H'.format(bands), 0, *[8] * bands))
+        outfile.write(struct.pack('<{}I'.format(len(tiles)),
+                                  *[data_offset + index * len(tiles[0]) for index in range(len(tiles))]))
+        outfile.write(struct.pack('<{}I'.format(len(tiles)), *map(len, tiles)))
+        outfile.write(b''.join(tiles))
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+@pytest.mark.parametrize('tile_pixels', [1, 13, 100, 300, 1 << 22])
+def test_parse_pixels_in_tiles_of_tiled_tiffs(tmp_path, mode, tile_pixels):
+    path = str(tmp_path / 'tiled.tif')
+    expected_image = create_noise_image(31, 19, levels=4).convert(mode)
+    save_tiled_tiff(expected_image, path)
+    with Image.open(path) as image:
+        # 2x2 tiles, of which those on the right and bottom edges are cut off
+        assert [tile[1] for tile in image.tile] == [(0, 0, 16, 16), (16, 0, 31, 16), (0, 16, 16, 19),
+                                                    (16, 16, 31, 19)]
+        assert image.tobytes() == expected_image.tobytes()
+    with Image.open(path) as image:
+        assert parse_pixels_in_tiles(image, tile_pixels).items() == parse_pixels(expected_image).items()
+
+
+def test_parse_pixels_in_tiles_of_loaded_images():
+    image = create_noise_image(23, 17)
+    assert parse_pixels_in_tiles(image, 40).items() == parse_pixels(image).items()
+    assert parse_pixels_in_tiles(Image.new('RGB', (0, 0)), 40).items() == []
+
+
+def test_file_regions_are_read_in_this_version_of_pillow():
+    assert can_read_file_regions()
+
+
+def test_parse_pixels_in_tiles_closes_each_region(tmp_path):
+    # files of more than one frame are kept open after loading
+    path = str(tmp_path / 'frames.tif')
+    image = create_noise_image(40, 30)
+    image.save(path, save_all=True, append_images=[image.rotate(90)])
+    with Image.open(path) as image, warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        parse_pixels_in_tiles(image, 40)
+        gc.collect()
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)]
+
+
+def test_sampled_frequencies_are_unbiased_estimates():
+    image = create_noise_image(60, 40, levels=2, seed=1)
+    exact = dict(parse_pixels(image).items())
+    total, samples = image.width * image.height, 400
+
+    estimates = np.zeros((samples, len(exact)))
+    for seed in range(samples):
+        sample = dict(sample_pixels(image, 0.1, seed=seed).items())
+        assert set(sample) <= set(exact)
+        estimates[seed] = [sample.get(color, 0) for color in exact]
+        # the estimates are scaled up to the number of pixels, apart from rounding
+        assert abs(estimates[seed].sum() - total) <= len(exact)
+
+    # the mean of many samples is within a few standard errors of the mean of the exact frequencies
+    counts = np.array(list(exact.values()))
+    rows, columns = get_sample_shape(image.width, image.height, 0.1)
+    errors = get_sampling_errors(counts, total, rows * columns)
+    assert (np.abs(estimates.mean(axis=0) - counts) < 4 * errors / np.sqrt(samples) + 1).all()
+    # a stratified sample is no worse than the simple random sample the errors are estimated for
+    assert (estimates.std(axis=0) < errors * 1.2).all()
+
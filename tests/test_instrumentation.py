@@ -0,0 +1,134 @@
+import json
+import pickle
+import threading
+import tracemalloc
+import pytest
+from instrumentation import Instrumentation, measured
+
+
+def test_nested_measurements_record_their_parent():
+    instrumentation = Instrumentation()
+    with instrumentation.measure('graphic', 'graphic', image='a.png') as outer:
+        assert instrumentation.current() is outer
+        with instrumentation.measure('stage', 'stage', image='a.png') as inner:
+            instrumentation.count(pixels=12)
+            instrumentation.set_cache('hit')
+            assert instrumentation.current() is inner
+        assert instrumentation.current() is outer
+    assert instrumentation.current() is None
+
+    # records are added as measurements finish, so the innermost comes first
+    assert instrumentation.records == [inner, outer]
+    assert (inner['parent'], inner['counts'], inner['cache'], inner['image']) == ('graphic', {'pixels': 12}, 'hit',
+                                                                                  'a.png')
+    assert (outer['parent'], outer['counts'], outer['cache']) == (None, {}, None)
+    assert outer['wall_time'] >= inner['wall_time'] >= 0 and inner['peak_memory'] is None
+
+
+def test_measurements_in_other_threads_are_not_nested():
+    instrumentation = Instrumentation()
+    def measure_stage():
+        with instrumentation.measure('stage', 'stage'):
+            pass
+
+    with instrumentation.measure('graphic', 'graphic'):
+        thread = threading.Thread(target=measure_stage)
+        thread.start()
+        thread.join()
+    assert [(record['name'], record['parent']) for record in instrumentation.records] == [('stage', None),
+                                                                                           ('graphic', None)]
+
+
+def test_failed_measurements_record_the_error():
+    instrumentation = Instrumentation()
+    with pytest.raises(KeyError):
+        with instrumentation.measure('stage', 'stage'):
+            raise KeyError('missing')
+    record, = instrumentation.records
+    assert record['error'] == 'KeyError' and record['wall_time'] is not None
+    assert instrumentation.current() is None
+
+
+def test_hooks_are_called_with_each_record():
+    instrumentation = Instrumentation()
+    names = []
+    hook = names.append
+    instrumentation.add_hook(lambda record: hook(record['name']))
+    instrumentation.add_hook(hook)
+    with instrumentation.measure('first', 'stage'):
+        pass
+    assert names == ['first', instrumentation.records[0]]
+
+    instrumentation.remove_hook(hook)
+    with instrumentation.measure('second', 'stage'):
+        pass
+    assert names[2:] == ['second']
+
+
+def test_report_totals_each_kind_and_name(tmp_path):
+    instrumentation = Instrumentation()
+    for cache in ('hit', 'miss', 'hit'):
+        with instrumentation.measure('colors', 'stage'):
+            instrumentation.set_cache(cache)
+    with instrumentation.measure('colors', 'graphic'):
+        pass
+
+    report = instrumentation.report()
+    assert report['records'] == instrumentation.records
+    stage, graphic = report['totals']['stage:colors'], report['totals']['graphic:colors']
+    assert (stage['calls'], stage['cache_hits'], stage['cache_misses'], stage['peak_memory']) == (3, 2, 1, None)
+    assert stage['wall_time'] == pytest.approx(sum(record['wall_time'] for record in report['records'][:3]))
+    assert (graphic['calls'], graphic['cache_hits'], graphic['cache_misses']) == (1, 0, 0)
+
+    path = str(tmp_path / 'report.json')
+    assert json.loads(instrumentation.to_json(path)) == report
+    with open(path) as infile:
+        assert json.load(infile) == report
+
+
+def test_peak_memory_is_traced_for_each_measurement():
+    instrumentation = Instrumentation(trace_memory=True)
+    was_tracing = tracemalloc.is_tracing()
+    with instrumentation.measure('outer', 'stage'):
+        with instrumentation.measure('inner', 'stage'):
+            data = bytearray(4 << 20)
+        del data
+    inner, outer = instrumentation.records
+    assert inner['peak_memory'] >= 4 << 20
+    # the peak of a nested measurement is part of the peak of the one it ran within
+    assert outer['peak_memory'] >= inner['peak_memory']
+    assert tracemalloc.is_tracing() == was_tracing
+
+
+def test_instrumentation_can_be_pickled():
+    instrumentation = Instrumentation(trace_memory=True)
+    with instrumentation.measure('stage', 'stage'):
+        copied = pickle.loads(pickle.dumps(instrumentation))
+
+    # the copy has the finished records and no running measurement, and measures as the original does
+    assert copied.trace_memory and copied.records == [] and copied.current() is None
+    copied.trace_memory = False
+    with copied.measure('copied', 'stage'):
+        pass
+    assert [record['name'] for record in copied.report()['records']] == ['copied']
+    assert [record['name'] for record in instrumentation.records] == ['stage']
+
+
+class Analysis:
+    def __init__(self):
+        self.instrumentation = Instrumentation()
+        self.filename = 'image.png'
+
+    @measured('stage')
+    def __colors(self):
+        return 5
+
+    def colors(self):
+        return self.__colors()
+
+
+def test_measured_methods_are_named_without_underscores():
+    analysis = Analysis()
+    assert analysis.colors() == 5
+    record, = analysis.instrumentation.records
+    assert (record['name'], record['kind'], record['image']) == ('colors', 'stage', 'image.png')
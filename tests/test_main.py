@@ -0,0 +1,174 @@
+import pytest
+from PIL import Image
+from main import AnalyseImage
+from rendering import WEBP_MAX_SIZE
+from benchmarks.histogram_benchmark import create_noise_image
+
+
+@pytest.fixture(scope='module')
+def analysed_image():
+    return AnalyseImage(create_noise_image(40, 30, levels=6), target_height=300, grid_swatch_width=20,
+                        grid_spacing=2)
+
+
+def test_frequency_bars_return_colours_and_frequencies(analysed_image):
+    bars = analysed_image.create_color_frequency_bars(width=50, save=False)
+    assert isinstance(bars, list)
+    assert all(isinstance(colour, tuple) and isinstance(count, int) for colour, count in bars)
+    assert list(dict(bars).items()) == bars
+
+
+def test_grid_returns_colours_by_frequency(analysed_image):
+    bars = analysed_image.create_color_frequency_bars(width=50, save=False)
+    grid = analysed_image.create_color_grid(save=False, grid=5)
+    assert grid == [colour for colour, _ in sorted(bars, key=lambda item: item[1], reverse=True)]
+
+
+@pytest.mark.parametrize('target_height', [1, 120, 300, 5000])
+def test_frequency_bars_of_any_height_match_an_analysis_at_that_height(analysed_image, target_height):
+    bars = analysed_image.create_color_frequency_bars(width=50, save=False, target_height=target_height)
+    assert analysed_image.color_frequency_bars.size == (50, target_height)
+
+    expected_image = AnalyseImage(create_noise_image(40, 30, levels=6), target_height=target_height)
+    assert bars == expected_image.create_color_frequency_bars(width=50, save=False)
+    assert analysed_image.color_frequency_bars.tobytes() == expected_image.color_frequency_bars.tobytes()
+
+
+def list_graphics(directory):
+    return sorted(path.name for path in directory.rglob('*') if path.is_file())
+
+
+def test_webp_graphics_too_large_are_refused_before_rendering(tmp_path):
+    analysed_image = AnalyseImage(create_noise_image(40, 30, levels=6), target_height=300,
+                                  results_directory=str(tmp_path))
+    with pytest.raises(ValueError, match='WebP'):
+        analysed_image.create_color_frequency_bars(width=20, target_height=20000, output_format='webp')
+    # the size of frequency bars is known before the image is analysed
+    assert [record['name'] for record in analysed_image.instrumentation.records] == ['create_color_frequency_bars']
+    with pytest.raises(ValueError, match='WebP'):
+        analysed_image.create_color_grid(grid=5, arg_swatch_width=4000, arg_grid_spacing=2, output_format='webp')
+    assert (analysed_image.color_frequency_bars, analysed_image.color_grid) == (None, None)
+    assert list_graphics(tmp_path) == []
+
+    analysed_image.create_color_frequency_bars(width=20, output_format='webp_lossless')
+    graphic, = tmp_path.rglob('*.webp')
+    with Image.open(graphic) as saved:
+        assert saved.format == 'WEBP'
+        assert saved.convert('RGB').tobytes() == analysed_image.color_frequency_bars.tobytes()
+
+
+def test_basic_selection_saves_bars_too_tall_for_webp_as_png(tmp_path):
+    analysed_image = AnalyseImage(create_noise_image(12, 8, levels=2), target_height=WEBP_MAX_SIZE + 1,
+                                  grid_swatch_width=20, grid_spacing=2, use_cache=False,
+                                  results_directory=str(tmp_path))
+    analysed_image.create_basic_selection(grid_spacing=2, swatch_width=20, output_format='webp', compress_level=0)
+    graphics = list_graphics(tmp_path)
+    bars = [name for name in graphics if 'color_frequency_bars' in name]
+    assert len(bars) == 3 and all(name.endswith('.png') for name in bars)
+    assert len(graphics) > 3 and all(name.endswith('.webp') for name in graphics if name not in bars)
+
+
+def test_palette_graphics_keep_every_pixel(tmp_path):
+    analysed_image = AnalyseImage(create_noise_image(40, 30, levels=4), target_height=300, grid_swatch_width=20,
+                                  grid_spacing=2, results_directory=str(tmp_path))
+    analysed_image.create_color_frequency_bars(width=20, palette=True)
+    analysed_image.create_color_grid(grid=5, palette=True)
+    graphics = {path.name: path for path in tmp_path.rglob('*.png')}
+    assert len(graphics) == 2
+
+    for name, graphic in graphics.items():
+        expected = analysed_image.color_frequency_bars if 'bars' in name else analysed_image.color_grid
+        with Image.open(graphic) as saved:
+            assert saved.mode == 'P'
+            assert saved.convert('RGB').tobytes() == expected.tobytes()
+
+
+def test_compress_levels_keep_every_pixel(tmp_path):
+    sizes = {}
+    for compress_level in (0, 9):
+        directory = tmp_path / str(compress_level)
+        analysed_image = AnalyseImage(create_noise_image(40, 30, levels=6), target_height=300,
+                                      results_directory=str(directory))
+        analysed_image.create_color_frequency_bars(width=50, compress_level=compress_level)
+        graphic, = directory.rglob('*.png')
+        with Image.open(graphic) as saved:
+            assert saved.tobytes() == analysed_image.color_frequency_bars.tobytes()
+        sizes[compress_level] = graphic.stat().st_size
+    assert sizes[9] < sizes[0]
+
+    with pytest.raises(ValueError):
+        analysed_image.create_color_frequency_bars(width=50, compress_level=10)
+
+
+def create_selection(directory, **options):
+    analysed_image = AnalyseImage(create_noise_image(12, 8, levels=3), target_height=300, use_cache=False,
+                                  results_directory=str(directory))
+    results = analysed_image.create_basic_selection(grid_spacing=2, swatch_width=20, compress_level=1, **options)
+    if options.get('concurrent'):
+        results = [future.result(timeout=60) for future in results]
+    graphics = {path.name: path.read_bytes() for path in directory.rglob('*') if path.is_file()}
+    names = sorted(record['name'] for record in analysed_image.instrumentation.records
+                   if record['kind'] == 'graphic')
+    return analysed_image, results, graphics, names
+
+
+@pytest.mark.parametrize('start_methods', [None, ['spawn']])
+def test_concurrent_selections_match_serial_selections(tmp_path, monkeypatch, start_methods):
+    _, serial_results, serial_graphics, serial_names = create_selection(tmp_path / 'serial')
+    if start_methods is not None:
+        # where processes cannot be forked the graphics are created in threads
+        monkeypatch.setattr('main.multiprocessing.get_all_start_methods', lambda: start_methods)
+    analysed_image, results, graphics, names = create_selection(tmp_path / 'concurrent', concurrent=True,
+                                                                max_workers=2)
+
+    # the second graphic is of the bars in a random order
+    assert results[:1] + results[2:] == serial_results[:1] + serial_results[2:]
+    assert sorted(results[1]) == sorted(serial_results[1])
+    assert graphics.keys() == serial_graphics.keys()
+    assert {name: data for name, data in graphics.items() if 'randomFalse' in name} == \
+        {name: data for name, data in serial_graphics.items() if 'randomFalse' in name}
+    assert names == serial_names
+
+    # graphics created in threads are set on the object, those created in forked processes are not
+    graphic_set = analysed_image.color_frequency_bars is not None
+    assert graphic_set == (start_methods is not None)
+
+
+def test_sampling_errors_shrink_as_more_pixels_are_sampled():
+    image = create_noise_image(80, 60, levels=3)
+    errors = [AnalyseImage(image, target_height=300, sample_rate=sample_rate).get_sampling_error()
+              for sample_rate in (0.02, 0.1, 0.4, 1)]
+    assert [error['sample_rate'] for error in errors] == [0.02, 0.1, 0.4, 1]
+    assert errors[-1]['pixels_sampled'] == 80 * 60
+    for name in ('mean_relative_error', 'max_relative_error', 'max_bar_height_error'):
+        values = [error[name] for error in errors]
+        assert values[0] > values[1] > values[2] > values[3] == 0
+
+
+def get_stages(analysed_image):
+    return [record['name'] for record in analysed_image.instrumentation.records if record['kind'] == 'stage']
+
+
+def test_frequency_bars_only_calculate_the_stages_they_need():
+    analysed_image = AnalyseImage(create_noise_image(40, 30, levels=6), target_height=300)
+    analysed_image.create_color_frequency_bars(width=20, save=False)
+    stages = get_stages(analysed_image)
+    assert stages == ['colors', 'palette', 'refinement_index', 'reduced_colors']
+    assert not {'color_suggestions', 'grid_max_size', 'grid_extended_max_size', 'is_greyscale'} & set(stages)
+
+    analysed_image.create_color_frequency_bars(width=20, save=False, ordered=True)
+    assert get_stages(analysed_image) == stages
+
+
+def test_prepare_calculates_the_dependencies_of_a_stage_first():
+    analysed_image = AnalyseImage(create_noise_image(40, 30, levels=6), target_height=300)
+    analysed_image.prepare('multiplier')
+    records = [record for record in analysed_image.instrumentation.records if record['kind'] == 'stage']
+    assert [record['name'] for record in records] == ['colors', 'palette', 'refinement_index', 'multiplier']
+    # each stage is calculated by prepare itself, rather than nested within the stage needing it
+    assert [record['parent'] for record in records] == [None] * 4
+
+    analysed_image.prepare('multiplier', 'reduced_colors')
+    assert get_stages(analysed_image) == ['colors', 'palette', 'refinement_index', 'multiplier', 'reduced_colors']
+    with pytest.raises(ValueError):
+        analysed_image.prepare('unknown')
@@ -0,0 +1,50 @@
+import colorsys
+import numpy as np
+import pytest
+from colorspace import rgb_to_hls, hls_to_rgb, rgb_to_hsv, hsv_to_rgb
+from histogram import ColorHistogram
+from ordering import get_hls_ranks, order_by_ranks
+from benchmarks.ordering_benchmark import sort_colors_by_hsl
+
+RNG = np.random.default_rng(0)
+# random colors, greys and colors sharing their maximum channel, which take the branches of the hue calculation
+COLORS = [tuple(color) for color in RNG.integers(0, 256, (5000, 3)).tolist()] + \
+         [(value, value, value) for value in range(0, 256, 5)] + \
+         [(255, 255, 0), (255, 0, 255), (0, 255, 255), (255, 0, 0), (0, 255, 0), (0, 0, 255), (128, 128, 0)]
+CHANNELS = RNG.random((3, 2000))
+
+
+def ordered_by_ranks(colors):
+    indices = list(range(len(colors)))
+    return [colors[index] for index in order_by_ranks(indices, get_hls_ranks(colors))]
+
+
+def test_ranks_order_colors_as_colorsys_sorts():
+    assert ordered_by_ranks(COLORS) == sort_colors_by_hsl(COLORS)
+
+
+def test_ranks_keep_the_order_of_duplicates():
+    colors = [(10, 200, 30, 1), (0, 0, 0, 2), (10, 200, 30, 3), (40, 40, 40, 4)]
+    assert ordered_by_ranks(colors) == [(0, 0, 0, 2), (40, 40, 40, 4), (10, 200, 30, 1), (10, 200, 30, 3)]
+
+
+def test_ranks_of_a_histogram_match_a_list():
+    histogram = ColorHistogram.from_dict({color: index + 1 for index, color in enumerate(COLORS[:500])})
+    assert np.array_equal(get_hls_ranks(histogram), get_hls_ranks(histogram.colors()))
+
+
+def test_empty_colors_have_no_ranks():
+    assert len(get_hls_ranks([])) == 0
+
+
+@pytest.mark.parametrize('array_function, colorsys_function', [
+    (rgb_to_hls, colorsys.rgb_to_hls),
+    (hls_to_rgb, colorsys.hls_to_rgb),
+    (rgb_to_hsv, colorsys.rgb_to_hsv),
+    (hsv_to_rgb, colorsys.hsv_to_rgb),
+])
+def test_conversions_match_colorsys(array_function, colorsys_function):
+    channels = np.concatenate((CHANNELS, np.array(COLORS, dtype=np.float64).T / 255.0), axis=1)
+    converted = np.stack(array_function(*channels), axis=1)
+    expected = [list(colorsys_function(*values)) for values in channels.T.tolist()]
+    assert converted.tolist() == expected
@@ -0,0 +1,86 @@
+import math
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import pytest
+from PIL import Image
+from main import AnalyseImage
+from pyramid import save_deep_zoom, get_level_sizes, get_tile_box, read_region
+from benchmarks.histogram_benchmark import create_noise_image
+
+
+@pytest.mark.parametrize('width, height', [(1, 1), (2, 1), (254, 254), (255, 3), (1000, 600), (2000, 60001)])
+def test_level_sizes_halve_down_to_one_pixel(width, height):
+    levels = get_level_sizes(width, height)
+    assert levels[0] == (1, 1)
+    assert levels[-1] == (width, height)
+    for level in range(len(levels) - 1):
+        assert levels[level] == (math.ceil(levels[level + 1][0] / 2), math.ceil(levels[level + 1][1] / 2))
+    # the first level larger than 1x1 pixels follows it, so no level is repeated
+    assert len(levels) == 1 or levels[1] != (1, 1)
+
+
+def test_tile_boxes_cover_a_level_with_their_overlap():
+    covered = np.zeros((50, 70), dtype=np.int64)
+    for row in range(math.ceil(50 / 16)):
+        for column in range(math.ceil(70 / 16)):
+            left, top, right, bottom = get_tile_box(column, row, 70, 50, 16, 1)
+            assert (left, top) == (max(column * 16 - 1, 0), max(row * 16 - 1, 0))
+            assert (right, bottom) == (min(column * 16 + 17, 70), min(row * 16 + 17, 50))
+            covered[row * 16:(row + 1) * 16, column * 16:(column + 1) * 16] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize('width, height', [(70, 50), (33, 1), (16, 16), (1, 1)])
+def test_every_level_is_the_graphic_reduced(tmp_path, width, height):
+    graphic = create_noise_image(width, height)
+    path = str(tmp_path / 'graphic')
+    descriptor = save_deep_zoom(lambda box: graphic.crop(box), width, height, path, tile_size=16, overlap=1)
+
+    root = ElementTree.parse(descriptor).getroot()
+    assert (root.get('Format'), root.get('TileSize'), root.get('Overlap')) == ('png', '16', '1')
+    size = root.find('{http://schemas.microsoft.com/deepzoom/2008}Size')
+    assert (size.get('Width'), size.get('Height')) == (str(width), str(height))
+
+    levels = get_level_sizes(width, height)
+    expected = graphic
+    for level in range(len(levels) - 1, -1, -1):
+        assert expected.size == levels[level]
+        region = read_region(path + '_files', level, levels[level], (0, 0) + levels[level], 'png', 16, 1)
+        assert region.tobytes() == expected.tobytes()
+        expected = expected.reduce(2)
+
+
+def test_pyramids_need_a_graphic():
+    with pytest.raises(ValueError):
+        save_deep_zoom(lambda box: Image.new('RGB', (1, 1)), 0, 10, 'empty')
+
+
+def read_tiled_graphic(directory):
+    descriptor, = directory.rglob('*.dzi')
+    path = str(descriptor)[:-len('.dzi')]
+    root = ElementTree.parse(descriptor).getroot()
+    size = root.find('{http://schemas.microsoft.com/deepzoom/2008}Size')
+    width, height = int(size.get('Width')), int(size.get('Height'))
+    levels = get_level_sizes(width, height)
+    return read_region(path + '_files', len(levels) - 1, (width, height), (0, 0, width, height), 'png', 254, 1)
+
+
+@pytest.mark.parametrize('graphic', ['color_frequency_bars', 'color_grid', 'color_suggestions_grid'])
+def test_tiled_graphics_match_whole_graphics(tmp_path, graphic):
+    source = create_noise_image(60, 45, levels=8)
+    options = {'ordered': True, 'save': True}
+    if graphic != 'color_frequency_bars':
+        options.update(grid=12, arg_swatch_width=30, arg_grid_spacing=4)
+
+    tiled_directory = tmp_path / 'tiled'
+    tiled_image = AnalyseImage(source, target_height=600, results_directory=str(tiled_directory))
+    getattr(tiled_image, 'create_{}'.format(graphic))(tiled=True, **options)
+    whole_image = AnalyseImage(source, target_height=600, results_directory=str(tmp_path / 'whole'))
+    getattr(whole_image, 'create_{}'.format(graphic))(**options)
+
+    assert read_tiled_graphic(tiled_directory).tobytes() == getattr(whole_image, graphic).tobytes()
+
+
+def test_tiled_graphics_are_saved():
+    with pytest.raises(ValueError):
+        AnalyseImage(create_noise_image(8, 8)).create_color_frequency_bars(tiled=True)
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pytest
+from histogram import ColorHistogram, parse_pixels
+from main import AnalyseImage
+from quantization import quantize_colors, get_bit_labels, QUANTIZATION_METHODS
+from benchmarks.histogram_benchmark import create_noise_image
+
+
+@pytest.fixture(scope='module')
+def noise_colors():
+    return parse_pixels(create_noise_image(60, 40, levels=32, seed=3))
+
+
+@pytest.mark.parametrize('method', QUANTIZATION_METHODS)
+@pytest.mark.parametrize('palette_size', [1, 7, 64])
+def test_palettes_keep_every_pixel_within_the_palette_size(noise_colors, method, palette_size):
+    palette = quantize_colors(noise_colors, method, palette_size=palette_size, bits=2)
+    if method == 'bits':
+        # each channel keeps 2 bits, so there are at most 4 ** bands palette colors whatever the palette size
+        assert len(palette) <= 4 ** noise_colors.bands
+    else:
+        assert 1 <= len(palette) <= palette_size
+    assert palette.counts.sum() == noise_colors.counts.sum()
+    assert len(set(palette.colors())) == len(palette)
+
+    channels, palette_channels = noise_colors.channels(), palette.channels()
+    assert (palette_channels >= channels.min(axis=0)).all() and (palette_channels <= channels.max(axis=0)).all()
+
+
+def test_bits_merge_colors_of_the_same_cell_into_their_weighted_mean():
+    colors = ColorHistogram.from_dict({(0, 0, 0): 3, (0, 0, 63): 1, (255, 255, 255): 2, (64, 0, 0): 5})
+    palette = quantize_colors(colors, 'bits', bits=2)
+    # (0, 0, 16) is the weighted mean of the first two colors, and palette colors are ordered by first appearance
+    assert palette.items() == [((0, 0, 16), 4), ((255, 255, 255), 2), ((64, 0, 0), 5)]
+    assert len(np.unique(get_bit_labels(colors.channels(), 8))) == 4
+
+
+def test_median_cut_keeps_colors_when_the_palette_is_large_enough(noise_colors):
+    few_colors = noise_colors.take(list(range(20)))
+    for method in ('median_cut', 'kmeans'):
+        palette = quantize_colors(few_colors, method, palette_size=256)
+        assert palette.items() == few_colors.items()
+
+
+def test_kmeans_moves_colors_to_their_nearest_mean():
+    colors = ColorHistogram.from_dict({(0, 0, 0): 1, (10, 0, 0): 1, (20, 0, 0): 1, (200, 0, 0): 1, (255, 0, 0): 9})
+    assert quantize_colors(colors, 'kmeans', palette_size=2).items() == [((10, 0, 0), 3), ((250, 0, 0), 10)]
+
+
+def test_invalid_options_are_refused(noise_colors):
+    with pytest.raises(ValueError):
+        quantize_colors(noise_colors, 'octree')
+    with pytest.raises(ValueError):
+        quantize_colors(noise_colors, 'bits', bits=0)
+    with pytest.raises(ValueError):
+        quantize_colors(ColorHistogram.from_dict({(0, 0, 256): 1}))
+
+
+def test_quantize_options_are_part_of_the_cache_key(work_directory):
+    create_noise_image(20, 15, levels=16).save(os.path.join('source', 'noise.png'))
+    cache_directory = str(work_directory / 'cache')
+    options = [{'quantize': 'median_cut', 'palette_size': 8}, {'quantize': 'median_cut', 'palette_size': 4},
+               {'quantize': 'kmeans', 'palette_size': 8}, {'quantize': 'bits', 'quantize_bits': 3},
+               {'quantize': 'bits', 'quantize_bits': 2}, {}]
+    palettes = []
+    for quantize_options in options:
+        analysed_image = AnalyseImage('noise.png', target_height=300, cache_directory=cache_directory,
+                                      **quantize_options)
+        analysed_image.prepare('palette')
+        palettes.append(analysed_image.create_color_grid(save=False, extra_large=True, grid=2))
+    # the unquantized palette is the colors of the image, which are not cached again
+    assert len(os.listdir(os.path.join(cache_directory, 'im_palette'))) == len(options) - 1
+    assert len({tuple(palette) for palette in palettes}) == len(options)
+
+    # the palette size does not change the bits method, so its palette is read from the cache
+    analysed_image = AnalyseImage('noise.png', target_height=300, cache_directory=cache_directory, quantize='bits',
+                                  quantize_bits=3, palette_size=8)
+    analysed_image.prepare('palette')
+    assert len(os.listdir(os.path.join(cache_directory, 'im_palette'))) == len(options) - 1
+    assert [record['cache'] for record in analysed_image.instrumentation.records
+            if record['name'] == 'palette'] == ['hit']
+    assert analysed_image.create_color_grid(save=False, extra_large=True, grid=2) == palettes[3]
@@ -0,0 +1,36 @@
+import math
+import pytest
+from refinement import refine_color_data, RefinementIndex, get_graphic_height
+from benchmarks.refinement_benchmark import refine_color_data_loop, create_color_data
+
+COLORS = create_color_data(1500)
+
+
+def get_specific_value(colors, target_height):
+    return math.ceil(sum(colors.values()) / target_height)
+
+
+@pytest.mark.parametrize('target_height', [50, 600, 3000, 20000])
+def test_refine_color_data_matches_multiplier_loop(target_height):
+    specific_value = get_specific_value(COLORS, target_height)
+    loop_colors, loop_multiplier = refine_color_data_loop(COLORS, specific_value, target_height)
+    reduced_colors, multiplier = refine_color_data(COLORS, specific_value, target_height)
+    assert multiplier == loop_multiplier
+    assert reduced_colors.items() == list(loop_colors.items())
+
+
+def test_refinement_index_answers_every_height():
+    index = RefinementIndex(COLORS)
+    for target_height in (20000, 50, 3000, 600, 1500, 7):
+        specific_value = get_specific_value(COLORS, target_height)
+        reduced_colors, multiplier = index.refine(specific_value, target_height)
+        expected_colors, expected_multiplier = refine_color_data_loop(COLORS, specific_value, target_height)
+        assert multiplier == expected_multiplier
+        assert reduced_colors.items() == list(expected_colors.items())
+
+
+def test_refined_height_fills_target():
+    index = RefinementIndex(COLORS)
+    specific_value = get_specific_value(COLORS, 3000)
+    multiplier = index.get_multiplier(specific_value, 3000)
+    assert get_graphic_height(index.sorted_values, specific_value, multiplier) >= 3000
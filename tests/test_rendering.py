@@ -0,0 +1,103 @@
+import random
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from rendering import render_grid, draw_grid, get_grid_cells
+
+
+def draw_grid_loop(colors, grid, swatch_width, grid_spacing, length, background=(0, 0, 0), text_color=None):
+    """The grid drawing loop render_grid replaced, which draws every swatch and label through ImageDraw"""
+    grid_graphic = Image.new("RGB", (length, length), color=background)
+    draw = ImageDraw.Draw(grid_graphic)
+    x = 0
+    y = grid_spacing
+    count = 0
+    for color in colors:
+        x += grid_spacing
+        draw.rectangle([(x, y), (x + swatch_width, y + swatch_width)], fill='rgb' + str(color[:3]))
+        if text_color is not None:
+            draw.text((x + 5, y + 5), str(color[:3]), fill=text_color(color[:3]))
+        x += swatch_width
+        count += 1
+        if count >= grid:
+            count = 0
+            x = 0
+            y += (swatch_width + grid_spacing)
+    return grid_graphic
+
+
+def choose_text_color(color):
+    luminance = (0.2126 * color[0]) + (0.7152 * color[1]) + (0.0722 * color[2])
+    return (0, 0, 0) if luminance > 150 else (255, 255, 255)
+
+
+def create_colors(count, seed=0):
+    rng = random.Random(seed)
+    return [(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.randrange(1, 100)) for _ in range(count)]
+
+
+def get_length(grid, swatch_width, grid_spacing):
+    return grid * swatch_width + (grid + 1) * grid_spacing
+
+
+# (number of colors, grid, swatch width, grid spacing, labels)
+GRIDS = [
+    (25, 5, 80, 10, True),
+    (23, 5, 80, 10, True),
+    (30, 6, 40, 0, True),
+    (12, 4, 8, 3, True),
+    (40, 7, 20, 2, False),
+    (9, 3, 15, 0, False),
+    (0, 4, 20, 2, True),
+]
+
+
+@pytest.mark.parametrize('count, grid, swatch_width, grid_spacing, text', GRIDS)
+def test_render_grid_matches_drawing_loop(count, grid, swatch_width, grid_spacing, text):
+    colors = create_colors(count)
+    text_color = choose_text_color if text else None
+    length = get_length(grid, swatch_width, grid_spacing)
+    expected = draw_grid_loop(colors, grid, swatch_width, grid_spacing, length, text_color=text_color)
+    for render in (render_grid, draw_grid):
+        graphic = render(colors, grid, swatch_width, grid_spacing, length, text_color=text_color)
+        assert np.array_equal(np.asarray(graphic), np.asarray(expected))
+
+
+def test_render_grid_cuts_off_at_the_maximum_length():
+    colors = create_colors(36)
+    length = get_length(6, 80, 10) - 137
+    expected = draw_grid_loop(colors, 6, 80, 10, length, background=(12, 34, 56), text_color=choose_text_color)
+    graphic = render_grid(colors, 6, 80, 10, length, background=(12, 34, 56), text_color=choose_text_color)
+    assert np.array_equal(np.asarray(graphic), np.asarray(expected))
+
+
+@pytest.mark.parametrize('count, grid, swatch_width, grid_spacing, text', GRIDS[:5])
+def test_render_grid_regions_match_crops_of_the_whole_graphic(count, grid, swatch_width, grid_spacing, text):
+    colors = create_colors(count, seed=1)
+    text_color = choose_text_color if text else None
+    length = get_length(grid, swatch_width, grid_spacing)
+    whole = render_grid(colors, grid, swatch_width, grid_spacing, length, text_color=text_color)
+    rng = random.Random(2)
+    regions = [(0, 0, length, length), (0, 0, 64, 64), (length - 50, length - 50, length + 30, length + 30)]
+    for _ in range(20):
+        left, top = rng.randrange(length), rng.randrange(length)
+        regions.append((left, top, left + rng.randrange(1, 120), top + rng.randrange(1, 120)))
+
+    for region in regions:
+        expected = np.asarray(whole.crop((region[0], region[1], min(region[2], length), min(region[3], length))))
+        for render in (render_grid, draw_grid):
+            graphic = render(colors, grid, swatch_width, grid_spacing, length, text_color=text_color, region=region)
+            assert np.array_equal(np.asarray(graphic), expected), region
+
+
+def test_grid_cells_include_every_swatch_in_a_region():
+    colors = create_colors(50)
+    length = get_length(10, 20, 2)
+    for region in [(0, 0, length, length), (30, 30, 70, 70), (200, 0, length, 10), (5, 5, 6, 6)]:
+        cells = get_grid_cells(len(colors), 10, 20, 2, region, False)
+        left, top, right, bottom = region
+        for index in range(len(colors)):
+            row, column = divmod(index, 10)
+            x, y = 2 + column * 22, 2 + row * 22
+            overlaps = x < right and x + 21 > left and y < bottom and y + 21 > top
+            assert (index in cells) == overlaps, (region, index)
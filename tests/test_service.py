@@ -0,0 +1,146 @@
+import io
+import os
+import json
+import signal
+import asyncio
+import multiprocessing
+import pytest
+from PIL import Image
+from service import AnalysisService, ServiceError
+from benchmarks.histogram_benchmark import create_noise_image
+
+BARS = '/graphics/color_frequency_bars?width=20&target_height=300'
+GRID = '/graphics/color_grid?grid=5&grid_swatch_width=20&grid_spacing=2'
+
+
+@pytest.fixture
+def source_image(work_directory):
+    create_noise_image(16, 12, levels=4).save(os.path.join('source', 'noise.png'))
+    return 'noise.png'
+
+
+def run_with_service(function, **options):
+    """Runs a coroutine function with a started service and the port it listens on, closing the service after"""
+    async def run():
+        service = AnalysisService(**{'workers': 1, 'use_cache': False, **options})
+        server = await service.start(port=0)
+        try:
+            return await function(service, server.sockets[0].getsockname()[1])
+        finally:
+            await service.close()
+    return asyncio.run(run())
+
+
+async def request(port, method, target, body=b''):
+    """Sends an HTTP request and reads the whole answer, returning its status, headers and body"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write('{} {} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n'
+                 .format(method, target, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+
+    head, _, content = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:])}
+    return int(lines[0].split(' ')[1]), headers, content
+
+
+def test_graphics_are_created_and_kept_in_memory(source_image):
+    async def check(service, port):
+        status, headers, content = await request(port, 'GET', GRID + '&source=' + source_image)
+        assert (status, headers['content-type'], headers['x-cache']) == (200, 'image/png', 'miss')
+        assert Image.open(io.BytesIO(content)).size == (5 * 20 + 6 * 2,) * 2
+
+        status, headers, cached_content = await request(port, 'GET', GRID + '&source=' + source_image)
+        assert (status, headers['x-cache'], cached_content) == (200, 'hit', content)
+
+        with open(os.path.join('source', source_image), 'rb') as infile:
+            status, headers, posted_content = await request(port, 'POST', GRID, infile.read())
+        # an upload of the same file has the same contents hash, so it is answered with the same graphic
+        assert (status, headers['x-cache'], posted_content) == (200, 'hit', content)
+
+        status, headers, content = await request(port, 'GET', '/health')
+        stats = json.loads(content)
+        assert (status, stats['requests'], stats['hits'], stats['created']) == (200, 3, 2, 1)
+    run_with_service(check)
+
+
+def test_webp_bars_of_a_fitting_height_are_created(source_image):
+    async def check(service, port):
+        target = '/graphics/color_frequency_bars?width=20&target_height=10000&output_format=webp&source='
+        status, headers, content = await request(port, 'GET', target + source_image)
+        assert (status, headers['content-type']) == (200, 'image/webp')
+        assert Image.open(io.BytesIO(content)).size == (20, 10000)
+
+        status, _, content = await request(port, 'GET', target.replace('10000', '20000') + source_image)
+        assert status == 400 and b'WebP' in content
+    run_with_service(check)
+
+
+def test_identical_requests_share_a_graphic(source_image):
+    async def check(service, port):
+        answers = await asyncio.gather(*[service.get_graphic('color_frequency_bars', source=source_image,
+                                                             options={'width': '20', 'target_height': '300'})
+                                         for _ in range(3)])
+        assert sorted(outcome for _, _, outcome in answers) == ['coalesced', 'coalesced', 'miss']
+        assert len({data for _, data, _ in answers}) == 1
+        assert service.stats()['created'] == 1
+    run_with_service(check)
+
+
+def test_requests_over_the_limits_are_refused(source_image):
+    async def check(service, port):
+        answers = await asyncio.gather(request(port, 'GET', BARS + '&source=' + source_image),
+                                       request(port, 'GET', GRID + '&source=' + source_image))
+        assert sorted(status for status, _, _ in answers) == [200, 503]
+        assert [headers['retry-after'] for status, headers, _ in answers if status == 503] == ['1']
+
+        status, _, _ = await request(port, 'POST', GRID, b'x' * 2000)
+        assert status == 413
+    run_with_service(check, max_pending=1, max_body_size=1000)
+
+
+@pytest.mark.parametrize('method, target, body, expected_status', [
+    ('GET', '/unknown', b'', 404),
+    ('GET', '/graphics/unknown?source=noise.png', b'', 404),
+    ('GET', '/graphics/color_grid?source=missing.png', b'', 404),
+    ('GET', '/graphics/color_grid?source=../noise.png', b'', 404),
+    ('GET', '/graphics/color_grid', b'', 400),
+    ('GET', '/graphics/color_grid?source=noise.png&unknown=1', b'', 400),
+    ('GET', '/graphics/color_grid?source=noise.png&grid=many', b'', 400),
+    ('GET', '/graphics/color_grid?source=noise.png&output_format=gif', b'', 400),
+    ('POST', '/graphics/color_grid', b'not an image', 400),
+    ('POST', '/health', b'', 405),
+    ('DELETE', '/graphics/color_grid', b'', 405),
+])
+def test_invalid_requests_are_answered_with_errors(source_image, method, target, body, expected_status):
+    async def check(service, port):
+        status, headers, content = await request(port, method, target, body)
+        assert (status, headers['content-type']) == (expected_status, 'application/json')
+        assert json.loads(content)['error']
+    run_with_service(check)
+
+
+def test_graphics_are_created_after_a_worker_process_dies(source_image):
+    async def check(service, port):
+        status, _, _ = await request(port, 'GET', BARS + '&source=' + source_image)
+        assert status == 200
+        for worker in multiprocessing.active_children():
+            os.kill(worker.pid, signal.SIGKILL)
+            worker.join()
+
+        # the pool breaks either before the next graphic is submitted or while it is being created
+        status, _, _ = await request(port, 'GET', GRID + '&source=' + source_image)
+        assert status in (200, 500)
+        status, _, _ = await request(port, 'GET', GRID + '&grid=4&source=' + source_image)
+        assert status == 200
+    run_with_service(check)
+
+
+def test_get_graphic_reports_errors_with_a_status(source_image):
+    async def check(service, port):
+        with pytest.raises(ServiceError) as error:
+            await service.get_graphic('color_grid')
+        assert error.value.status == 400
+    run_with_service(check)
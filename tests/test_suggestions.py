@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from histogram import get_top_indices
+from suggestions import suggestions_algorithm, get_ideas, get_frequency_weightings, update_weighting, WEIGHTING_TABLE
+from benchmarks.weighting_benchmark import (get_ideas_loop, get_ideas_dictionary, add_colour_to_dictionary,
+                                            create_color_data)
+
+
+def add_colour_times(count):
+    """Returns the weighting of a colour added to a dictionary count times, as the original get_ideas did"""
+    data = {}
+    for _ in range(count):
+        add_colour_to_dictionary(data, 'colour')
+    return data['colour']
+
+
+def test_weighting_table_matches_repeated_additions():
+    for count in list(range(1, 50)) + [len(WEIGHTING_TABLE) - 1, len(WEIGHTING_TABLE), len(WEIGHTING_TABLE) + 25]:
+        assert get_frequency_weightings([count])[0] == add_colour_times(count)
+
+
+def test_weighting_table_ends_at_fixed_point():
+    assert update_weighting(WEIGHTING_TABLE[-1]) == WEIGHTING_TABLE[-1]
+
+
+def test_get_ideas_matches_per_pixel_loop():
+    colors = create_color_data(600)
+    assert list(get_ideas_dictionary(colors).items()) == list(get_ideas_loop(colors.items()).items())
+
+
+def test_get_ideas_of_no_colours_is_white():
+    colours, weightings = get_ideas({})
+    assert colours.tolist() == [[255, 255, 255]]
+    assert weightings.tolist() == [0.2]
+
+
+def test_get_ideas_skips_colours_never_seen():
+    colours, _ = get_ideas({(1, 2, 3): 0, (4, 5, 6): 2})
+    assert np.array_equal(colours, [[4, 5, 6]])
+
+
+def test_top_indices_match_stable_sort():
+    values = np.random.default_rng(2).integers(0, 20, size=500)
+    order = np.argsort(-values, kind='stable')
+    for number in (0, 1, 19, 250, 500, 600):
+        assert get_top_indices(values, number).tolist() == order[:number].tolist()
+
+
+def test_suggestions_algorithm_matches_full_sorts():
+    # the reference shares its color data with the harmony benchmark, which imports colorharmonies
+    pytest.importorskip('colorharmonies')
+    from benchmarks.selection_benchmark import suggestions_algorithm_sorted
+
+    colors = create_color_data(300)
+    for number_requested in (1, 50, 2500):
+        assert suggestions_algorithm(colors, number_requested) == \
+            suggestions_algorithm_sorted(colors, number_requested)